@@ -34,6 +34,7 @@ def parse_args(argv=sys.argv[1:]) -> argparse.Namespace:
 
   sub = p.add_subparsers(required=True, title='commands', dest='action', help='Various sub-commands')
   p.add_argument('-C', '--no_color', action='store_true', default=False, help="Don't include color in the output.")
+  p.add_argument('-T', '--trace',    action='store_true', default=False, help='Summarize the database round trips made, on stderr (or set WORN_TRACE=1).')
   ui = sub.add_parser('gui', help='Show the gui', formatter_class=argparse.ArgumentDefaultsHelpFormatter)
 
   beg = sub.add_parser('start', help='Start a project', formatter_class=argparse.ArgumentDefaultsHelpFormatter)
@@ -86,6 +87,7 @@ def parse_args(argv=sys.argv[1:]) -> argparse.Namespace:
   rep.add_argument('-f', '--format',        type=str,       choices='simple,csv,time'.split(','),                              default='simple',                       help='Output the report in this format.')
   rep.add_argument('-c', '--comment',       type=str,        nargs='+',                                                        default='Time spent on {project.name}', help='Comment to make in tickets when reporting to a ticket.')
   rep.add_argument('-H', '--no_header',     action='store_true',                                                               default=False,                          help="Don't display the header in the output.")
+  rep.add_argument('-T', '--totals',        action='store_true',                                                               default=False,                          help='Have the server sum up the totals instead of reading every log entry.')
   rep.add_argument('-N', '--NOOP'     ,     action='store_true',                                                               default=False,                          help="Don't include color in the output.")
 
   prep = rep.add_mutually_exclusive_group(required=False)
@@ -100,11 +102,33 @@ def parse_args(argv=sys.argv[1:]) -> argparse.Namespace:
   rrep.add_argument('-t', '--ticket',       type=int,                                                                          default=None,                           help='Document the report to this ticket.')
   rrep.add_argument('-m', '--mailto',       type=email,                                                                        default=None,                           help='Email the report to this user.')
 
+  mig = sub.add_parser('migrate', help='Bring the database up to the current schema version.', formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+  mig.add_argument('-b', '--batch_size', type=int, default=lib.db.PAGE_SIZE, help='Move this many fields per write.')
+
+  arc = sub.add_parser('archive', help='Move the logs older than a date off the server and into archive files.', formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+  arc.add_argument('-b', '--before', type=_datetime, metavar='DATETIME', required=True, help='Archive the logs older than this datetime.')
+
+  jrn = sub.add_parser('journal', help='Show the writes journaled while the server was unreachable.', formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+  jrn.add_argument('-r', '--replay', action='store_true', default=False, help='Replay them to the server now.')
+
+  imp = sub.add_parser('import', help='Load log history from CSV, NDJSON or "show logs --raw" files.', formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+  imp.add_argument('-f', '--format',     type=str, choices=lib.db.bulk.FORMATS, default=None,             help='The format of the files, or guess it from their first line.')
+  imp.add_argument('-b', '--batch_size', type=int,                              default=10*lib.db.PAGE_SIZE, help='Add this many log entries per write.')
+  imp.add_argument('file',               type=argparse.FileType('r'), nargs='*', default=[sys.stdin],    help='The files to load, or - for stdin.')
+
+  ver = sub.add_parser('versions', help='Manage the log versions kept by edits.', formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+  versub = ver.add_subparsers(dest='operation', required=False)
+  vgc = versub.add_parser('gc', help='Drop old log versions and the partitions only they point at.', formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+  vgc.add_argument('-k', '--keep',       type=int,                             default=None,             help='Keep the newest N versions whatever their age.')
+  vgc.add_argument('-o', '--older-than', type=_datetime, metavar='DATETIME',   default=None,             help='Only drop the versions created before this datetime.')
+  vgc.add_argument('-b', '--batch_size', type=int,                             default=lib.db.PAGE_SIZE, help='Drop this many versions per write.')
+  vst = versub.add_parser('stats', help='Show the entries and memory usage of the logs and each of its versions.', formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+
   hlp = sub.add_parser('help',     help='show this or other help items and exit.')
   hlpsub = hlp.add_subparsers(dest='kind', title='subcommands', required=False)
   hld = hlpsub.add_parser('dates', help='Display and explain the avilable date formats that can be used by the program.', formatter_class=argparse.ArgumentDefaultsHelpFormatter)
 
-  p.set_defaults(project=[], display=None, kind=None, comment=None, action='help')
+  p.set_defaults(project=[], display=None, operation=None, kind=None, comment=None, action='help')
 
   r = p.parse_args(argv)
   if r.project is not None and isinstance(r.project, list) and len(r.project) > 0 and all(isinstance(p, str) for p in r.project):
@@ -117,4 +141,4 @@ def parse_args(argv=sys.argv[1:]) -> argparse.Namespace:
     r.comment = ' '.join(r.comment).strip()
   debug(r)
 
-  return (p, show, edit, rep, r)
+  return (p, show, edit, rep, ver, r)
@@ -0,0 +1,943 @@
+import os, re, time, heapq
+from configparser import ConfigParser
+from functools import cache
+from fnmatch import fnmatchcase
+from importlib import import_module
+from contextlib import contextmanager
+from typing import Any, Callable, Generator
+from uuid import uuid4, UUID
+from .. import istimestamp_id, debug
+from .backend import Backend, Connection, parse_id, lower_bound, upper_bound
+from . import trace
+
+CONFIG = os.environ.get('WORN_CONFIG', os.path.join(os.path.expanduser('~'), '.config', 'worn', 'worn.conf'))
+
+@cache
+def _parsed(path:str) -> ConfigParser:
+  config = ConfigParser()
+  config.read(path)
+  return config
+
+def settings(section:str) -> dict:
+  '''The [section] of the CONFIG file, empty when there is no such file or section. [worn] holds backend, durability
+  and cache_ttl, and a section named after each backend holds its OPTIONS. The environment overrides all of them.'''
+  config = _parsed(CONFIG)
+  return dict(config[section]) if config.has_section(section) else {}
+
+BACKEND = os.environ.get('WORN_BACKEND', settings('worn').get('backend', 'redis'))
+
+BACKENDS = {
+  'redis':  ('.redis_backend',  'RedisBackend'),
+  'sqlite': ('.sqlite_backend', 'SQLiteBackend'),
+  'memory': ('.memory_backend', 'MemoryBackend'),
+}
+
+DURABILITY = os.environ.get('WORN_DURABILITY', settings('worn').get('durability', 'once-per-command'))
+
+PAGE_SIZE = 500
+
+GROUPS = ('display:console', 'display:tickets', 'display:email')
+
+JOURNAL = os.environ.get('WORN_JOURNAL', settings('worn').get('journal', os.path.join(os.path.expanduser('~'), '.local', 'share', 'worn', 'journal.ndjson')))
+
+ARCHIVE = os.environ.get('WORN_ARCHIVE', settings('worn').get('archive', os.path.join(os.path.expanduser('~'), '.local', 'share', 'worn', 'archive')))
+
+JOURNAL_MODE = os.environ.get('WORN_JOURNAL_MODE', settings('worn').get('journal_mode', 'fallback'))
+
+ENCODING = os.environ.get('WORN_ENCODING', settings('worn').get('encoding', 'plain'))
+
+STATES = {'started': '1', 'stopped': '0'}
+
+CACHE_TTL = float(os.environ.get('WORN_CACHE_TTL', settings('worn').get('cache_ttl', '1.0')))
+
+CACHED = {
+  'projects':       'projects:version',
+  'projects:names': 'projects:version',
+  'handles':        'handles:version',
+  'handles:ids':    'handles:version',
+  'logs:catalog':   'logs:catalog:version',
+}
+
+SCHEMA = {
+  'projects': 'hash',
+  'projects:names': 'hash',
+  'projects:version': 'string',
+  'schema':   'string',
+  'handles':  'hash',
+  'handles:ids': 'hash',
+  'handles:next': 'string',
+  'handles:version': 'string',
+  'logs':     'stream',
+  'logs:catalog': 'hash',
+  'logs:catalog:version': 'string',
+  'logs*:catalog': 'hash',
+  'logs*:????-??': 'stream',
+  'logs*:projects': 'hash',
+  'logs*:project:*': 'stream',
+  'logs-*':   'stream',
+  'versions': 'stream',
+  'begun':    'string',
+  'cache:*':  'hash',
+}
+
+_backend = None
+_writes = 0
+_batch = None
+_streams = set()
+_plans = {}
+_cache = {}
+_touched = set()
+_wrote = False
+_calls = []
+
+def isdurability(policy:str) -> bool:
+  return isinstance(policy, str) and re.search(r'^(none|bgsave|once-per-command|every-[1-9]\d*-writes)$', policy) is not None
+
+def configure(*, backend:str=None, durability:str=None, **options) -> None:
+  '''Select the backend, the durability policy and any options of the selected backend (see its OPTIONS).'''
+  assert backend is None or backend in BACKENDS, f"{backend=} should be one of {','.join(BACKENDS)}, but isn't."
+  assert durability is None or isdurability(durability), f"{durability=} should be one of none, bgsave, once-per-command or every-N-writes, but isn't."
+  global BACKEND, DURABILITY, _backend
+
+  if durability is not None:
+    DURABILITY = durability
+
+  if backend is not None and backend != BACKEND:
+    if _backend is not None:
+      _backend.close()
+    BACKEND, _backend = backend, None
+
+  if len(options) > 0:
+    _selected().configure(**options)
+  invalidate()
+
+def _selected() -> Backend:
+  global _backend
+
+  if _backend is None:
+    module, name = BACKENDS[BACKEND]
+    kind = getattr(import_module(module, __name__), name)
+    _backend = kind(**kind.settings(settings(BACKEND)))
+  return _backend
+
+def backend() -> Backend:
+  return _selected()
+
+def connection() -> Connection:
+  return trace.traced(backend().connection())
+
+def raw_connection() -> Connection:
+  return trace.traced(backend().raw_connection())
+
+def reader(*, raw:bool=False) -> Connection:
+  '''A connection for pure reads: the backend's read replica, if it has one, until this process first writes. From
+  then on reads go to the primary too, so a command always reads its own writes.'''
+  if _wrote:
+    return raw_connection() if raw else connection()
+  return trace.traced(backend().read_connection(raw=raw))
+
+def declare(pattern:str, kind:str) -> None:
+  assert isinstance(pattern, str) and len(pattern) > 0, f"{pattern=} should be a non-empty instance of str, but isn't."
+  assert kind in ('hash', 'stream', 'string'), f"{kind=} should be one of hash, stream or string, but isn't."
+  SCHEMA[pattern] = kind
+
+def declared(key:str) -> str | None:
+  if key in SCHEMA:
+    return SCHEMA[key]
+
+  for pattern, kind in SCHEMA.items():
+    if fnmatchcase(key, pattern):
+      return kind
+  return None
+
+def _kind(conn:Connection, key:str) -> str:
+  '''The declared kind of key, falling back to asking the backend for keys outside the SCHEMA.'''
+  return declared(key) or conn.type(key)
+
+def invalidate(key:str=None) -> None:
+  '''Forget the local copy of a CACHED hash, or of all of them.'''
+  if key is None:
+    _cache.clear()
+  else:
+    _cache.pop(key, None)
+
+def cached(key:str) -> dict | None:
+  '''The local copy of a CACHED hash, or None for keys that aren't cached.
+
+  Every write to a CACHED hash also bumps its version counter, which hashes that change together share. The copy is kept until that counter moves, which is
+  checked at most once every CACHE_TTL seconds, so writes made by other processes show up within CACHE_TTL seconds
+  and the writes made here show up right away.'''
+  if key not in CACHED:
+    return None
+
+  version, checked, fields = _cache.get(key, (None, None, None))
+  if checked is not None and time.monotonic()-checked < CACHE_TTL:
+    return fields
+
+  try:
+    with reader() as conn:
+      if checked is None or conn.get(CACHED[key]) != version:
+        '''Reload every hash sharing this version counter along with it, since they change together.'''
+        shared = [key, *(_ for _ in CACHED if _ != key and CACHED[_] == CACHED[key])]
+        pipe = conn.pipeline(transaction=True)
+        pipe.get(CACHED[key])
+        for _key in shared:
+          pipe.hgetall(_key)
+        version, *hashes = pipe.execute()
+        for _key, _fields in zip(shared, hashes):
+          _cache[_key] = (version, time.monotonic(), _fields)
+        journal.remember(CACHED[key], version, dict(zip(shared, hashes)))
+        return hashes[0]
+  except backend().ConnectionError as e:
+    journal.unreachable(e)
+    '''Without the server, the copy this process has, or else the one kept next to the journal, is as current as it gets.'''
+    if checked is None:
+      fields = journal.remembered(key)
+  _cache[key] = (version, time.monotonic(), fields)
+  return fields
+
+def _copy(key:str) -> dict:
+  '''The local copy of a CACHED hash as it is, without checking it is current. Empty when there is none.'''
+  return _cache.get(key, (None, None, None))[2] or {}
+
+def _touch(pipe:Any, *keys) -> None:
+  touched = set(keys).intersection(CACHED)
+  for version in sorted(set(CACHED[key] for key in touched)):
+    pipe.incr(version)
+  _touched.update(touched)
+
+def _valid_key(key:Any) -> str:
+  assert isinstance(key, str | int | UUID), f"{key=} should be an instance of {','.join(types)}, but isn't."
+  if not isinstance(key, str):
+    key = str(key)
+  assert len(key) > 0, f"{key=} should not be an empty string."
+
+  return key
+
+def xrange(key:str, *, start:str=None, end:str=None, count:int=None, reverse:bool=False, raw:bool=False) -> list:
+  key = _valid_key(key)
+  if start is not None:
+    assert isinstance(start, str), f"{start=} should be an instance of str, but isn't."
+  if end is not None:
+    assert isinstance(end, str), f"{end=} should be an instance of str, but isn't."
+  if count is not None:
+    assert isinstance(count, int), f"{end=} should be an instance of int, but isn't."
+  assert isinstance(reverse, bool), f"{reverse=} should be an instance of bool, but isn't."
+  assert isinstance(raw, bool), f"{raw=} should be an instance of bool, but isn't."
+
+  with reader(raw=raw) as conn:
+    if not _logs(key):
+      entries = _range(conn, key, start, end, count, reverse)
+    elif len(_partitions := partitions(key, *((end, start) if reverse else (start, end)))) == 0:
+      entries = []
+    elif count is None:
+      '''Every overlapping partition in one round trip.'''
+      pipe = conn.pipeline(transaction=False)
+      for partition in reversed(_partitions) if reverse else _partitions:
+        _range(pipe, partition, start, end, count, reverse)
+      entries = [entry for page in pipe.execute() for entry in page]
+    else:
+      '''Only as many partitions as it takes to fill count.'''
+      entries = []
+      for partition in reversed(_partitions) if reverse else _partitions:
+        entries.extend(_range(conn, partition, start, end, count-len(entries), reverse))
+        if len(entries) >= count:
+          break
+
+  if raw or not _logs(key):
+    return entries
+  return [(sid, decode(fields)) for sid, fields in entries]
+
+def _range(conn:Any, key:str, start:str, end:str, count:int, reverse:bool) -> list:
+  if reverse: return conn.xrevrange(key, start or '+', end or '-', count=count)
+  else:       return conn.xrange(   key, start or '-', end or '+', count=count)
+
+def _logs(key:str) -> bool:
+  '''Whether key is a logs stream, logs or one of its versions, whose entries live in monthly partitions and may be
+  in either encoding.'''
+  return (key == 'logs' or key.startswith('logs-')) and ':' not in key
+
+def month(sid:str | int) -> str:
+  '''The YYYY-MM, in UTC, of a stream id, an XRANGE bound or a number of seconds.'''
+  return time.strftime('%Y-%m', time.gmtime(int(str(sid).lstrip('(').split('-')[0])))
+
+def catalog(key:str) -> str:
+  '''The hash of the months the logs stream key has a partition for, each pointing at the partition it is kept in.'''
+  return f'{key}:catalog'
+
+def _resolved(key:str, fields:dict) -> dict:
+  '''The partition of every month in the catalog fields of key. A month whose field is 1 is kept in the partition named
+  after key and the month, logs:YYYY-MM; any other is kept in the partition its field names, which it may share with
+  other versions of the logs (see new_version).'''
+  return {_month: f'{key}:{_month}' if pointer == '1' else pointer for _month, pointer in fields.items()}
+
+def catalogued(key:str) -> dict:
+  '''The partition each month of the logs stream key is kept in.'''
+  if (fields := cached(catalog(key))) is not None:
+    return _resolved(key, fields)
+
+  with reader() as conn:
+    return _resolved(key, conn.hgetall(catalog(key)))
+
+def partition(key:str, sid:str | int) -> str:
+  '''The partition of the logs stream key that the entry sid belongs in.'''
+  return catalogued(key).get(_month := month(sid), f'{key}:{_month}')
+
+def index(partition:str, project:str | UUID) -> str:
+  '''The stream of the entries of project in the partition: copies of them, at the same seconds.'''
+  return f'{partition}:project:{project}'
+
+def indexed(partition:str) -> str:
+  '''The hash of the project ids the partition has an index for.'''
+  return f'{partition}:projects'
+
+def _unindexed(conn:Connection, pipe:Any, removed:list) -> None:
+  '''Queue the removal of the index entries of the (partition, id) entries removed, found in two round trips for all
+  of them. An entry added with an automatic sequence number may have another one in the index, so it is found by its
+  place among the entries of its project in the same second.'''
+  seconds = list(dict.fromkeys((_partition, sid.split('-')[0]) for _partition, sid in removed))
+  reads = conn.pipeline(transaction=False)
+  for _partition, second in seconds:
+    reads.xrange(_partition, second, second)
+  entries = dict(zip(seconds, ([(_sid, decode(fields)) for _sid, fields in page] for page in reads.execute())))
+
+  places = []
+  for _partition, sid in removed:
+    found = entries[(_partition, second := sid.split('-')[0])]
+    if (project := next((fields.get('project') for _sid, fields in found if _sid == sid), None)) is not None:
+      places.append((index(_partition, project), second, [_sid for _sid, fields in found if fields.get('project') == project].index(sid)))
+  if len(places) == 0:
+    return
+
+  indexes = list(dict.fromkeys((key, second) for key, second, _ in places))
+  for key, second in indexes:
+    reads.xrange(key, second, second)
+  ids = dict(zip(indexes, ([_sid for _sid, _ in page] for page in reads.execute())))
+  for key, second, place in places:
+    if place < len(ids[(key, second)]):
+      pipe.xdel(key, ids[(key, second)][place])
+
+def months(key:str) -> list:
+  '''The months the logs stream key has a partition for, oldest first.'''
+  return sorted(catalogued(key))
+
+def _planned(fields:dict, start:str=None, end:str=None) -> list:
+  first = None if start in (None, '-', '+') else month(start)
+  last = None if end in (None, '-', '+') else month(end)
+  return [fields[_month] for _month in sorted(fields) if (first is None or _month >= first) and (last is None or _month <= last)]
+
+def partitions(key:str, start:str=None, end:str=None) -> list:
+  '''The partitions of the logs stream key that can hold entries from start to end, oldest first. Every read of a logs
+  stream is planned with this, so the months entirely outside of a range are never read.'''
+  return _planned(catalogued(_valid_key(key)), start, end)
+
+def handle(project:str | UUID) -> str:
+  '''The small integer handle that compact entries store for project, registering one if it has none yet.'''
+  if (_handle := cached('handles:ids').get(str(project))) is not None:
+    return _handle
+
+  with connection() as conn:
+    _handle = backend().script('handle')(conn, ['handles', 'handles:ids', 'handles:next', CACHED['handles']], [str(project)])
+  invalidate('handles')
+  invalidate('handles:ids')
+  _written()
+  return _text(_handle)
+
+def encode(fields:dict) -> dict:
+  '''The fields of a logs entry in the compact encoding: p, the project's handle, and s, 1 if started, else 0.'''
+  encoded = {_k: _v for _k, _v in fields.items() if _k not in ('project', 'state')}
+  return dict(p=handle(fields['project']), s=STATES[fields['state']], **encoded)
+
+def decode(fields:dict, handles:dict=None) -> dict:
+  '''The fields of a logs entry in either encoding, in the plain one.'''
+  if 'p' not in fields:
+    return fields
+
+  if handles is None and (handles := cached('handles')).get(fields['p']) is None:
+    '''Registered by another process since the copy was made.'''
+    invalidate('handles')
+    handles = cached('handles')
+
+  decoded = {'project': handles.get(fields['p']), 'state': 'started' if fields.get('s') == STATES['started'] else 'stopped'}
+  decoded.update((_k, _v) for _k, _v in fields.items() if _k not in ('p', 's'))
+  return decoded
+
+def _text(value:str | bytes) -> str:
+  return value.decode() if isinstance(value, bytes) else value
+
+def _where(where:dict) -> tuple:
+  '''where as (field, values) pairs, with every field and value both as str and as bytes to match raw entries by.'''
+  pairs = []
+  for field, values in where.items():
+    values = set(map(str, values if isinstance(values, list | tuple | set | frozenset) else [values]))
+    pairs.append((field, values))
+    pairs.append((field.encode(), set(value.encode() for value in values)))
+  return tuple(pairs)
+
+def _matched(entry:tuple, where:tuple) -> tuple | None:
+  '''The entry, decoded, if its fields hold one of the values of every where field, otherwise None. Plain raw
+  entries are matched before they are decoded; compact ones have to be decoded first.'''
+  sid, fields = entry
+  if isinstance(sid, bytes):
+    if b'p' not in fields and not all(fields.get(field) in values for field, values in where[1::2]):
+      return None
+    sid, fields = sid.decode(), {_k.decode(): _v.decode() for _k, _v in fields.items()}
+
+  fields = decode(fields)
+  return (sid, fields) if all(fields.get(field) in values for field, values in where[::2]) else None
+
+def xiter(key:str, start:str=None, end:str=None, page_size:int=PAGE_SIZE, *, count:int=None, where:dict=None) -> Generator:
+  '''Walk the stream from start to end one page_size XRANGE at a time, resuming each page just after the last id seen.
+  The archived entries of a logs stream come first (see lib.db.archive).
+
+  With where, a {field: value or values} filter, pages are read without decoding them and only the entries that pass
+  are decoded and yielded. count still counts every entry read. When where only filters a logs stream by project,
+  the indexes of those projects are read instead of the whole stream, and count counts the entries yielded.'''
+  key = _valid_key(key)
+  assert isinstance(page_size, int) and page_size > 0, f"{page_size=} should be a positive instance of int, but isn't."
+  if count is not None:
+    assert isinstance(count, int), f"{count=} should be an instance of int, but isn't."
+  if where is not None:
+    assert isinstance(where, dict), f"{where=} should be an instance of dict, but isn't."
+    where = _where(where)
+
+  for entry in archive.xrange(key, start, end) if _logs(key) else []:
+    if count == 0:
+      return
+    if where is None:
+      yield entry
+    elif (matched := _matched(entry, where)) is not None:
+      yield matched
+    if count is not None:
+      count -= 1
+
+  if _logs(key) and where is not None and [field for field, _ in where[::2]] == ['project']:
+    yield from _indexed(key, start, end, page_size, count, where)
+    return
+
+  while count is None or count > 0:
+    size = page_size if count is None else min(page_size, count)
+    seen = 0
+    for entry in xrange(key, start=start, end=end, count=size, raw=where is not None):
+      seen += 1
+      if where is None:
+        yield entry
+      elif (matched := _matched(entry, where)) is not None:
+        yield matched
+
+    if seen < size:
+      break
+
+    ms, seq = _text(entry[0]).split('-')
+    start = f'{ms}-{int(seq)+1}'
+    if count is not None:
+      count -= seen
+
+def _indexed(key:str, start:str, end:str, page_size:int, count:int, where:tuple) -> Generator:
+  '''The entries of the projects in where, read through the indexes of the partitions: each page of the indexes names
+  the seconds that hold them, and only those seconds of the partitions are read back, in one more round trip.'''
+  lo, hi = lower_bound(start or '-'), upper_bound(end or '+')
+  projects = sorted(where[0][1])
+  merged = ((_partition, entry) for _partition in partitions(key, start, end)
+             for entry in heapq.merge(*(xiter(index(_partition, project), start, end, page_size) for project in projects), key=lambda entry: parse_id(entry[0])))
+  done = None
+  while count is None or count > 0:
+    page = [entry for _, entry in zip(range(page_size), merged)]
+    seconds = [(_partition, second) for _partition, second in dict.fromkeys((_partition, sid.split('-')[0]) for _partition, (sid, _) in page) if done is None or int(second) > done]
+    if len(seconds) > 0:
+      with reader() as conn:
+        pipe = conn.pipeline(transaction=False)
+        for _partition, second in seconds:
+          pipe.xrange(_partition, second, second)
+        found = [entry for entries in pipe.execute() for entry in entries]
+      done = int(seconds[-1][1])
+
+      for entry in found:
+        if count == 0:
+          return
+        if lo <= parse_id(entry[0]) <= hi and (matched := _matched(entry, where)) is not None:
+          yield matched
+          if count is not None:
+            count -= 1
+
+    if len(page) < page_size:
+      break
+
+def totals(key:str='logs', start:str=None, end:str=None, *, projects:set=None) -> dict[str, int]:
+  '''The seconds logged per project id between start and end, summed on the server (see lib/db/lua/totals.lua) so
+  only the totals come back instead of every entry, plus those of the archived entries. With projects, only the
+  indexes of those project ids in the partitions are read.'''
+  key = _valid_key(key)
+  if start is not None:
+    assert isinstance(start, str), f"{start=} should be an instance of str, but isn't."
+  if end is not None:
+    assert isinstance(end, str), f"{end=} should be an instance of str, but isn't."
+  if projects is not None:
+    assert isinstance(projects, set | list | tuple), f"{projects=} should be an instance of set, list or tuple, but isn't."
+    if len(projects) == 0:
+      return {}
+
+  totals = archive.totals(key, start, end, projects)
+  if len(_partitions := partitions(key, start, end)) == 0:
+    return totals
+  elif projects is not None:
+    '''The indexes of each project across the partitions, each project paired on its own.'''
+    _projects = sorted(set(map(str, projects)))
+    keys = [index(_partition, project) for project in _projects for _partition in _partitions]
+    carried = ('0' + '1'*(len(_partitions)-1)) * len(_projects)
+  else:
+    '''The partitions, paired as one stream.'''
+    keys, carried = _partitions, '0' + '1'*(len(_partitions)-1)
+
+  with reader() as conn:
+    flat = backend().script('totals')(conn, ['handles', *keys], [start or '-', end or '+', PAGE_SIZE, carried])
+  for project, seconds in zip(flat[::2], flat[1::2]):
+    totals[_text(project)] = totals.get(_text(project), 0) + int(seconds)
+  return totals
+
+def xinfo(key:str, hkey:str=None, *, default:Any=None, kind:str='stream') -> dict | str:
+  key = _valid_key(key)
+
+  if hkey is not None:
+    hkey = _valid_key(hkey)
+  assert isinstance(kind, str), f"{kind=} should be an instance of str, but isn't."
+  assert len(kind) > 0, f"{key=} should not be an empty string."
+
+  with reader() as conn:
+    if kind != 'stream': raise Exception(f'Unkown kind {kind}.')
+
+    if _logs(key):
+      info = _summed(conn, partitions(key))
+    else:
+      info = conn.xinfo_stream(key)
+    if hkey is None: return info
+    else:            return info.get(str(hkey), default)
+
+def _summed(conn:Connection, _partitions:list) -> dict:
+  '''The XINFO STREAM of the newest partition, with the length and first entry of them all.'''
+  if len(_partitions) == 0:
+    raise backend().ResponseError('ERR no such key')
+
+  pipe = conn.pipeline(transaction=False)
+  for partition in _partitions:
+    pipe.xinfo_stream(partition)
+  infos = pipe.execute()
+  first = next((_['first-entry'] for _ in infos if _.get('first-entry') is not None), None)
+  return dict(infos[-1], length=sum(_['length'] for _ in infos), **{'first-entry': first})
+
+def has(key:str, hkey:str=None) -> bool:
+  key = _valid_key(key)
+
+  if hkey is not None:
+    hkey = _valid_key(hkey)
+
+  if _logs(key) and hkey is None:
+    return len(months(key)) > 0
+
+  if (fields := cached(key)) is not None:
+    return len(fields) > 0 if hkey is None else hkey in fields
+
+  with reader() as conn:
+    if hkey is None:
+      return conn.exists(key) == 1
+    elif declared(key) == 'hash':
+      return conn.hexists(key, str(hkey))
+    else:
+      return conn.exists(key) == 1 and conn.hexists(key, str(hkey))
+
+def keys(key:str | int) -> list:
+  key = _valid_key(key)
+
+  if (fields := cached(key)) is not None:
+    return list(fields)
+
+  with reader() as conn:
+    return conn.hkeys(str(key))
+
+def get(key:str, hkey:Any=None) -> str | dict:
+  key = _valid_key(key)
+
+  if hkey is not None:
+    hkey = _valid_key(hkey)
+
+  if (fields := cached(key)) is not None:
+    return dict(fields) if hkey is None else fields.get(hkey)
+
+  with reader() as conn:
+    match _kind(conn, key):
+      case 'hash' if hkey is None:   return conn.hgetall(key)
+      case 'stream':                 raise Exception('Use xrange method instead.')
+      case _ if hkey is None:        return conn.get(key)
+      case _:                        return conn.hget(key, str(hkey))
+
+def rename(key:str, newkey:str) -> None:
+  '''Rename key to newkey. Of a logs stream, the partitions named after key are renamed along with their indexes and
+  the catalog; the ones it shares with other versions keep their names and are pointed at as before.'''
+  key = _valid_key(key)
+  newkey = _valid_key(newkey)
+
+  with batch() as pipe:
+    _calls.append(('rename', (key, newkey), {}))
+    if _logs(key):
+      owned = [(_month, _partition) for _month, _partition in sorted(catalogued(key).items()) if _partition == f'{key}:{_month}']
+      with reader() as conn:
+        for _month, _partition in owned:
+          pipe.rename(_partition, f'{newkey}:{_month}')
+          if len(projects := conn.hkeys(indexed(_partition))) > 0:
+            for project in projects:
+              pipe.rename(index(_partition, project), index(f'{newkey}:{_month}', project))
+            pipe.rename(indexed(_partition), indexed(f'{newkey}:{_month}'))
+      key, newkey = catalog(key), catalog(newkey)
+    pipe.rename(str(key), str(newkey))
+    _touch(pipe, key, newkey)
+  _written()
+
+def _versioned() -> list:
+  '''logs and the keys of all of its versions, oldest version first.'''
+  return ['logs', *(f"logs-{entry['version']}" for _, entry in xiter('versions'))]
+
+def shared(key:str) -> set:
+  '''The partitions of the logs stream key that another version of the logs points at too.'''
+  if len(others := [_key for _key in _versioned() if _key != key]) == 0:
+    return set()
+
+  with reader() as conn:
+    pipe = conn.pipeline(transaction=False)
+    for _key in others:
+      pipe.hgetall(catalog(_key))
+    pointed = set(_partition for _key, fields in zip(others, pipe.execute()) for _partition in _resolved(_key, fields).values())
+  return pointed.intersection(catalogued(key).values())
+
+def _once(name:tuple, read:Callable) -> Any:
+  '''read(), read once per batch under name: the writes queued in a batch don't change what later ones are planned by
+  until it's sent.'''
+  if _batch is None:
+    return read()
+  if name not in _plans:
+    _plans[name] = read()
+  return _plans[name]
+
+def _dropped(conn:Connection, pipe:Any, _partition:str) -> None:
+  '''Queue the deletion of the partition and of its indexes.'''
+  for project in conn.hkeys(indexed(_partition)):
+    pipe.delete(index(_partition, project))
+  pipe.delete(indexed(_partition), _partition)
+
+def _copied(pipe:Any, key:str, _month:str, entries:list, tag:str | UUID=None) -> str:
+  '''Queue the writing of the raw entries into a new partition of key for _month, along with the indexes of their
+  projects, and return its name. Entries keep their ids; one of '<seconds>-*' gets the next free one in its second.'''
+  name, last = f'{key}@{tag or uuid4()}:{_month}', None
+  for sid, fields in entries:
+    if sid.endswith('-*'):
+      second = int(sid.split('-')[0])
+      sid = f'{second}-{last[1]+1}' if last is not None and last[0] == second else f'{second}-0'
+    pipe.xadd(name, fields, id=sid)
+    if (project := decode(fields).get('project')) is not None:
+      pipe.xadd(index(name, project), fields, id=sid)
+      pipe.hsetnx(indexed(name), project, '1')
+    last = parse_id(sid)
+  return name
+
+def rm(key:str, sub:int | str=None) -> None:
+  '''Remove key, or its field or entry sub. A logs stream keeps the partitions it shares with other versions, and an
+  entry is removed from a shared partition by removing it from a copy of that partition instead.'''
+  key = _valid_key(key)
+
+  if sub is not None:
+    assert isinstance(sub, int | str | UUID), f"{sub=} should be an instance of int, str or UUID, but isn't."
+
+  with batch() as pipe, connection() as conn:
+    _calls.append(('rm', (key,) if sub is None else (key, str(sub)), {}))
+    _shared = _once(('shared', key), lambda: shared(key)) if _logs(key) else set()
+    if _logs(key) and sub is None:
+      for _partition in catalogued(key).values():
+        if _partition not in _shared:
+          _dropped(conn, pipe, _partition)
+      pipe.delete(key := catalog(key))
+    elif _logs(key) and (_partition := partition(key, str(sub))) in _shared and ('copy', _partition) in _plans:
+      '''The copy made earlier in this batch is written ahead of this, with the same ids.'''
+      copy, projects = _plans[('copy', _partition)]
+      pipe.xdel(copy, str(sub))
+      if (project := projects.get(str(sub))) is not None:
+        pipe.xdel(index(copy, project), str(sub))
+      key = catalog(key)
+    elif _logs(key) and _partition in _shared and len(entries := [(sid, fields) for sid, fields in conn.xrange(_partition) if sid != str(sub)]) == 0:
+      '''Nothing is left of the month for key, but the others keep it.'''
+      pipe.hdel(key := catalog(key), month(str(sub)))
+    elif _logs(key) and _partition in _shared:
+      pipe.hset(catalog(key), month(str(sub)), copy := _copied(pipe, key, month(str(sub)), entries))
+      _plans[('copy', _partition)] = (copy, {sid: decode(fields).get('project') for sid, fields in entries})
+      _streams.add(copy)
+      key = catalog(key)
+    elif _logs(key):
+      '''Its index entry is looked up along with the others removed in this batch, when it's sent.'''
+      _plans.setdefault('unindexed', []).append((_partition, str(sub)))
+      pipe.xdel(_partition, str(sub))
+    elif sub is None:
+      pipe.delete(key)
+    else:
+      match _kind(conn, key):
+        case 'hash': pipe.hdel(key, str(sub))
+        case 'stream': pipe.xdel(key, str(sub))
+        case kind: raise Exception('Unhandled database kind {kind}.')
+    _touch(pipe, key)
+  _written()
+
+def add(key:str, val:str | int | dict, *, expire:int=None, nx:bool=False) -> None:
+  key = _valid_key(key)
+  assert val is not None, f"{val=} should have a value, but doesn't."
+  assert isinstance(nx, bool), f"{nx=} should be an instance of bool, but isn't."
+
+  if isinstance(val, dict):
+    _val = dict([(str(_k), str(_v)) for _k, _v in val.items()])
+  else:
+    _val = val
+
+  if expire is not None:
+    assert isinstance(expire, int), f"{expire=} should be an instance of int, but isn't."
+
+  with batch() as pipe, connection() as conn:
+    _calls.append(('add', (key, dict(_val) if isinstance(_val, dict) else str(_val)), dict(expire=expire, nx=nx)))
+    match _kind(conn, key):
+      case 'hash' if nx:
+        for _k, _v in _val.items():
+          pipe.hsetnx(key, _k, _v)
+      case 'hash':   pipe.hset(key, mapping=_val)
+      case 'stream' if _logs(key):
+        project = _val.get('project')
+        if ENCODING == 'compact' and 'project' in _val:
+          _val = encode(_val)
+        sid = _val.pop('id', '*')
+        at = int(time.time()) if sid == '*' else sid
+        try:
+          _month, _partition = month(at), partition(key, at)
+        except backend().ConnectionError:
+          '''The writes go to the journal, and the partition is looked up again when they are replayed.'''
+          _month, _partition = month(at), f'{key}:{month(at)}'
+        pipe.xadd(_partition, _val, id=sid)
+        if project is not None:
+          pipe.xadd(index(_partition, project), _val, id=sid)
+          pipe.hsetnx(indexed(_partition), project, '1')
+        pipe.hsetnx(catalog(key), _month, '1')
+        if _month not in _copy(catalog(key)):
+          _touch(pipe, catalog(key))
+        _streams.add(_partition)
+      case 'stream':
+        pipe.xadd(key, _val, id=_val.pop('id', '*'))
+        _streams.add(key)
+      case 'string': pipe.set(key, str(_val), nx=nx, ex=expire)
+      case _:
+        if isinstance(_val, dict):
+          if nx:
+            for _k, _v in _val.items():
+              pipe.hsetnx(key, _k, _v)
+          elif 'id' in _val:
+            pipe.xadd(key, _val, id=_val.pop('id', '*'))
+            _streams.add(key)
+          else:
+            pipe.hset(key, mapping=_val)
+        elif isinstance(_val, str):
+          pipe.set(key, str(_val), nx=nx, ex=expire)
+        else:
+          raise Exception(f'Unable to set/add value for unhandled key kind {_val}.')
+    _touch(pipe, key)
+  _written()
+
+@contextmanager
+def batch() -> Generator:
+  '''Queue the writes made inside the block and send them in one MULTI/EXEC round trip when it ends.
+  Nested batches join the outermost one and an exception discards everything queued.
+  When the journal wants them, or the server can't be reached, the writes are journaled instead.'''
+  global _batch
+
+  if _batch is not None:
+    yield _batch
+    return
+
+  with connection() as conn:
+    _batch = conn.pipeline(transaction=True)
+    try:
+      yield _batch
+      if journal.wanted():
+        journal.append(_calls)
+      else:
+        try:
+          if len(removed := _plans.get('unindexed', [])) > 0:
+            _unindexed(conn, _batch, removed)
+          results = _batch.execute()
+        except backend().ConnectionError:
+          if JOURNAL_MODE == 'off' or journal.replaying:
+            raise
+          journal.append(_calls)
+        else:
+          if any(istimestamp_id(_) for _ in results):
+            for key in _streams:
+              _groups(conn, key)
+    finally:
+      _batch.reset()
+      _batch = None
+      _streams.clear()
+      _plans.clear()
+      _calls.clear()
+      for key in _touched:
+        invalidate(key)
+      _touched.clear()
+
+def _groups(conn:Connection, key:str) -> None:
+  for group in set(GROUPS).difference(set([_.get('name') for _ in conn.xinfo_groups(key)])):
+    conn.xgroup_create(key, group, entries_read=0)
+
+def _written(count:int=1) -> None:
+  global _writes, _wrote
+  _writes += count
+  _wrote = True
+
+def save(*, bg:bool=False) -> None:
+  assert isinstance(bg, bool), f"{bg=} should be an instance of bool, but isn't."
+
+  with connection() as conn:
+    if bg:
+      conn.bgsave()
+    else:
+      conn.save()
+
+def persist() -> None:
+  '''Apply the DURABILITY policy to the writes made since the last call. Run once, when a command ends.'''
+  global _writes
+  assert isdurability(DURABILITY), f"{DURABILITY=} should be one of none, bgsave, once-per-command or every-N-writes, but isn't."
+
+  if _writes == 0:
+    return
+
+  try:
+    match DURABILITY:
+      case 'none':             pass
+      case 'bgsave':           save(bg=True)
+      case 'once-per-command': save()
+      case policy:
+        with connection() as conn:
+          if int(conn.info('persistence').get('rdb_changes_since_last_save', 0)) >= int(policy.split('-')[1]):
+            conn.bgsave()
+  except backend().ResponseError as e:
+    '''Most likely a background save is already in progress, which covers these writes too.'''
+    debug(f'Unable to persist the database: {e}')
+  except backend().ConnectionError as e:
+    '''The writes went to the journal, which is durable on its own.'''
+    debug(f'Unable to persist the database: {e}')
+  _writes = 0
+
+def log(state:str, project:str | UUID, at:str | int, *, name:str=None, begun:str=None) -> tuple:
+  '''Append state for project to the logs partition of the at seconds, with the time check and everything a state change implies,
+  in one atomic call of the log script. Starting first stops whichever project is running, registers name as the
+  project's name in projects and projects:names unless either is already taken, and SETs begun if unset. Stopping
+  only applies if project is the one running, or to whichever one is when project is None. Entries are written in the
+  ENCODING.
+
+  Returns the last id logs held before the call, the id of the stopped entry and the id of the started entry, the
+  latter two None when nothing was written. Nothing is written when at is older than that last id.
+  This runs immediately, outside of any batch. A journaled call returns ('0-0', None, None).'''
+  assert state in ('started', 'stopped'), f"{state=} should be one of started or stopped, but isn't."
+  assert isinstance(project, str | UUID) or (project is None and state == 'stopped'), f"{project=} should be an instance of str or UUID, or None to stop, but isn't."
+  assert str(at).isdigit(), f"{at=} should be a number of seconds, but isn't."
+  assert name is None or isinstance(name, str), f"{name=} should be an instance of str, but isn't."
+
+  call = ('log', (state, str(project or ''), str(at)), dict(name=name, begun=begun))
+  if journal.wanted():
+    journal.append([call])
+    return '0-0', None, None
+
+  name = (name or '').strip()
+  try:
+    with connection() as conn:
+      last_id, stopped, started = backend().script('log')(conn,
+        ['logs', catalog('logs'), CACHED[catalog('logs')], 'projects', 'projects:names', CACHED['projects'], 'begun', 'schema',
+         'handles', 'handles:ids', 'handles:next', CACHED['handles']],
+        [state, str(project or ''), str(at), month(at), begun or '', name, name.casefold(), migrations.LATEST, ENCODING, len(GROUPS), *GROUPS])
+  except backend().ConnectionError:
+    if JOURNAL_MODE == 'off' or journal.replaying:
+      raise
+    journal.append([call])
+    return '0-0', None, None
+
+  if stopped != '' or started != '':
+    _written()
+    if month(at) not in _copy(catalog('logs')):
+      invalidate(catalog('logs'))
+  if started != '' and name != '':
+    invalidate('projects')
+    invalidate('projects:names')
+  if ENCODING == 'compact' and (stopped != '' or started != ''):
+    invalidate('handles')
+    invalidate('handles:ids')
+  return last_id, stopped or None, started or None
+
+def append(val:dict) -> tuple:
+  '''Add the entry val to logs unless it is older than the last entry, checking and writing in one atomic call of the
+  append script, so that a run of appends costs one round trip each instead of a read of the last id before every one.
+
+  Returns the last id logs held before the call and the id of the new entry, the latter None when nothing was written.
+  This runs immediately, outside of any batch. A journaled call returns ('0-0', None).'''
+  assert isinstance(val, dict) and 'id' in val, f"{val=} should be an instance of dict with an id, but isn't."
+
+  _val = dict([(str(_k), str(_v)) for _k, _v in val.items()])
+  call = ('append', (dict(_val),), {})
+  if journal.wanted():
+    journal.append([call])
+    return '0-0', None
+
+  sid, project = _val.pop('id'), _val.get('project', '')
+  if ENCODING == 'compact' and 'project' in _val:
+    _val = encode(_val)
+  try:
+    with connection() as conn:
+      last_id, added = backend().script('append')(conn, ['logs', catalog('logs'), CACHED[catalog('logs')]],
+        [sid, month(sid), project, len(GROUPS), *GROUPS, *(_ for field in _val.items() for _ in field)])
+  except backend().ConnectionError:
+    if JOURNAL_MODE == 'off' or journal.replaying:
+      raise
+    journal.append([call])
+    return '0-0', None
+
+  if added != '':
+    _written()
+    if month(sid) not in _copy(catalog('logs')):
+      invalidate(catalog('logs'))
+  return _text(last_id), _text(added) or None
+
+def new_version(reason:str | list, retimed:dict=None) -> UUID:
+  '''Keep logs as it is now as a new version, and return the version's id. The version gets a catalog of its own that
+  points at the partitions of logs as they are, which costs a field per month instead of a copy of every entry. logs
+  then goes on in copies of the partitions that change: its newest one, which it keeps appending to, and the ones
+  retimed moves entries out of or into, so an edit only writes the months it touches.
+
+  retimed maps seconds to the seconds the entries of logs at them move to. The entries keep their places among the
+  others, so a caller has to check that they land between their neighbours.'''
+  assert isinstance(reason, str | list), f"{reason=} should be an instance of str or list, but isn't."
+  if retimed is not None:
+    assert isinstance(retimed, dict), f"{retimed=} should be an instance of dict, but isn't."
+
+  version_id = uuid4()
+  pointers, moved = catalogued('logs'), {int(_k): int(_v) for _k, _v in (retimed or {}).items()}
+  touched = set(map(month, moved)) | set(map(month, moved.values()))
+  rewritten = {_month: [] for _month in sorted(touched.union(sorted(pointers)[-1:]))}
+  with reader() as conn:
+    for _month in sorted(set(rewritten).intersection(pointers)):
+      for sid, fields in conn.xrange(pointers[_month]):
+        second = int(sid.split('-')[0])
+        at = moved.get(second, second)
+        rewritten[month(at)].append((f'{at}-*' if _month in touched else sid, fields))
+
+  with batch() as pipe:
+    add('versions', dict(reason=reason, version=version_id, id='*'))
+    if len(pointers) > 0:
+      pipe.hset(catalog(f'logs-{version_id}'), mapping=pointers)
+    for _month, entries in rewritten.items():
+      if len(entries) > 0:
+        pipe.hset(catalog('logs'), _month, copy := _copied(pipe, 'logs', _month, entries, version_id))
+        _streams.add(copy)
+      elif _month in pointers:
+        pipe.hdel(catalog('logs'), _month)
+    _touch(pipe, catalog('logs'))
+  return version_id
+
+from . import journal, migrations, archive, versions, bulk
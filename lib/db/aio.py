@@ -0,0 +1,134 @@
+'''Awaitable versions of the lib.db read functions, for running independent lookups concurrently and for use
+inside an event loop. They go through the backend selected in lib.db and follow the same key SCHEMA.'''
+import asyncio
+from typing import Any, AsyncGenerator
+from .. import db
+from . import declared, _valid_key, PAGE_SIZE
+
+def connection() -> Any:
+  return db.backend().aconnection()
+
+async def _kind(conn:Any, key:str) -> str:
+  return declared(key) or await conn.type(key)
+
+async def xrange(key:str, *, start:str=None, end:str=None, count:int=None, reverse:bool=False) -> list:
+  key = _valid_key(key)
+  if start is not None:
+    assert isinstance(start, str), f"{start=} should be an instance of str, but isn't."
+  if end is not None:
+    assert isinstance(end, str), f"{end=} should be an instance of str, but isn't."
+  if count is not None:
+    assert isinstance(count, int), f"{count=} should be an instance of int, but isn't."
+  assert isinstance(reverse, bool), f"{reverse=} should be an instance of bool, but isn't."
+
+  if not db._logs(key):
+    async with connection() as conn:
+      return await _range(conn, key, start, end, count, reverse)
+
+  _partitions = await partitions(key, *((end, start) if reverse else (start, end)))
+  _partitions = list(reversed(_partitions) if reverse else _partitions)
+  entries = []
+  async with connection() as conn:
+    if count is None:
+      '''Every partition is read whole, so they're all read at once.'''
+      for page in await asyncio.gather(*(_range(conn, partition, start, end, None, reverse) for partition in _partitions)):
+        entries.extend(page)
+    else:
+      for partition in _partitions:
+        entries.extend(await _range(conn, partition, start, end, count-len(entries), reverse))
+        if len(entries) >= count:
+          break
+
+  if any('p' in fields for _, fields in entries):
+    handles = await get('handles')
+    entries = [(sid, db.decode(fields, handles)) for sid, fields in entries]
+  return entries
+
+async def _range(conn:Any, key:str, start:str, end:str, count:int, reverse:bool) -> list:
+  if reverse: return await conn.xrevrange(key, start or '+', end or '-', count=count)
+  else:       return await conn.xrange(   key, start or '-', end or '+', count=count)
+
+async def partitions(key:str, start:str=None, end:str=None) -> list:
+  '''Like lib.db.partitions.'''
+  return db._planned(db._resolved(key, await get(db.catalog(key))), start, end)
+
+async def xiter(key:str, start:str=None, end:str=None, page_size:int=PAGE_SIZE, *, count:int=None) -> AsyncGenerator:
+  '''Walk the stream like lib.db.xiter, awaiting one page_size XRANGE at a time.'''
+  key = _valid_key(key)
+  assert isinstance(page_size, int) and page_size > 0, f"{page_size=} should be a positive instance of int, but isn't."
+  if count is not None:
+    assert isinstance(count, int), f"{count=} should be an instance of int, but isn't."
+
+  for entry in db.archive.xrange(key, start, end) if db._logs(key) else []:
+    if count == 0:
+      return
+    yield entry
+    if count is not None:
+      count -= 1
+
+  while count is None or count > 0:
+    size = page_size if count is None else min(page_size, count)
+    page = await xrange(key, start=start, end=end, count=size)
+    for entry in page:
+      yield entry
+
+    if len(page) < size:
+      break
+
+    ms, seq = page[-1][0].split('-')
+    start = f'{ms}-{int(seq)+1}'
+    if count is not None:
+      count -= len(page)
+
+async def xinfo(key:str, hkey:str=None, *, default:Any=None) -> dict | str:
+  key = _valid_key(key)
+
+  if hkey is not None:
+    hkey = _valid_key(hkey)
+
+  async with connection() as conn:
+    if db._logs(key):
+      if len(_partitions := await partitions(key)) == 0:
+        raise db.backend().ResponseError('ERR no such key')
+      infos = await asyncio.gather(*(conn.xinfo_stream(partition) for partition in _partitions))
+      info = dict(infos[-1], length=sum(_['length'] for _ in infos))
+    else:
+      info = await conn.xinfo_stream(key)
+    if hkey is None: return info
+    else:            return info.get(str(hkey), default)
+
+async def has(key:str, hkey:str=None) -> bool:
+  key = _valid_key(key)
+
+  if hkey is not None:
+    hkey = _valid_key(hkey)
+
+  if db._logs(key) and hkey is None:
+    return len(await keys(db.catalog(key))) > 0
+
+  async with connection() as conn:
+    if hkey is None:
+      return await conn.exists(key) == 1
+    elif declared(key) == 'hash':
+      return await conn.hexists(key, str(hkey))
+    else:
+      return await conn.exists(key) == 1 and await conn.hexists(key, str(hkey))
+
+async def keys(key:str | int) -> list:
+  key = _valid_key(key)
+
+  async with connection() as conn:
+    return await conn.hkeys(key)
+
+async def get(key:str, hkey:Any=None) -> str | dict:
+  key = _valid_key(key)
+
+  if hkey is not None:
+    hkey = _valid_key(hkey)
+
+  async with connection() as conn:
+    match await _kind(conn, key):
+      case 'hash' if hkey is None:   return await conn.hgetall(key)
+      case 'stream':                 raise Exception('Use xrange method instead.')
+      case _ if hkey is None:        return await conn.get(key)
+      case _:                        return await conn.hget(key, str(hkey))
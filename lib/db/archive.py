@@ -0,0 +1,125 @@
+'''Cold history: the log entries older than a cut-off, moved off the server into compressed, immutable segment files.
+
+`worn archive --before DATE` moves the entries of logs older than DATE out of its partitions and into ARCHIVE/logs/,
+one segment per partition per run. A segment is the zlib-compressed NDJSON of its [id, fields] entries, decoded to the
+plain encoding, and is named after the first and last ids it holds. Segments are never rewritten: a later run only
+adds segments of newer entries, and a run that was interrupted before trimming the server skips what it already wrote.
+The cut-off is moved back to the start of a period still open at DATE, so every archived period is a closed one.
+
+Reads memory-map just the segments whose ids overlap their range and inflate them a chunk at a time, yielding their
+entries as they go. lib.db.xiter and lib.db.totals read them ahead of the server for logs keys, so LogProject.all and
+reports reach back into archived time without knowing about it, and without holding all of it.'''
+import os, re, json, mmap, zlib
+from typing import Generator
+from .. import db
+from .backend import parse_id, lower_bound, upper_bound
+
+SEGMENT = re.compile(r'^(\d+-\d+)_(\d+-\d+)\.seg$')
+
+CHUNK = 64*1024
+
+def directory(key:str) -> str:
+  return os.path.join(db.ARCHIVE, key)
+
+def _ids(key:str) -> list:
+  '''(first id, last id, path) of every segment of key, oldest first.'''
+  if not os.path.isdir(path := directory(key)):
+    return []
+
+  found = []
+  for name in os.listdir(path):
+    if (m := SEGMENT.search(name)) is not None:
+      found.append((parse_id(m[1]), parse_id(m[2]), os.path.join(path, name)))
+  return sorted(found)
+
+def segments(key:str, start:str=None, end:str=None) -> list:
+  '''The segment files of key that hold ids from start to end, oldest first.'''
+  lo, hi = lower_bound(start or '-'), upper_bound(end or '+')
+  return [path for first, last, path in _ids(key) if last >= lo and first <= hi]
+
+def _read(path:str) -> Generator:
+  '''The entries of the segment, inflated CHUNK bytes of the mapped file at a time, so only a chunk's lines are held.'''
+  with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped, memoryview(mapped) as view:
+    inflate, rest = zlib.decompressobj(), b''
+    for n in range(0, len(view), CHUNK):
+      *lines, rest = (rest + inflate.decompress(view[n:n+CHUNK])).split(b'\n')
+      yield from (tuple(json.loads(line)) for line in lines)
+    yield from (tuple(json.loads(line)) for line in (rest + inflate.flush()).split(b'\n') if len(line) > 0)
+
+def xrange(key:str, start:str=None, end:str=None) -> Generator:
+  '''The archived entries of key from start to end, like lib.db.xrange, read as they are asked for.'''
+  lo, hi = lower_bound(start or '-'), upper_bound(end or '+')
+  for path in segments(key, start, end):
+    for sid, fields in _read(path):
+      if parse_id(sid) > hi:
+        return
+      elif parse_id(sid) >= lo:
+        yield sid, fields
+
+def totals(key:str, start:str=None, end:str=None, projects:set=None) -> dict:
+  '''The seconds logged per project id in the archived entries from start to end, paired like lib/db/lua/totals.lua.'''
+  only = None if projects is None else set(map(str, projects))
+  totals, begun = {}, None
+  for sid, fields in xrange(key, start, end):
+    if (project := fields.get('project')) is None or (only is not None and project not in only):
+      continue
+
+    totals.setdefault(project, 0)
+    at = parse_id(sid)[0]
+    if fields.get('state') == 'started':
+      begun = at
+    elif begun is not None:
+      totals[project] += at-begun
+      begun = None
+  return totals
+
+def _write(key:str, entries:list) -> str:
+  os.makedirs(directory(key), exist_ok=True)
+  path = os.path.join(directory(key), f'{entries[0][0]}_{entries[-1][0]}.seg')
+  with open(f'{path}.tmp', 'wb') as f:
+    f.write(zlib.compress(''.join(json.dumps([sid, fields]) + '\n' for sid, fields in entries).encode(), 9))
+    f.flush()
+    os.fsync(f.fileno())
+  os.replace(f'{path}.tmp', path)
+  return path
+
+def archive(before:int, key:str='logs') -> int:
+  '''Move the entries of key older than the before seconds into segments, and return how many were moved. Emptied
+  partitions are deleted, except for the newest one, which keeps the last id new entries are checked against.
+  The indexes of the projects in them are trimmed along with them. A partition that other versions of the logs share
+  is left to them: key stops pointing at it, or points at a trimmed copy of it instead.'''
+  assert isinstance(before, int) and before > 0, f"{before=} should be a positive instance of int, but isn't."
+
+  cut = f'{before}-0'
+  if len(last := db.xrange(key, start=str(before-1), reverse=True, count=1)) > 0 and last[0][1].get('state') == 'started':
+    cut = last[0][0]
+
+  done = max((last for _, last, _ in _ids(key)), default=None)
+  _partitions, moved = db.partitions(key, end=cut), 0
+  newest, shared = db.partitions(key)[-1:], db.shared(key)
+  with db.connection() as conn:
+    for partition in _partitions:
+      entries = [(sid, db.decode(fields)) for sid, fields in db.xiter(partition, end=f'({cut}') if done is None or parse_id(sid) > done]
+      if len(entries) > 0:
+        _write(key, entries)
+        moved += len(entries)
+
+      pipe, copy = conn.pipeline(transaction=True), None
+      if (_month := partition.rsplit(':', 1)[1]) < db.month(cut) and partition not in newest:
+        if partition not in shared:
+          db._dropped(conn, pipe, partition)
+        pipe.hdel(db.catalog(key), _month)
+      elif partition in shared:
+        pipe.hset(db.catalog(key), _month, copy := db._copied(pipe, key, _month, conn.xrange(partition, cut, '+')))
+      else:
+        pipe.xtrim(partition, minid=cut, approximate=False)
+        '''Index entries only share their second with the partition's, so the indexes keep the whole second of the cut.'''
+        for project in conn.hkeys(db.indexed(partition)):
+          pipe.xtrim(db.index(partition, project), minid=f"{cut.split('-')[0]}-0", approximate=False)
+      db._touch(pipe, db.catalog(key))
+      pipe.execute()
+      if copy is not None and conn.exists(copy) == 1:
+        db._groups(conn, copy)
+  db.invalidate(db.catalog(key))
+  db._written()
+  return moved
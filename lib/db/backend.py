@@ -0,0 +1,214 @@
+'''The interface every lib.db backend implements.
+
+lib.db talks to its store through the small subset of the redis-py client API declared on Connection, with
+decode_responses=True semantics (str in, str out). The redis backend hands out redis.StrictRedis clients as is;
+every other backend implements the same calls on top of its own storage.'''
+from __future__ import annotations
+import os, re, time, asyncio
+from functools import partial
+from contextlib import contextmanager
+from typing import Any, Callable, Generator
+
+class ResponseError(Exception): pass
+
+MAX_SEQ = 2**64-1
+
+def parse_id(sid:str, *, seq:int=0) -> tuple[int, int]:
+  '''Split a stream id into (ms, seq), using seq for the missing half of a partial id like "1711313926".'''
+  if not isinstance(sid, str) or re.search(r'^\d+(-\d+)?$', sid) is None:
+    raise ResponseError(f'ERR Invalid stream ID specified as stream command argument {sid!r}')
+
+  if '-' in sid:
+    ms, _seq = sid.split('-')
+    return int(ms), int(_seq)
+  return int(sid), seq
+
+def format_id(sid:tuple[int, int]) -> str:
+  return f'{sid[0]}-{sid[1]}'
+
+def lower_bound(sid:str) -> tuple[int, int]:
+  '''The smallest id included by an XRANGE start argument.'''
+  match sid:
+    case '-':                  return (0, 0)
+    case '+':                  return (2**64-1, MAX_SEQ)
+    case str() if sid.startswith('('):
+      ms, seq = parse_id(sid[1:], seq=MAX_SEQ)
+      return (ms, seq+1) if seq < MAX_SEQ else (ms+1, 0)
+    case _:                    return parse_id(sid, seq=0)
+
+def upper_bound(sid:str) -> tuple[int, int]:
+  '''The largest id included by an XRANGE end argument.'''
+  match sid:
+    case '+':                  return (2**64-1, MAX_SEQ)
+    case '-':                  return (0, 0)
+    case str() if sid.startswith('('):
+      ms, seq = parse_id(sid[1:], seq=0)
+      return (ms, seq-1) if seq > 0 else (ms-1, MAX_SEQ)
+    case _:                    return parse_id(sid, seq=MAX_SEQ)
+
+def next_id(last:tuple[int, int] | None, requested:str) -> tuple[int, int]:
+  '''The id XADD assigns for the requested id ("*", "<ms>-*" or "<ms>-<seq>") given the last generated id.'''
+  last = last or (0, 0)
+  if requested == '*':
+    ms = max(int(time.time()*1000), last[0])
+    return (ms, last[1]+1) if ms == last[0] and last != (0, 0) else (ms, 0)
+  elif requested.endswith('-*'):
+    ms = int(requested[:-2])
+    if ms < last[0]:
+      raise ResponseError('ERR The ID specified in XADD is equal or smaller than the target stream top item')
+    return (ms, last[1]+1) if ms == last[0] and last != (0, 0) else (ms, 0)
+
+  sid = parse_id(requested)
+  if sid == (0, 0):
+    raise ResponseError('ERR The ID specified in XADD must be greater than 0-0')
+  elif sid <= last:
+    raise ResponseError('ERR The ID specified in XADD is equal or smaller than the target stream top item')
+  return sid
+
+def wrongtype() -> ResponseError:
+  return ResponseError('WRONGTYPE Operation against a key holding the wrong kind of value')
+
+class Backend(object):
+  '''A configured store that hands out Connections. Subclasses declare their options and their defaults in OPTIONS,
+  and the environment variables that set them in ENVIRON.'''
+  name = None
+  OPTIONS = {}
+  ENVIRON = {}
+  ResponseError = ResponseError
+  ConnectionError = (ConnectionError, TimeoutError)
+
+  def __init__(self, **options):
+    assert set(options).issubset(self.OPTIONS), f"{options=} should only contain the keys {','.join(self.OPTIONS)}, but doesn't."
+    self.options = dict(self.OPTIONS, **options)
+
+  @classmethod
+  def parse(kind, name:str, value:str) -> Any:
+    '''value, as read from the environment or a config file, as the type of the default of the option name.'''
+    match kind.OPTIONS[name]:
+      case bool():  return value.strip().casefold() in ('1', 'true', 'yes', 'on')
+      case int():   return int(value)
+      case float(): return float(value)
+      case _:       return value
+
+  @classmethod
+  def settings(kind, config:dict=None) -> dict:
+    '''The options set by config, a section of the config file, and by ENVIRON, which take precedence.'''
+    config = dict(config or {})
+    config.update((name, os.environ[var]) for name, var in kind.ENVIRON.items() if var in os.environ)
+    assert set(config).issubset(kind.OPTIONS), f"{config=} should only contain the keys {','.join(kind.OPTIONS)}, but doesn't."
+    return {name: kind.parse(name, value) for name, value in config.items()}
+
+  def configure(self, **options) -> None:
+    assert set(options).issubset(self.OPTIONS), f"{options=} should only contain the keys {','.join(self.OPTIONS)}, but doesn't."
+    self.options.update(options)
+    self.close()
+
+  def connection(self) -> Connection:
+    raise NotImplementedError(f'{type(self).__name__} does not implement connection.')
+
+  def raw_connection(self) -> Connection:
+    '''A connection whose replies are left undecoded, as bytes, where that saves the backend any work. Backends that
+    hold str already hand out their usual connection, so callers have to accept either.'''
+    return self.connection()
+
+  def read_connection(self, *, raw:bool=False) -> Connection:
+    '''A connection for pure reads, which may be served by a replica. Without one, the usual (or raw) connection.'''
+    return self.raw_connection() if raw else self.connection()
+
+  def aconnection(self) -> AsyncConnection:
+    '''An awaitable counterpart of connection(). Unless a backend has a native asyncio client, each command runs the
+    blocking one in a worker thread so it doesn't hold up the event loop.'''
+    return AsyncConnection(self.connection())
+
+  def script(self, name:str) -> Callable:
+    '''The script called name, as a callable taking a Connection and the script's KEYS and ARGV. Without Lua, the
+    Python version of the script in lib.db.scripts runs inside Connection.atomic(), traced as a single EVALSHA.'''
+    from . import scripts, trace
+
+    def run(conn:Connection, keys:list, args:list) -> Any:
+      def call(conn:Connection) -> Any:
+        with conn.atomic():
+          return getattr(scripts, name)(conn, [str(_) for _ in keys], [str(_) for _ in args])
+      return trace.as_one('EVALSHA', name, conn, call)
+    return run
+
+  def close(self) -> None: pass
+
+class Connection(object):
+  '''The redis-py commands lib.db relies on. Anything not listed here is not part of the backend interface.'''
+  def __enter__(self) -> Connection:
+    return self
+
+  def __exit__(self, *exc) -> None:
+    self.close()
+
+  def close(self) -> None: pass
+
+  def pipeline(self, transaction:bool=True) -> Pipeline:
+    return Pipeline(self)
+
+  @contextmanager
+  def atomic(self) -> Generator:
+    '''Apply every command run inside the block as one unit.'''
+    yield self
+
+  def _unimplemented(self, *args, **kw) -> Any:
+    raise NotImplementedError(f'{type(self).__name__} does not implement this command.')
+
+  type = exists = get = set = incr = delete = rename = _unimplemented
+  hget = hgetall = hkeys = hexists = hset = hsetnx = hdel = _unimplemented
+  xadd = xdel = xtrim = xrange = xrevrange = xinfo_stream = xinfo_groups = xgroup_create = _unimplemented
+  save = bgsave = info = memory_usage = _unimplemented
+
+class Pipeline(object):
+  '''Queues commands for a Connection and applies them in one Connection.atomic() block on execute().'''
+  COMMANDS = ('get', 'hgetall', 'set', 'incr', 'delete', 'rename', 'hset', 'hsetnx', 'hdel', 'xadd', 'xdel', 'xtrim', 'xgroup_create',
+              'xrange', 'xrevrange', 'xinfo_stream', 'memory_usage')
+
+  def __init__(self, conn:Connection):
+    self.conn = conn
+    self.command_stack = []
+
+  def __getattr__(self, name:str) -> Any:
+    if name not in Pipeline.COMMANDS:
+      raise AttributeError(f'{type(self).__name__} cannot queue {name!r}.')
+
+    def queue(*args, **kw) -> Pipeline:
+      self.command_stack.append((name, args, kw))
+      return self
+    return queue
+
+  def execute(self) -> list:
+    stack, self.command_stack = self.command_stack, []
+    if len(stack) == 0:
+      return []
+
+    with self.conn.atomic():
+      return [getattr(self.conn, name)(*args, **kw) for name, args, kw in stack]
+
+  def reset(self) -> None:
+    self.command_stack = []
+
+class AsyncConnection(object):
+  '''Awaitable versions of the read commands of a Connection, each run with asyncio.to_thread.'''
+  COMMANDS = ('type', 'exists', 'get', 'hget', 'hgetall', 'hkeys', 'hexists', 'xrange', 'xrevrange', 'xinfo_stream', 'xinfo_groups')
+
+  def __init__(self, conn:Connection):
+    self.conn = conn
+
+  async def __aenter__(self) -> AsyncConnection:
+    return self
+
+  async def __aexit__(self, *exc) -> None:
+    await self.aclose()
+
+  async def aclose(self) -> None:
+    self.conn.close()
+
+  def __getattr__(self, name:str) -> Any:
+    if name not in AsyncConnection.COMMANDS:
+      raise AttributeError(f'{type(self).__name__} cannot await {name!r}.')
+
+    async def run(*args, **kw) -> Any:
+      return await asyncio.to_thread(partial(getattr(self.conn, name), *args, **kw))
+    return run
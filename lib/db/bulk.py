@@ -0,0 +1,145 @@
+'''Bulk loading of log history: `worn import` reads entries from CSV, NDJSON or the output of `worn show logs --raw`.
+
+A CSV file has a header row naming its columns and an NDJSON file has an object per line, both with at (or when, time
+or timestamp), project and state, and optionally name. project is a project's name or id. An id that isn't known yet
+takes name as its name, or "Imported <id>" without one, and a name that isn't known yet gets a new project. Raw lines are
+`<timestamp id> project <id> state <state>`, as printed by `show logs --raw` or passed to `redis-cli XADD logs`.
+
+The input is streamed batch_size entries at a time, so only one batch is ever held: each batch is sorted, its missing
+projects are created in one batch, and its entries are added in one MULTI. An entry older than the last one of the
+month it falls in is skipped, since a stream only takes newer ids, and that includes the entries added by an earlier
+batch; input in time order loses none. Loading history into months logs doesn't have yet is what this is for.
+Nothing is saved before the command ends.'''
+import re, csv, json
+from itertools import chain, islice
+from datetime import datetime
+from functools import cache
+from typing import Generator, Iterable
+from uuid import uuid4, UUID
+from .. import db, isuuid, istimestamp_id, parse_timestamp, InvalidTimeE, InvalidTypeE
+
+FORMATS = ('csv', 'ndjson', 'raw')
+
+COLUMNS = {'at': 'at', 'when': 'at', 'time': 'at', 'timestamp': 'at', 'project': 'project', 'state': 'state', 'name': 'name'}
+
+RAW = re.compile(r'^(?:.*\bXADD\s+\S+\s+)?(\d+-(?:\d+|\*))\s+(.+)$')
+
+@cache
+def _seconds(at:str) -> int:
+  '''The seconds of a timestamp id, a number of seconds, an ISO 8601 time or anything else parse_timestamp takes.
+  Exports repeat a time for every stop and start at it, so each distinct one is only parsed once.'''
+  if istimestamp_id(at):
+    return int(at.split('-')[0])
+  elif at.isdigit():
+    return int(at[:10])
+
+  try:
+    return int(datetime.fromisoformat(at).timestamp())
+  except ValueError:
+    return int(parse_timestamp(at).timestamp())
+
+def sniff(line:str) -> str:
+  '''The format of the input that line is the first line of.'''
+  if line.lstrip().startswith('{'):
+    return 'ndjson'
+  elif line.startswith('cat <<') or RAW.search(line.strip()) is not None:
+    return 'raw'
+  return 'csv'
+
+def _rows(lines:Iterable, fmt:str) -> Generator:
+  match fmt:
+    case 'ndjson':
+      yield from (json.loads(line) for line in lines if len(line.strip()) > 0)
+    case 'csv':
+      yield from csv.DictReader(lines)
+    case 'raw':
+      for line in lines:
+        if (m := RAW.search(line.strip())) is not None:
+          words = m[2].split()
+          yield dict(zip(words[::2], words[1::2]), at=m[1])
+
+def read(lines:Iterable, fmt:str=None) -> Generator:
+  '''(seconds, project, state, name) of every entry in the lines of an input in the format fmt, or in the one its
+  first line looks like, read a line at a time.'''
+  assert fmt is None or fmt in FORMATS, f"{fmt=} should be one of {','.join(FORMATS)}, but isn't."
+  lines = iter(lines)
+  if (first := next(lines, None)) is None:
+    return
+
+  for n, row in enumerate(_rows(chain([first], lines), fmt or sniff(first)), 1):
+    record = {COLUMNS[_k.strip().casefold()]: str(_v).strip() for _k, _v in row.items() if isinstance(_k, str) and _k.strip().casefold() in COLUMNS and _v is not None}
+    if any(len(record.get(_, '')) == 0 for _ in ('at', 'project', 'state')):
+      raise InvalidTypeE(f"Entry {n} {row!r} should have an at, a project and a state, but hasn't.")
+    elif record['state'] not in db.STATES:
+      raise InvalidTypeE(f"Entry {n} has the state {record['state']!r}, which should be one of {', '.join(db.STATES)}.")
+
+    try:
+      at = _seconds(record['at'])
+    except (InvalidTimeE, InvalidTypeE, ValueError) as e:
+      raise InvalidTimeE(f"Entry {n} has the time {record['at']!r}, which can't be read: {e}")
+    yield at, record['project'], record['state'], record.get('name')
+
+def _projects(entries:list) -> dict:
+  '''The id of every project the entries name, creating the ones that don't exist yet in one batch.'''
+  known, names, ids, new = db.get('projects'), dict(db.get('projects:names')), {}, {}
+  for _, project, _, name in entries:
+    if project in ids:
+      continue
+    elif isuuid(project):
+      ids[project] = UUID(project)
+      if str(ids[project]) not in known:
+        new[ids[project]] = name if name and not isuuid(name) else f'Imported {ids[project]}'
+    elif (_id := names.get(project.casefold())) is not None:
+      ids[project] = UUID(_id)
+    else:
+      ids[project] = uuid4()
+      new[ids[project]], names[project.casefold()] = project, str(ids[project])
+
+  if len(new) > 0:
+    with db.batch():
+      db.add('projects', {_id: name for _id, name in new.items()}, nx=True)
+      db.add('projects:names', {name.casefold(): _id for _id, name in new.items()}, nx=True)
+      db.add('schema', db.migrations.LATEST, nx=True)
+  return ids
+
+def _lasts(months:list) -> dict:
+  '''The seconds of the last entry of each of the months logs has a partition for, in one round trip.'''
+  pointers = db.catalogued('logs')
+  if len(held := [_month for _month in months if _month in pointers]) == 0:
+    return {}
+
+  with db.reader() as conn:
+    pipe = conn.pipeline(transaction=False)
+    for _month in held:
+      pipe.xrevrange(pointers[_month], '+', '-', count=1)
+    return {_month: int(last[0][0].split('-')[0]) for _month, last in zip(held, pipe.execute()) if len(last) > 0}
+
+def _unshared(months:list) -> None:
+  '''Give logs copies of its partitions of the months that it shares with versions, so they stay as they were.'''
+  pointers, shared = db.catalogued('logs'), db.shared('logs')
+  if len(months := [_month for _month in months if pointers.get(_month) in shared]) == 0:
+    return
+
+  with db.batch() as pipe, db.reader() as conn:
+    for _month in months:
+      pipe.hset(db.catalog('logs'), _month, copy := db._copied(pipe, 'logs', _month, conn.xrange(pointers[_month])))
+      db._streams.add(copy)
+    db._touch(pipe, db.catalog('logs'))
+
+def load(records:Iterable, batch_size:int=db.PAGE_SIZE) -> tuple[int, int]:
+  '''Add the (seconds, project, state, name) records to logs, batch_size at a time, each batch oldest first and in one
+  MULTI, and return how many were added and how many were skipped for being older than the last entry of their month.'''
+  assert isinstance(batch_size, int) and batch_size > 0, f"{batch_size=} should be a positive instance of int, but isn't."
+
+  records, added, skipped = iter(records), 0, 0
+  while len(entries := sorted(islice(records, batch_size), key=lambda entry: entry[0])) > 0:
+    ids = _projects(entries)
+    lasts = _lasts(sorted(set(db.month(at) for at, _, _, _ in entries)))
+    kept = [entry for entry in entries if entry[0] >= lasts.get(db.month(entry[0]), 0)]
+    _unshared(sorted(set(db.month(at) for at, _, _, _ in kept)))
+
+    with db.batch():
+      for at, project, state, _ in kept:
+        db.add('logs', {'project': ids[project], 'state': state, 'id': f'{at}-*'})
+    added, skipped = added+len(kept), skipped+len(entries)-len(kept)
+  return added, skipped
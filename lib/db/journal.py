@@ -0,0 +1,201 @@
+'''A local, fsync'd write-ahead journal of lib.db writes, for when the server can't take them.
+
+Each line is one JSON record: the list of lib.db write calls ([op, args, kw]) that made up one batch or db.log call.
+Records are replayed in order, each as one batch, through the same lib.db functions. Stream entries keep the ids they
+were given, so a replayed start or stop keeps its original time.
+
+JOURNAL_MODE decides when writes go here instead of to the server:
+  off       never.
+  fallback  when the server is unreachable, and after that until the journal has been replayed, so nothing is
+            applied out of order.
+  always    always. Writes cost one fsync and the server is only written to by the replayer.
+
+Unless it's off, a read the server can't be reached for doesn't fail the command either: the CACHED hashes are read
+from the copy of them last loaded from the server, kept next to the journal, and the writes that follow are journaled
+straight away.'''
+import os, sys, json, fcntl
+from .. import db, debug
+
+replaying = False
+offline = False
+_remembered = None
+
+def _lock(name:str, flags:int=fcntl.LOCK_EX) -> int | None:
+  fd = os.open(f'{db.JOURNAL}.{name}', os.O_CREAT | os.O_RDWR, 0o600)
+  try:
+    fcntl.flock(fd, flags)
+  except BlockingIOError:
+    os.close(fd)
+    return None
+  return fd
+
+def _unlock(fd:int) -> None:
+  fcntl.flock(fd, fcntl.LOCK_UN)
+  os.close(fd)
+
+def _write(path:str, lines:list) -> None:
+  with open(path, 'w') as f:
+    f.writelines(lines)
+    f.flush()
+    os.fsync(f.fileno())
+
+def _taken() -> str:
+  return f'{db.JOURNAL}.replaying'
+
+def pending() -> bool:
+  '''Whether there are journaled writes waiting, including the ones a replay is working through.'''
+  return any(os.path.exists(path) and os.path.getsize(path) > 0 for path in (db.JOURNAL, _taken()))
+
+def wanted() -> bool:
+  '''Whether writes should be journaled right now instead of sent.'''
+  return not replaying and (db.JOURNAL_MODE == 'always' or (db.JOURNAL_MODE == 'fallback' and (offline or pending())))
+
+def unreachable(e:Exception) -> None:
+  '''Carry on without the server for the rest of the command, after a read couldn't reach it. Raises e when there's no
+  journal to fall back to.'''
+  global offline
+  if db.JOURNAL_MODE == 'off' or replaying:
+    raise e
+  if not offline:
+    debug(f'Unable to reach the server, journaling the writes: {e}')
+  offline = True
+
+def _cached() -> str:
+  return f'{db.JOURNAL}.cached'
+
+def _snapshot() -> dict:
+  '''{version counter: [version, {key: fields}]} of the file remember keeps, read once per journal.'''
+  global _remembered
+  if _remembered is None or _remembered[0] != _cached():
+    _remembered = (_cached(), {})
+    if os.path.exists(_cached()):
+      with open(_cached()) as f:
+        _remembered = (_cached(), json.load(f))
+  return _remembered[1]
+
+def remember(counter:str, version:str | None, hashes:dict) -> None:
+  '''Keep a copy of the CACHED hashes that share the version counter counter, as loaded at version, for when the server
+  can't be reached. It's only rewritten when the version moved.'''
+  if db.JOURNAL_MODE == 'off' or _snapshot().get(counter, [None])[0] == version:
+    return
+
+  _snapshot()[counter] = [version, hashes]
+  os.makedirs(os.path.dirname(os.path.abspath(db.JOURNAL)), exist_ok=True)
+  fd = _lock('lock')
+  try:
+    _write(f'{_cached()}.tmp', [json.dumps(_snapshot())])
+    os.replace(f'{_cached()}.tmp', _cached())
+  finally:
+    _unlock(fd)
+
+def remembered(key:str) -> dict:
+  '''The copy of the CACHED hash key kept by remember, empty when there is none.'''
+  return dict(_snapshot().get(db.CACHED[key], [None, {}])[1].get(key, {}))
+
+def append(calls:list) -> None:
+  '''Durably append one record of calls. It's on disk when this returns.'''
+  if len(calls) == 0:
+    return
+
+  os.makedirs(os.path.dirname(os.path.abspath(db.JOURNAL)), exist_ok=True)
+  line = json.dumps([[op, list(args), kw] for op, args, kw in calls]) + '\n'
+  fd = _lock('lock')
+  try:
+    journal = os.open(db.JOURNAL, os.O_CREAT | os.O_WRONLY | os.O_APPEND, 0o600)
+    try:
+      os.write(journal, line.encode())
+      os.fsync(journal)
+    finally:
+      os.close(journal)
+  finally:
+    _unlock(fd)
+
+def records() -> list:
+  lines = []
+  for path in (_taken(), db.JOURNAL):
+    if os.path.exists(path):
+      with open(path) as f:
+        lines.extend(line for line in f if line.strip() != '')
+  return [json.loads(line) for line in lines]
+
+def replay() -> int:
+  '''Apply the journaled records in order and return how many were applied. Stops at the first one the server can't
+  be reached for and keeps it and everything after it for the next replay. A record the server refuses can never
+  apply, so it is reported and dropped. Only one process replays at a time; the others return 0 straight away.'''
+  global replaying
+  if not pending() or (replayer := _lock('replay', fcntl.LOCK_EX | fcntl.LOCK_NB)) is None:
+    return 0
+
+  applied = 0
+  replaying = True
+  try:
+    while (count := _replay()) is not None:
+      applied += count
+      if not os.path.exists(db.JOURNAL):
+        break
+  finally:
+    replaying = False
+    _unlock(replayer)
+  return applied
+
+def _replay() -> int | None:
+  '''One pass of replay over the journal as it is now. None when the server could not be reached.'''
+  taken, applied, reachable = _taken(), 0, True
+
+  '''Take the journal aside, so writes made meanwhile start a new one instead of waiting for the replay.'''
+  fd = _lock('lock')
+  try:
+    if os.path.exists(db.JOURNAL) and not os.path.exists(taken):
+      os.rename(db.JOURNAL, taken)
+  finally:
+    _unlock(fd)
+
+  lines = []
+  if os.path.exists(taken):
+    with open(taken) as f:
+      lines = [line for line in f if line.strip() != '']
+
+  while len(lines) > 0:
+    try:
+      with db.batch():
+        for op, args, kw in json.loads(lines[0]):
+          getattr(db, op)(*args, **kw)
+      applied += 1
+    except db.backend().ConnectionError as e:
+      debug(f'Unable to replay the journal, {len(lines)} records left: {e}')
+      reachable = False
+      break
+    except (db.backend().ResponseError, AssertionError) as e:
+      print(f'Dropping the journaled write {lines[0].strip()}: {e}', file=sys.stderr)
+    lines.pop(0)
+    _write(taken, lines)
+
+  '''Whatever is left goes back in front of anything journaled meanwhile.'''
+  fd = _lock('lock')
+  try:
+    if len(lines) > 0:
+      if os.path.exists(db.JOURNAL):
+        with open(db.JOURNAL) as f:
+          lines.extend(f.readlines())
+      _write(taken, lines)
+      os.rename(taken, db.JOURNAL)
+    elif os.path.exists(taken):
+      os.unlink(taken)
+  finally:
+    _unlock(fd)
+  return applied if reachable else None
+
+def drain() -> None:
+  '''Replay a pending journal in a detached child, so the command that wrote it can exit right away.'''
+  if replaying or not pending():
+    return
+
+  if not hasattr(os, 'fork'):
+    replay()
+  elif os.fork() == 0:
+    try:
+      os.setsid()
+      db._backend = None
+      replay()
+    finally:
+      os._exit(0)
@@ -0,0 +1,64 @@
+-- Append an entry to a logs stream unless it is older than the last one, checked and written in one round trip.
+-- See lib.db.append and lib.db.scripts.append.
+--
+-- The entry goes in the partition the catalog points at for its month, or logs:YYYY-MM when the month is new, and in
+-- the index of its project in that partition, with the same id. The last id is the newest partition's.
+--
+-- KEYS: the logs stream, its catalog, the catalog version counter
+-- ARGV: the entry's id ('<seconds>-<seq>' or '<seconds>-*'), its month, its project id, the number of consumer groups,
+--       the groups..., then the entry's fields and values, already encoded
+local logs, catalog, catalog_version = KEYS[1], KEYS[2], KEYS[3]
+local id, month, project = ARGV[1], ARGV[2], ARGV[3]
+local ngroups = tonumber(ARGV[4])
+
+-- The partition a month of the catalog is kept in.
+local function resolved(m, pointer)
+  if not pointer or pointer == '1' then return logs .. ':' .. m end
+  return pointer
+end
+local partition = resolved(month, redis.call('HGET', catalog, month))
+
+local fields = {}
+for i = 5+ngroups, #ARGV do
+  table.insert(fields, ARGV[i])
+end
+
+local function field(entries, name)
+  for i = 1, #entries, 2 do
+    if entries[i] == name then return entries[i+1] end
+  end
+  return nil
+end
+
+local pointers = redis.call('HGETALL', catalog)
+local months = {}
+for i = 1, #pointers, 2 do
+  table.insert(months, pointers[i])
+end
+table.sort(months)
+
+local last_id = nil
+for i = #months, 1, -1 do
+  local newest = resolved(months[i], field(pointers, months[i]))
+  if redis.call('EXISTS', newest) == 1 then
+    last_id = field(redis.call('XINFO', 'STREAM', newest), 'last-generated-id')
+    break
+  end
+end
+last_id = last_id or '0-0'
+if tonumber(string.match(id, '^(%d+)')) < tonumber(string.match(last_id, '^(%d+)')) then
+  return {last_id, ''}
+end
+
+local sid = redis.call('XADD', partition, id, unpack(fields))
+if project ~= '' then
+  redis.call('XADD', partition .. ':project:' .. project, sid, unpack(fields))
+  redis.call('HSETNX', partition .. ':projects', project, '1')
+end
+if redis.call('HSETNX', catalog, month, '1') == 1 then
+  redis.call('INCR', catalog_version)
+end
+for i = 5, 4+ngroups do
+  redis.pcall('XGROUP', 'CREATE', partition, ARGV[i], '$', 'ENTRIESREAD', 0)
+end
+return {last_id, sid}
@@ -0,0 +1,16 @@
+-- The handle compact logs entries store for a project, registering the next one if it has none yet.
+-- See lib.db.handle and lib.db.scripts.handle.
+--
+-- KEYS: handles, handles:ids, the next handle counter, the handles version counter
+-- ARGV: project id
+local handles, ids, next_handle, version = KEYS[1], KEYS[2], KEYS[3], KEYS[4]
+local project = ARGV[1]
+
+local handle = redis.call('HGET', ids, project)
+if not handle then
+  handle = tostring(redis.call('INCR', next_handle))
+  redis.call('HSET', handles, handle, project)
+  redis.call('HSET', ids, project, handle)
+  redis.call('INCR', version)
+end
+return handle
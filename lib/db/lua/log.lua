@@ -0,0 +1,131 @@
+-- Append a state change to the logs stream atomically, in one round trip. See lib.db.log and lib.db.scripts.log.
+--
+-- The entries go in the partition the catalog points at for at's month, or logs:YYYY-MM when the month is new, and
+-- in the index of their project in that partition, with the same ids. The last id and the running project come from
+-- the newest partitions.
+--
+-- KEYS: logs, its catalog, the catalog version counter, projects, projects:names, the projects version counter,
+--       begun, schema, handles, handles:ids, the next handle counter, the handles version counter
+-- ARGV: state, project id (or '' to stop whichever project is running), at (seconds), at's month, begun value (or ''),
+--       the project's name and its casefolded form to register when starting (or ''), the schema version they are
+--       registered in, the encoding to write entries in ('plain' or 'compact'), the number of consumer groups, the
+--       groups...
+local logs, catalog, catalog_version = KEYS[1], KEYS[2], KEYS[3]
+local projects, names, version, begun, schema = KEYS[4], KEYS[5], KEYS[6], KEYS[7], KEYS[8]
+local handles, ids, next_handle, handles_version = KEYS[9], KEYS[10], KEYS[11], KEYS[12]
+local state, project, at, month = ARGV[1], ARGV[2], ARGV[3], ARGV[4]
+local name, folded = ARGV[6], ARGV[7]
+local compact = ARGV[9] == 'compact'
+local ngroups = tonumber(ARGV[10])
+
+-- The partition a month of the catalog is kept in.
+local function resolved(m, pointer)
+  if not pointer or pointer == '1' then return logs .. ':' .. m end
+  return pointer
+end
+local partition = resolved(month, redis.call('HGET', catalog, month))
+
+local function field(fields, name)
+  for i = 1, #fields, 2 do
+    if fields[i] == name then return fields[i+1] end
+  end
+  return nil
+end
+
+-- The project and state of an entry in either encoding.
+local function decoded(fields)
+  local handle = field(fields, 'p')
+  if handle == nil then
+    return field(fields, 'project'), field(fields, 'state')
+  end
+
+  local s = 'stopped'
+  if field(fields, 's') == '1' then s = 'started' end
+  return redis.call('HGET', handles, handle), s
+end
+
+-- The fields of a new entry in the encoding asked for, registering the project's handle if it has none yet.
+local function encoded(id, s)
+  if not compact then
+    return {'project', id, 'state', s}
+  end
+
+  local handle = redis.call('HGET', ids, id)
+  if not handle then
+    handle = tostring(redis.call('INCR', next_handle))
+    redis.call('HSET', handles, handle, id)
+    redis.call('HSET', ids, id, handle)
+    redis.call('INCR', handles_version)
+  end
+  if s == 'started' then return {'p', handle, 's', '1'} end
+  return {'p', handle, 's', '0'}
+end
+
+-- Append an entry for id to the partition and to id's index in it.
+local function appended(id, s)
+  local fields = encoded(id, s)
+  local sid = redis.call('XADD', partition, at .. '-*', unpack(fields))
+  redis.call('XADD', partition .. ':project:' .. id, sid, unpack(fields))
+  redis.call('HSETNX', partition .. ':projects', id, '1')
+  return sid
+end
+
+-- The last id is the newest partition's, the last entry the newest one left in any partition.
+local pointers = redis.call('HGETALL', catalog)
+local months = {}
+for i = 1, #pointers, 2 do
+  table.insert(months, pointers[i])
+end
+table.sort(months)
+
+local last_id, last = nil, nil
+for i = #months, 1, -1 do
+  local newest = resolved(months[i], field(pointers, months[i]))
+  if redis.call('EXISTS', newest) == 1 then
+    if last_id == nil then
+      last_id = field(redis.call('XINFO', 'STREAM', newest), 'last-generated-id')
+    end
+    last = redis.call('XREVRANGE', newest, '+', '-', 'COUNT', 1)[1]
+    if last ~= nil then break end
+  end
+end
+last_id = last_id or '0-0'
+if tonumber(at) < tonumber(string.match(last_id, '^(%d+)')) then
+  return {last_id, '', ''}
+end
+
+local running = nil
+if last ~= nil then
+  local last_project, last_state = decoded(last[2])
+  if last_state == 'started' and last_project then running = last_project end
+end
+
+local stopped, started = '', ''
+if state == 'started' then
+  if running ~= nil then
+    stopped = appended(running, 'stopped')
+  end
+
+  if ARGV[5] ~= '' then
+    redis.call('SET', begun, ARGV[5], 'NX', 'EX', 3600)
+  end
+  if name ~= '' then
+    redis.call('HSETNX', projects, project, name)
+    redis.call('HSETNX', names, folded, project)
+    redis.call('SET', schema, ARGV[8], 'NX')
+    redis.call('INCR', version)
+  end
+  started = appended(project, 'started')
+elseif running ~= nil and (project == '' or running == project) then
+  stopped = appended(running, 'stopped')
+end
+
+if stopped ~= '' or started ~= '' then
+  if redis.call('HSETNX', catalog, month, '1') == 1 then
+    redis.call('INCR', catalog_version)
+  end
+  for i = 11, 10+ngroups do
+    redis.pcall('XGROUP', 'CREATE', partition, ARGV[i], '$', 'ENTRIESREAD', 0)
+  end
+end
+return {last_id, stopped, started}
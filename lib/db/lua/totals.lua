@@ -0,0 +1,71 @@
+-- Sum the seconds logged per project without sending the entries back. See lib.db.totals and lib.db.scripts.totals.
+--
+-- Starts and stops are paired in stream order, just as Report._collate pairs them, and each stop is credited to its
+-- own project. The streams are either the partitions of logs, where a start can be paired with a stop in the next
+-- one, or the indexes of some projects in those partitions, each project paired on its own.
+--
+-- KEYS: handles, then the streams to read: logs partitions, oldest first (see lib.db.partitions), or project indexes
+-- ARGV: start id, end id, page size, and a 1 or 0 per stream: 1 to carry an unpaired start over into it from the
+--       stream before, 0 not to.
+-- Returns project id, seconds, ... in the order each project was first seen.
+local handles = KEYS[1]
+local finish, size, carried = ARGV[2], tonumber(ARGV[3]), ARGV[4]
+
+local function field(fields, name)
+  for i = 1, #fields, 2 do
+    if fields[i] == name then return fields[i+1] end
+  end
+  return nil
+end
+
+-- The project and state of an entry in either encoding, resolving each handle once.
+local resolved = {}
+local function decoded(fields)
+  local handle = field(fields, 'p')
+  if handle == nil then
+    return field(fields, 'project'), field(fields, 'state')
+  end
+
+  if resolved[handle] == nil then
+    resolved[handle] = redis.call('HGET', handles, handle)
+  end
+  if field(fields, 's') == '1' then return resolved[handle], 'started' end
+  return resolved[handle], 'stopped'
+end
+
+local totals, order, begun = {}, {}, nil
+for k = 2, #KEYS do
+  local start = ARGV[1]
+  if string.sub(carried, k-1, k-1) ~= '1' then begun = nil end
+  while true do
+    local page = redis.call('XRANGE', KEYS[k], start, finish, 'COUNT', size)
+    for _, entry in ipairs(page) do
+      local project, state = decoded(entry[2])
+      if project ~= nil and project ~= false then
+        if totals[project] == nil then
+          totals[project] = 0
+          table.insert(order, project)
+        end
+
+        local at = tonumber(string.match(entry[1], '^(%d+)'))
+        if state == 'started' then
+          begun = at
+        elseif begun ~= nil then
+          totals[project] = totals[project] + at - begun
+          begun = nil
+        end
+      end
+    end
+
+    if #page < size then break end
+    local ms, seq = string.match(page[#page][1], '^(%d+)-(%d+)$')
+    start = ms .. '-' .. (tonumber(seq) + 1)
+  end
+end
+
+local result = {}
+for _, project in ipairs(order) do
+  table.insert(result, project)
+  table.insert(result, totals[project])
+end
+return result
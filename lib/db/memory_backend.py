@@ -0,0 +1,279 @@
+'''Keeps every key in this process's memory. Nothing is persisted, so it suits tests and benchmarks, not real use.
+
+Like a Redis MULTI/EXEC, a failing command in a batch does not undo the commands applied before it.'''
+import re, time
+from bisect import bisect_left, bisect_right
+from threading import RLock
+from contextlib import contextmanager
+from typing import Any, Generator
+from .backend import Backend, Connection, ResponseError, format_id, lower_bound, upper_bound, next_id, wrongtype
+
+class Stream(object):
+  def __init__(self):
+    self.ids = []
+    self.entries = {}
+    self.last = (0, 0)
+    self.added = 0
+    self.groups = {}
+
+class MemoryBackend(Backend):
+  name = 'memory'
+  OPTIONS = {}
+
+  def __init__(self, **options):
+    super().__init__(**options)
+    self.lock = RLock()
+    self.flush()
+
+  def flush(self) -> None:
+    with self.lock:
+      self.data = {}
+      self.kinds = {}
+      self.expires = {}
+      self.changes = 0
+
+  def connection(self) -> Connection:
+    return MemoryConnection(self)
+
+class MemoryConnection(Connection):
+  def __init__(self, backend:MemoryBackend):
+    self.backend = backend
+
+  @contextmanager
+  def atomic(self) -> Generator:
+    with self.backend.lock:
+      yield self
+
+  def _kind(self, key:str) -> str | None:
+    if key in self.backend.expires and self.backend.expires[key] <= time.time():
+      self._drop(key)
+    return self.backend.kinds.get(key)
+
+  def _expect(self, key:str, kind:str) -> Any:
+    if (_kind := self._kind(key)) not in (None, kind):
+      raise wrongtype()
+    return None if _kind is None else self.backend.data[key]
+
+  def _create(self, key:str, kind:str) -> Any:
+    if (value := self._expect(key, kind)) is None:
+      value = self.backend.data[key] = {'hash': dict, 'stream': Stream}[kind]()
+      self.backend.kinds[key] = kind
+    self.backend.changes += 1
+    return value
+
+  def _drop(self, key:str) -> bool:
+    self.backend.expires.pop(key, None)
+    self.backend.kinds.pop(key, None)
+    return self.backend.data.pop(key, None) is not None
+
+  def type(self, name:str) -> str:
+    with self.atomic():
+      return self._kind(name) or 'none'
+
+  def exists(self, *names) -> int:
+    with self.atomic():
+      return sum(1 for name in names if self._kind(name) is not None)
+
+  def get(self, name:str) -> str | None:
+    with self.atomic():
+      return self._expect(name, 'string')
+
+  def set(self, name:str, value:Any, ex:int=None, nx:bool=False) -> bool | None:
+    with self.atomic():
+      if self._kind(name) is not None:
+        if nx:
+          return None
+        self._drop(name)
+
+      self.backend.data[name] = str(value)
+      self.backend.kinds[name] = 'string'
+      if ex is not None:
+        self.backend.expires[name] = time.time()+ex
+      self.backend.changes += 1
+      return True
+
+  def incr(self, name:str, amount:int=1) -> int:
+    with self.atomic():
+      if (value := self._expect(name, 'string')) is None:
+        value = '0'
+      elif re.search(r'^-?\d+$', value) is None:
+        raise ResponseError('ERR value is not an integer or out of range')
+
+      self.backend.data[name] = str(int(value)+amount)
+      self.backend.kinds[name] = 'string'
+      self.backend.changes += 1
+      return int(value)+amount
+
+  def delete(self, *names) -> int:
+    with self.atomic():
+      self.backend.changes += 1
+      return sum(1 for name in names if self._kind(name) is not None and self._drop(name))
+
+  def rename(self, src:str, dst:str) -> bool:
+    with self.atomic():
+      if (kind := self._kind(src)) is None:
+        raise ResponseError('ERR no such key')
+
+      if src != dst:
+        expires = self.backend.expires.pop(src, None)
+        data = self.backend.data.pop(src)
+        self._drop(src)
+        self._drop(dst)
+        self.backend.data[dst], self.backend.kinds[dst] = data, kind
+        if expires is not None:
+          self.backend.expires[dst] = expires
+      self.backend.changes += 1
+      return True
+
+  def hget(self, name:str, key:str) -> str | None:
+    with self.atomic():
+      return (self._expect(name, 'hash') or {}).get(key)
+
+  def hgetall(self, name:str) -> dict:
+    with self.atomic():
+      return dict(self._expect(name, 'hash') or {})
+
+  def hkeys(self, name:str) -> list:
+    with self.atomic():
+      return list(self._expect(name, 'hash') or {})
+
+  def hexists(self, name:str, key:str) -> bool:
+    with self.atomic():
+      return key in (self._expect(name, 'hash') or {})
+
+  def hset(self, name:str, key:str=None, value:Any=None, mapping:dict=None) -> int:
+    items = dict(mapping or {})
+    if key is not None:
+      items[key] = value
+
+    with self.atomic():
+      fields = self._create(name, 'hash')
+      added = len(set(map(str, items)).difference(fields))
+      fields.update((str(_k), str(_v)) for _k, _v in items.items())
+      return added
+
+  def hsetnx(self, name:str, key:str, value:Any) -> int:
+    with self.atomic():
+      fields = self._create(name, 'hash')
+      if str(key) in fields:
+        return 0
+      fields[str(key)] = str(value)
+      return 1
+
+  def hdel(self, name:str, *keys) -> int:
+    with self.atomic():
+      if (fields := self._expect(name, 'hash')) is None:
+        return 0
+
+      removed = sum(1 for key in keys if fields.pop(str(key), None) is not None)
+      if len(fields) == 0:
+        self._drop(name)
+      self.backend.changes += 1
+      return removed
+
+  def xadd(self, name:str, fields:dict, id:str='*') -> str:
+    with self.atomic():
+      stream = self._expect(name, 'stream') or Stream()
+      sid = next_id(stream.last, str(id))
+      stream = self._create(name, 'stream')
+      stream.ids.append(sid)
+      stream.entries[sid] = {str(k): str(v) for k, v in fields.items()}
+      stream.last = sid
+      stream.added += 1
+      return format_id(sid)
+
+  def xdel(self, name:str, *ids) -> int:
+    with self.atomic():
+      if (stream := self._expect(name, 'stream')) is None:
+        return 0
+
+      removed = 0
+      for sid in map(lower_bound, ids):
+        if stream.entries.pop(sid, None) is not None:
+          del stream.ids[bisect_left(stream.ids, sid)]
+          removed += 1
+      self.backend.changes += 1
+      return removed
+
+  def xtrim(self, name:str, minid:str, approximate:bool=True) -> int:
+    '''Only the MINID strategy, which is all lib.db uses.'''
+    with self.atomic():
+      if (stream := self._expect(name, 'stream')) is None:
+        return 0
+
+      trimmed = stream.ids[:bisect_left(stream.ids, lower_bound(minid))]
+      for sid in trimmed:
+        del stream.entries[sid]
+      del stream.ids[:len(trimmed)]
+      self.backend.changes += 1
+      return len(trimmed)
+
+  def _range(self, name:str, start:str, end:str, count:int, reverse:bool) -> list:
+    with self.atomic():
+      if (stream := self._expect(name, 'stream')) is None:
+        return []
+
+      ids = stream.ids[bisect_left(stream.ids, lower_bound(start)):bisect_right(stream.ids, upper_bound(end))]
+      if reverse:
+        ids.reverse()
+      return [(format_id(sid), dict(stream.entries[sid])) for sid in ids[:count]]
+
+  def xrange(self, name:str, min:str='-', max:str='+', count:int=None) -> list:
+    return self._range(name, min, max, count, False)
+
+  def xrevrange(self, name:str, max:str='+', min:str='-', count:int=None) -> list:
+    return self._range(name, min, max, count, True)
+
+  def xinfo_stream(self, name:str) -> dict:
+    with self.atomic():
+      if (stream := self._expect(name, 'stream')) is None:
+        raise ResponseError('ERR no such key')
+
+      return {
+        'length':            len(stream.ids),
+        'last-generated-id': format_id(stream.last),
+        'entries-added':     stream.added,
+        'groups':            len(stream.groups),
+        'first-entry':       (format_id(stream.ids[0]), dict(stream.entries[stream.ids[0]])) if stream.ids else None,
+        'last-entry':        (format_id(stream.ids[-1]), dict(stream.entries[stream.ids[-1]])) if stream.ids else None,
+      }
+
+  def xinfo_groups(self, name:str) -> list:
+    with self.atomic():
+      if (stream := self._expect(name, 'stream')) is None:
+        raise ResponseError('ERR no such key')
+      return [dict(group, name=group_name) for group_name, group in sorted(stream.groups.items())]
+
+  def xgroup_create(self, name:str, groupname:str, id:str='$', mkstream:bool=False, entries_read:int=None) -> bool:
+    with self.atomic():
+      if self._expect(name, 'stream') is None and not mkstream:
+        raise ResponseError('ERR The XGROUP subcommand requires the key to exist. Note that for CREATE you may want to use the MKSTREAM option to create an empty stream automatically.')
+
+      stream = self._create(name, 'stream')
+      if groupname in stream.groups:
+        raise ResponseError('BUSYGROUP Consumer Group name already exists')
+
+      stream.groups[groupname] = {'consumers': 0, 'pending': 0, 'last-delivered-id': format_id(stream.last) if id == '$' else id, 'entries-read': entries_read, 'lag': None}
+      return True
+
+  def save(self) -> bool:
+    self.backend.changes = 0
+    return True
+
+  def bgsave(self, schedule:bool=True) -> bool:
+    return self.save()
+
+  def info(self, section:str=None) -> dict:
+    return {'rdb_changes_since_last_save': self.backend.changes}
+
+  def memory_usage(self, key:str, samples:int=None) -> int | None:
+    '''Roughly what the key holds: the length of its name and of its text, plus 16 bytes per stream id.'''
+    with self.atomic():
+      if self._kind(key) is None:
+        return None
+
+      match value := self.backend.data[key]:
+        case str():    size = len(value)
+        case dict():   size = sum(len(_k) + len(_v) for _k, _v in value.items())
+        case Stream(): size = sum(16 + sum(len(_k) + len(_v) for _k, _v in fields.items()) for fields in value.entries.values())
+      return len(key) + size
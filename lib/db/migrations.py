@@ -0,0 +1,104 @@
+'''Versioned changes to the layout of the keys, applied in order by `worn migrate`.
+
+The schema key holds the version a database is at. A database without it is at version 0, unless it has no projects
+yet, in which case there is nothing to migrate and it is already at LATEST. Each migration works in batches of
+batch_size fields, each batch one db.batch(), and only moves what is still left to move, so an interrupted migration
+picks up where it stopped when it is run again. schema is only raised once a migration has finished.'''
+from typing import Any, Callable
+from .. import db, isuuid
+from .backend import parse_id
+
+MIGRATIONS = []
+
+def migration(version:int, description:str) -> Callable:
+  def register(step:Callable) -> Callable:
+    MIGRATIONS.append((version, description, step))
+    MIGRATIONS.sort(key=lambda m: m[0])
+    return step
+  return register
+
+def version() -> int:
+  if (current := db.get('schema')) is not None:
+    return int(current)
+  return LATEST if not db.has('projects') else 0
+
+def pending() -> list:
+  current = version()
+  return [m for m in MIGRATIONS if m[0] > current]
+
+def migrate(batch_size:int=db.PAGE_SIZE, *, echo:Callable=print) -> int:
+  '''Apply every pending migration and return the version the database is at.'''
+  assert isinstance(batch_size, int) and batch_size > 0, f"{batch_size=} should be a positive instance of int, but isn't."
+
+  current = version()
+  for _version, description, step in pending():
+    echo(f'Migrating to version {_version}: {description}')
+    step(batch_size)
+    db.add('schema', str(_version))
+    current = _version
+  return current
+
+@migration(1, 'Move the name -> id entries out of projects and into projects:names.')
+def split_projects(batch_size:int) -> None:
+  '''projects is read once, and each batch moves the next batch_size of its name fields.'''
+  names = [(name, pid) for name, pid in db.get('projects').items() if not isuuid(name)]
+  for i in range(0, len(names), batch_size):
+    with db.batch():
+      for name, pid in names[i:i+batch_size]:
+        db.add('projects:names', {name: pid}, nx=True)
+        db.rm('projects', name)
+
+@migration(2, 'Split logs and its versions into monthly partitions.')
+def partition_logs(batch_size:int) -> None:
+  '''Each batch moves the oldest entries left in a stream to their partitions, keeping their ids, and deletes them
+  from it. The emptied stream is deleted last.'''
+  with db.connection() as conn:
+    for key in db._versioned():
+      if conn.exists(key) == 0:
+        continue
+
+      while len(page := conn.xrange(key, '-', '+', count=batch_size)) > 0:
+        pipe = conn.pipeline(transaction=True)
+        for sid, fields in page:
+          pipe.xadd(f'{key}:{db.month(sid)}', fields, id=sid)
+          pipe.hsetnx(db.catalog(key), db.month(sid), '1')
+          pipe.xdel(key, sid)
+        db._touch(pipe, db.catalog(key))
+        pipe.execute()
+      conn.delete(key)
+
+      for partition in db.partitions(key):
+        db._groups(conn, partition)
+  db.invalidate()
+
+def _copied(conn:Any, partition:str, batch_size:int) -> None:
+  '''Copy the entries of the partition to the indexes of their projects in it, with the same ids, skipping the ones at
+  or before the last id an index already holds.'''
+  last, start = {}, '-'
+  while len(page := conn.xrange(partition, start, '+', count=batch_size)) > 0:
+    pipe = conn.pipeline(transaction=True)
+    for sid, fields in page:
+      if (project := db.decode(fields).get('project')) is None:
+        continue
+      if project not in last:
+        last[project] = [parse_id(_sid) for _sid, _ in conn.xrevrange(db.index(partition, project), '+', '-', count=1)][:1]
+      if len(last[project]) == 0 or parse_id(sid) > last[project][0]:
+        pipe.xadd(db.index(partition, project), fields, id=sid)
+        pipe.hsetnx(db.indexed(partition), project, '1')
+    pipe.execute()
+
+    ms, seq = page[-1][0].split('-')
+    start = f'{ms}-{int(seq)+1}'
+
+@migration(3, 'Index the partitions of logs and its versions by project.')
+def index_partitions(batch_size:int) -> None:
+  '''Each batch copies the next entries of a partition to the indexes of their projects in it, so that versions can
+  share partitions along with their indexes. Entries at or before the last one an index already holds were copied by
+  an earlier run, and are skipped.'''
+  with db.connection() as conn:
+    for key in db._versioned():
+      for partition in db.partitions(key):
+        _copied(conn, partition, batch_size)
+  db.invalidate()
+
+LATEST = MIGRATIONS[-1][0]
@@ -0,0 +1,97 @@
+import os, redis, asyncio
+import redis.asyncio
+from typing import Callable
+from .backend import Backend
+
+class RedisBackend(Backend):
+  '''A Redis server, shared through one process-wide connection pool, plus one that leaves replies undecoded.
+  Replies are parsed by hiredis when it is installed.
+
+  url takes any redis-py URL: redis://host:port/db, rediss:// or unix:///path/to/redis.sock?db=N. Whatever the url
+  sets wins over the other options. replica_url, in the same form, points read_connection() at a read replica.'''
+  name = 'redis'
+  OPTIONS = dict(url=None, replica_url=None, db=0, max_connections=16, socket_timeout=5.0, socket_connect_timeout=2.0, socket_keepalive=True, health_check_interval=30)
+  ENVIRON = dict(url='WORN_REDIS_URL', replica_url='WORN_REDIS_REPLICA_URL', db='WORN_REDIS_DB')
+  TCP_ONLY = ('socket_keepalive',)
+  ResponseError = redis.exceptions.ResponseError
+  ConnectionError = (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError)
+
+  def __init__(self, **options):
+    super().__init__(**options)
+    self._pool = None
+    self._raw_pool = None
+    self._replica_pools = {}
+    self._apool = None
+    self._aloop = None
+    self._scripts = {}
+
+  def _connect(self, pool:type, *, replica:bool=False, **kw) -> redis.ConnectionPool | redis.asyncio.ConnectionPool:
+    options = dict(self.options, **kw)
+    url, replica_url = options.pop('url'), options.pop('replica_url')
+    if replica:
+      url = replica_url
+
+    if url is None:
+      return pool(**options)
+
+    if url.startswith('unix:'):
+      for name in RedisBackend.TCP_ONLY:
+        options.pop(name)
+    return pool.from_url(url, **options)
+
+  @property
+  def pool(self) -> redis.ConnectionPool:
+    if self._pool is None:
+      self._pool = self._connect(redis.ConnectionPool, encoding="utf-8", decode_responses=True)
+    return self._pool
+
+  @property
+  def raw_pool(self) -> redis.ConnectionPool:
+    if self._raw_pool is None:
+      self._raw_pool = self._connect(redis.ConnectionPool)
+    return self._raw_pool
+
+  def replica_pool(self, *, raw:bool=False) -> redis.ConnectionPool:
+    if raw not in self._replica_pools:
+      self._replica_pools[raw] = self._connect(redis.ConnectionPool, replica=True) if raw else self._connect(redis.ConnectionPool, replica=True, encoding="utf-8", decode_responses=True)
+    return self._replica_pools[raw]
+
+  @property
+  def apool(self) -> redis.asyncio.ConnectionPool:
+    '''The asyncio pool of the running event loop. Its connections can't outlive their loop, so a new loop gets a new pool.'''
+    if self._apool is None or self._aloop is not asyncio.get_running_loop():
+      self._apool = self._connect(redis.asyncio.ConnectionPool, encoding="utf-8", decode_responses=True)
+      self._aloop = asyncio.get_running_loop()
+    return self._apool
+
+  def connection(self) -> redis.StrictRedis:
+    return redis.StrictRedis(connection_pool=self.pool)
+
+  def raw_connection(self) -> redis.StrictRedis:
+    return redis.StrictRedis(connection_pool=self.raw_pool)
+
+  def read_connection(self, *, raw:bool=False) -> redis.StrictRedis:
+    if self.options['replica_url'] is None:
+      return super().read_connection(raw=raw)
+    return redis.StrictRedis(connection_pool=self.replica_pool(raw=raw))
+
+  def aconnection(self) -> redis.asyncio.StrictRedis:
+    return redis.asyncio.StrictRedis(connection_pool=self.apool)
+
+  def script(self, name:str) -> Callable:
+    '''lib/db/lua/<name>.lua, sent by EVALSHA and loaded into the server's script cache the first time it's missing.'''
+    if name not in self._scripts:
+      with open(os.path.join(os.path.dirname(__file__), 'lua', f'{name}.lua')) as f:
+        self._scripts[name] = self.connection().register_script(f.read())
+
+    def run(conn:redis.StrictRedis, keys:list, args:list) -> list:
+      return self._scripts[name](keys=keys, args=args, client=conn)
+    return run
+
+  def close(self) -> None:
+    for pool in (self._pool, self._raw_pool, *self._replica_pools.values()):
+      if pool is not None:
+        pool.disconnect()
+    self._pool = self._raw_pool = None
+    self._replica_pools = {}
+    self._apool = self._aloop = None
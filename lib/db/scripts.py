@@ -0,0 +1,147 @@
+'''Python versions of the server-side scripts in lib/db/lua, for backends that can't run Lua.
+
+Each takes a Connection and the same KEYS and ARGV as its script, and is run inside Connection.atomic() by
+Backend.script, so it is just as atomic as the script is on Redis.'''
+from .backend import Connection
+
+def _decoded(conn:Connection, handles:str, fields:dict) -> tuple:
+  '''The project and state of an entry in either encoding.'''
+  if (_handle := fields.get('p')) is None:
+    return fields.get('project'), fields.get('state')
+  return conn.hget(handles, _handle), 'started' if fields.get('s') == '1' else 'stopped'
+
+def _resolved(logs:str, month:str, pointer:str | None) -> str:
+  '''The partition a month of the catalog is kept in.'''
+  return f'{logs}:{month}' if pointer in (None, '1') else pointer
+
+def handle(conn:Connection, keys:list, args:list) -> str:
+  '''See lib/db/lua/handle.lua.'''
+  handles, ids, next_handle, version = keys
+  project, = args
+
+  if (_handle := conn.hget(ids, project)) is None:
+    _handle = str(conn.incr(next_handle))
+    conn.hset(handles, _handle, project)
+    conn.hset(ids, project, _handle)
+    conn.incr(version)
+  return _handle
+
+def log(conn:Connection, keys:list, args:list) -> list:
+  '''See lib/db/lua/log.lua.'''
+  logs, catalog, catalog_version, projects, names, version, begun, schema, handles, ids, next_handle, handles_version = keys
+  state, project, at, month, begun_at, name, folded, layout, encoding, ngroups = args[:10]
+  groups = args[10:10+int(ngroups)]
+  pointers = conn.hgetall(catalog)
+  partition = _resolved(logs, month, pointers.get(month))
+
+  def encoded(_project:str, _state:str) -> dict:
+    if encoding != 'compact':
+      return {'project': _project, 'state': _state}
+    return {'p': handle(conn, [handles, ids, next_handle, handles_version], [_project]), 's': '1' if _state == 'started' else '0'}
+
+  def appended(_project:str, _state:str) -> str:
+    fields = encoded(_project, _state)
+    sid = conn.xadd(partition, fields, id=f'{at}-*')
+    conn.xadd(f'{partition}:project:{_project}', fields, id=sid)
+    conn.hsetnx(f'{partition}:projects', _project, '1')
+    return sid
+
+  last_id = last = None
+  for _month in sorted(pointers, reverse=True):
+    if conn.exists(newest := _resolved(logs, _month, pointers[_month])) == 1:
+      if last_id is None:
+        last_id = conn.xinfo_stream(newest)['last-generated-id']
+      if len(last := conn.xrevrange(newest, '+', '-', count=1)) > 0:
+        break
+  last_id = last_id or '0-0'
+  if int(at) < int(last_id.split('-')[0]):
+    return [last_id, '', '']
+
+  running = None
+  if last:
+    last_project, last_state = _decoded(conn, handles, last[0][1])
+    if last_state == 'started':
+      running = last_project
+
+  stopped = started = ''
+  if state == 'started':
+    if running is not None:
+      stopped = appended(running, 'stopped')
+
+    if begun_at != '':
+      conn.set(begun, begun_at, nx=True, ex=3600)
+    if name != '':
+      conn.hsetnx(projects, project, name)
+      conn.hsetnx(names, folded, project)
+      conn.set(schema, layout, nx=True)
+      conn.incr(version)
+    started = appended(project, 'started')
+  elif running is not None and project in ('', running):
+    stopped = appended(running, 'stopped')
+
+  if stopped != '' or started != '':
+    if conn.hsetnx(catalog, month, '1'):
+      conn.incr(catalog_version)
+    for group in set(groups).difference(_.get('name') for _ in conn.xinfo_groups(partition)):
+      conn.xgroup_create(partition, group, entries_read=0)
+  return [last_id, stopped, started]
+
+def append(conn:Connection, keys:list, args:list) -> list:
+  '''See lib/db/lua/append.lua.'''
+  logs, catalog, catalog_version = keys
+  sid, month, project, ngroups = args[:4]
+  groups = args[4:4+int(ngroups)]
+  flat = args[4+int(ngroups):]
+  fields = dict(zip(flat[::2], flat[1::2]))
+  pointers = conn.hgetall(catalog)
+  partition = _resolved(logs, month, pointers.get(month))
+
+  last_id = None
+  for _month in sorted(pointers, reverse=True):
+    if conn.exists(newest := _resolved(logs, _month, pointers[_month])) == 1:
+      last_id = conn.xinfo_stream(newest)['last-generated-id']
+      break
+  last_id = last_id or '0-0'
+  if int(sid.split('-')[0]) < int(last_id.split('-')[0]):
+    return [last_id, '']
+
+  sid = conn.xadd(partition, fields, id=sid)
+  if project != '':
+    conn.xadd(f'{partition}:project:{project}', fields, id=sid)
+    conn.hsetnx(f'{partition}:projects', project, '1')
+  if conn.hsetnx(catalog, month, '1'):
+    conn.incr(catalog_version)
+  for group in set(groups).difference(_.get('name') for _ in conn.xinfo_groups(partition)):
+    conn.xgroup_create(partition, group, entries_read=0)
+  return [last_id, sid]
+
+def totals(conn:Connection, keys:list, args:list) -> list:
+  '''See lib/db/lua/totals.lua.'''
+  handles, *streams = keys
+  size, carried = int(args[2]), args[3]
+
+  totals, begun = {}, None
+  for stream, carry in zip(streams, carried):
+    start, end = args[0], args[1]
+    if carry != '1':
+      begun = None
+    while True:
+      page = conn.xrange(stream, start, end, count=size)
+      for tid, fields in page:
+        project, state = _decoded(conn, handles, fields)
+        if project is None:
+          continue
+
+        totals.setdefault(project, 0)
+        at = int(tid.split('-')[0])
+        if state == 'started':
+          begun = at
+        elif begun is not None:
+          totals[project] += at-begun
+          begun = None
+
+      if len(page) < size:
+        break
+      ms, seq = page[-1][0].split('-')
+      start = f'{ms}-{int(seq)+1}'
+  return [_ for pair in totals.items() for _ in pair]
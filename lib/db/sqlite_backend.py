@@ -0,0 +1,333 @@
+'''Every lib.db key has a row in keys. Hash fields (projects, cache:*) live in hashes and stream entries (the monthly
+logs partitions, versions) in streams, clustered on their primary keys so a key lookup or an id range scan is a
+single index walk.'''
+import os, re, json, sqlite3, time
+from threading import RLock
+from contextlib import contextmanager
+from typing import Any, Generator
+from .backend import Backend, Connection, ResponseError, format_id, lower_bound, upper_bound, next_id, wrongtype
+
+TABLES = '''
+CREATE TABLE IF NOT EXISTS keys (
+  key           TEXT    NOT NULL PRIMARY KEY,
+  kind          TEXT    NOT NULL,
+  expires       REAL,
+  last_ms       INTEGER NOT NULL DEFAULT 0,
+  last_seq      INTEGER NOT NULL DEFAULT 0,
+  entries_added INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS strings (
+  key   TEXT NOT NULL PRIMARY KEY,
+  value TEXT NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS hashes (
+  key   TEXT NOT NULL,
+  field TEXT NOT NULL,
+  value TEXT NOT NULL,
+  PRIMARY KEY (key, field)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS streams (
+  key    TEXT    NOT NULL,
+  ms     INTEGER NOT NULL,
+  seq    INTEGER NOT NULL,
+  fields TEXT    NOT NULL,
+  PRIMARY KEY (key, ms, seq)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS groups (
+  key          TEXT NOT NULL,
+  name         TEXT NOT NULL,
+  last_id      TEXT NOT NULL,
+  entries_read INTEGER,
+  PRIMARY KEY (key, name)
+) WITHOUT ROWID;
+'''
+
+INT_MAX = 2**63-1
+
+def _bound(sid:tuple[int, int]) -> tuple[int, int]:
+  return tuple(min(max(_, -1), INT_MAX) for _ in sid)
+
+class SQLiteBackend(Backend):
+  '''A local SQLite database in WAL mode. No server, no network round trips.'''
+  name = 'sqlite'
+  OPTIONS = dict(path=os.path.join(os.path.expanduser('~'), '.local', 'share', 'worn', 'worn.sqlite3'), timeout=5.0)
+  ENVIRON = dict(path='WORN_SQLITE_PATH')
+
+  def __init__(self, **options):
+    super().__init__(**options)
+    self.lock = RLock()
+    self.saved = 0
+    self._db = None
+
+  @property
+  def db(self) -> sqlite3.Connection:
+    with self.lock:
+      if self._db is None:
+        path = self.options['path']
+        if path != ':memory:':
+          os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        self._db = sqlite3.connect(path, timeout=self.options['timeout'], isolation_level=None, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.executescript(TABLES)
+        self.saved = self._db.total_changes
+      return self._db
+
+  def connection(self) -> Connection:
+    return SQLiteConnection(self)
+
+  def close(self) -> None:
+    with self.lock:
+      if self._db is not None:
+        self._db.close()
+        self._db = None
+
+class SQLiteConnection(Connection):
+  def __init__(self, backend:SQLiteBackend):
+    self.backend = backend
+
+  @property
+  def db(self) -> sqlite3.Connection:
+    return self.backend.db
+
+  @contextmanager
+  def atomic(self) -> Generator:
+    with self.backend.lock:
+      if self.db.in_transaction:
+        yield self
+        return
+
+      self.db.execute('BEGIN IMMEDIATE')
+      try:
+        yield self
+      except BaseException:
+        self.db.execute('ROLLBACK')
+        raise
+      else:
+        self.db.execute('COMMIT')
+
+  def _one(self, sql:str, *params) -> Any:
+    row = self.db.execute(sql, params).fetchone()
+    return None if row is None else row[0]
+
+  def _kind(self, key:str) -> str | None:
+    with self.backend.lock:
+      row = self.db.execute('SELECT kind, expires FROM keys WHERE key = ?', (key,)).fetchone()
+      if row is None:
+        return None
+      elif row[1] is not None and row[1] <= time.time():
+        with self.atomic():
+          self._drop(key)
+        return None
+      return row[0]
+
+  def _expect(self, key:str, kind:str) -> str | None:
+    if (_kind := self._kind(key)) not in (None, kind):
+      raise wrongtype()
+    return _kind
+
+  def _touch(self, key:str, kind:str) -> None:
+    self.db.execute('INSERT OR IGNORE INTO keys (key, kind) VALUES (?, ?)', (key, kind))
+
+  def _drop(self, key:str) -> None:
+    for table in ('keys', 'strings', 'hashes', 'streams', 'groups'):
+      self.db.execute(f'DELETE FROM {table} WHERE key = ?', (key,))
+
+  def type(self, name:str) -> str:
+    return self._kind(name) or 'none'
+
+  def exists(self, *names) -> int:
+    return sum(1 for name in names if self._kind(name) is not None)
+
+  def get(self, name:str) -> str | None:
+    if self._expect(name, 'string') is None:
+      return None
+    return self._one('SELECT value FROM strings WHERE key = ?', name)
+
+  def set(self, name:str, value:Any, ex:int=None, nx:bool=False) -> bool | None:
+    with self.atomic():
+      if self._kind(name) is not None:
+        if nx:
+          return None
+        self._drop(name)
+
+      self.db.execute('INSERT INTO keys (key, kind, expires) VALUES (?, ?, ?)', (name, 'string', None if ex is None else time.time()+ex))
+      self.db.execute('INSERT INTO strings (key, value) VALUES (?, ?)', (name, str(value)))
+      return True
+
+  def incr(self, name:str, amount:int=1) -> int:
+    with self.atomic():
+      if (value := self.get(name)) is None:
+        self.db.execute('INSERT INTO keys (key, kind) VALUES (?, ?)', (name, 'string'))
+        self.db.execute('INSERT INTO strings (key, value) VALUES (?, ?)', (name, str(amount)))
+        return amount
+      elif re.search(r'^-?\d+$', value) is None:
+        raise ResponseError('ERR value is not an integer or out of range')
+
+      self.db.execute('UPDATE strings SET value = ? WHERE key = ?', (str(int(value)+amount), name))
+      return int(value)+amount
+
+  def delete(self, *names) -> int:
+    with self.atomic():
+      found = self.exists(*names)
+      for name in names:
+        self._drop(name)
+      return found
+
+  def rename(self, src:str, dst:str) -> bool:
+    with self.atomic():
+      if self._kind(src) is None:
+        raise ResponseError('ERR no such key')
+
+      if src != dst:
+        self._drop(dst)
+        for table in ('keys', 'strings', 'hashes', 'streams', 'groups'):
+          self.db.execute(f'UPDATE {table} SET key = ? WHERE key = ?', (dst, src))
+      return True
+
+  def hget(self, name:str, key:str) -> str | None:
+    self._expect(name, 'hash')
+    return self._one('SELECT value FROM hashes WHERE key = ? AND field = ?', name, key)
+
+  def hgetall(self, name:str) -> dict:
+    self._expect(name, 'hash')
+    return dict(self.db.execute('SELECT field, value FROM hashes WHERE key = ?', (name,)).fetchall())
+
+  def hkeys(self, name:str) -> list:
+    self._expect(name, 'hash')
+    return [field for (field,) in self.db.execute('SELECT field FROM hashes WHERE key = ?', (name,)).fetchall()]
+
+  def hexists(self, name:str, key:str) -> bool:
+    self._expect(name, 'hash')
+    return self._one('SELECT 1 FROM hashes WHERE key = ? AND field = ?', name, key) is not None
+
+  def hset(self, name:str, key:str=None, value:Any=None, mapping:dict=None) -> int:
+    items = dict(mapping or {})
+    if key is not None:
+      items[key] = value
+
+    with self.atomic():
+      self._expect(name, 'hash')
+      self._touch(name, 'hash')
+      added = 0
+      for field, _value in items.items():
+        if (added_one := self.db.execute('INSERT OR IGNORE INTO hashes (key, field, value) VALUES (?, ?, ?)', (name, str(field), str(_value))).rowcount) == 0:
+          self.db.execute('UPDATE hashes SET value = ? WHERE key = ? AND field = ?', (str(_value), name, str(field)))
+        added += added_one
+      return added
+
+  def hsetnx(self, name:str, key:str, value:Any) -> int:
+    with self.atomic():
+      self._expect(name, 'hash')
+      self._touch(name, 'hash')
+      return self.db.execute('INSERT OR IGNORE INTO hashes (key, field, value) VALUES (?, ?, ?)', (name, str(key), str(value))).rowcount
+
+  def hdel(self, name:str, *keys) -> int:
+    with self.atomic():
+      if self._expect(name, 'hash') is None:
+        return 0
+
+      removed = sum(self.db.execute('DELETE FROM hashes WHERE key = ? AND field = ?', (name, str(key))).rowcount for key in keys)
+      if self._one('SELECT 1 FROM hashes WHERE key = ? LIMIT 1', name) is None:
+        self._drop(name)
+      return removed
+
+  def xadd(self, name:str, fields:dict, id:str='*') -> str:
+    with self.atomic():
+      self._expect(name, 'stream')
+      self._touch(name, 'stream')
+      last_ms, last_seq = self.db.execute('SELECT last_ms, last_seq FROM keys WHERE key = ?', (name,)).fetchone()
+      ms, seq = next_id((last_ms, last_seq), str(id))
+      self.db.execute('INSERT INTO streams (key, ms, seq, fields) VALUES (?, ?, ?, ?)', (name, ms, seq, json.dumps({str(k): str(v) for k, v in fields.items()})))
+      self.db.execute('UPDATE keys SET last_ms = ?, last_seq = ?, entries_added = entries_added + 1 WHERE key = ?', (ms, seq, name))
+      return format_id((ms, seq))
+
+  def xdel(self, name:str, *ids) -> int:
+    with self.atomic():
+      if self._expect(name, 'stream') is None:
+        return 0
+      return sum(self.db.execute('DELETE FROM streams WHERE key = ? AND ms = ? AND seq = ?', (name, *lower_bound(sid))).rowcount for sid in ids)
+
+  def xtrim(self, name:str, minid:str, approximate:bool=True) -> int:
+    '''Only the MINID strategy, which is all lib.db uses.'''
+    with self.atomic():
+      if self._expect(name, 'stream') is None:
+        return 0
+      return self.db.execute('DELETE FROM streams WHERE key = ? AND (ms, seq) < (?, ?)', (name, *_bound(lower_bound(minid)))).rowcount
+
+  def _range(self, name:str, start:str, end:str, count:int, order:str) -> list:
+    if self._expect(name, 'stream') is None:
+      return []
+
+    rows = self.db.execute(f'SELECT ms, seq, fields FROM streams WHERE key = ? AND (ms, seq) >= (?, ?) AND (ms, seq) <= (?, ?) ORDER BY ms {order}, seq {order} LIMIT ?',
+                           (name, *_bound(lower_bound(start)), *_bound(upper_bound(end)), -1 if count is None else count))
+    return [(format_id((ms, seq)), json.loads(fields)) for ms, seq, fields in rows]
+
+  def xrange(self, name:str, min:str='-', max:str='+', count:int=None) -> list:
+    return self._range(name, min, max, count, 'ASC')
+
+  def xrevrange(self, name:str, max:str='+', min:str='-', count:int=None) -> list:
+    return self._range(name, min, max, count, 'DESC')
+
+  def xinfo_stream(self, name:str) -> dict:
+    if self._expect(name, 'stream') is None:
+      raise ResponseError('ERR no such key')
+
+    last_ms, last_seq, added = self.db.execute('SELECT last_ms, last_seq, entries_added FROM keys WHERE key = ?', (name,)).fetchone()
+    first, last = self.xrange(name, count=1), self.xrevrange(name, count=1)
+    return {
+      'length':            self._one('SELECT COUNT(*) FROM streams WHERE key = ?', name),
+      'last-generated-id': format_id((last_ms, last_seq)),
+      'entries-added':     added,
+      'groups':            self._one('SELECT COUNT(*) FROM groups WHERE key = ?', name),
+      'first-entry':       first[0] if first else None,
+      'last-entry':        last[0] if last else None,
+    }
+
+  def xinfo_groups(self, name:str) -> list:
+    if self._expect(name, 'stream') is None:
+      raise ResponseError('ERR no such key')
+
+    return [{'name': group, 'consumers': 0, 'pending': 0, 'last-delivered-id': last_id, 'entries-read': entries_read, 'lag': None}
+            for group, last_id, entries_read in self.db.execute('SELECT name, last_id, entries_read FROM groups WHERE key = ? ORDER BY name', (name,))]
+
+  def xgroup_create(self, name:str, groupname:str, id:str='$', mkstream:bool=False, entries_read:int=None) -> bool:
+    with self.atomic():
+      if self._expect(name, 'stream') is None:
+        if not mkstream:
+          raise ResponseError('ERR The XGROUP subcommand requires the key to exist. Note that for CREATE you may want to use the MKSTREAM option to create an empty stream automatically.')
+        self._touch(name, 'stream')
+
+      if self._one('SELECT 1 FROM groups WHERE key = ? AND name = ?', name, groupname) is not None:
+        raise ResponseError('BUSYGROUP Consumer Group name already exists')
+
+      if id == '$':
+        id = format_id(self.db.execute('SELECT last_ms, last_seq FROM keys WHERE key = ?', (name,)).fetchone())
+      self.db.execute('INSERT INTO groups (key, name, last_id, entries_read) VALUES (?, ?, ?, ?)', (name, groupname, id, entries_read))
+      return True
+
+  def save(self) -> bool:
+    with self.backend.lock:
+      self.db.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+      self.backend.saved = self.db.total_changes
+      return True
+
+  def bgsave(self, schedule:bool=True) -> bool:
+    with self.backend.lock:
+      self.db.execute('PRAGMA wal_checkpoint(PASSIVE)')
+      self.backend.saved = self.db.total_changes
+      return True
+
+  def info(self, section:str=None) -> dict:
+    return {'rdb_changes_since_last_save': self.db.total_changes - self.backend.saved}
+
+  def memory_usage(self, key:str, samples:int=None) -> int | None:
+    '''Roughly what the key holds: the length of its name and of the text of its rows, plus 16 bytes per stream id.'''
+    with self.backend.lock:
+      if self._kind(key) is None:
+        return None
+
+      return len(key) + sum(self._one(sql, key) or 0 for sql in ('SELECT SUM(LENGTH(value)) FROM strings WHERE key = ?',
+                                                                 'SELECT SUM(LENGTH(field) + LENGTH(value)) FROM hashes WHERE key = ?',
+                                                                 'SELECT SUM(16 + LENGTH(fields)) FROM streams WHERE key = ?'))
@@ -0,0 +1,134 @@
+'''Records every command lib.db sends: its operation, key, duration and reply size.
+
+Tracing is on when WORN_TRACE is set (or after enable(), as worn --trace does) and then summary() reports the round
+trips a command made. Otherwise connections are handed out untouched and tracing costs nothing. In tests, budget()
+fails a block that makes more round trips than it should, to catch N+1 lookups before they ship.'''
+from __future__ import annotations
+import os, sys, time
+from contextlib import contextmanager
+from typing import Any, Callable, Generator
+
+enabled = os.environ.get('WORN_TRACE', '') not in ('', '0')
+calls = []
+
+def enable() -> None:
+  global enabled
+  enabled = True
+
+def reset() -> None:
+  calls.clear()
+
+def _size(reply:Any) -> int:
+  match reply:
+    case str() | bytes():        return len(reply)
+    case dict():                 return sum(_size(_k)+_size(_v) for _k, _v in reply.items())
+    case list() | tuple():       return sum(_size(_) for _ in reply)
+    case None:                   return 0
+    case _:                      return len(str(reply))
+
+def _key(args:tuple) -> str:
+  if len(args) > 0 and isinstance(args[0], str | bytes):
+    return args[0].decode() if isinstance(args[0], bytes) else args[0]
+  return ''
+
+def record(op:str, key:str, seconds:float, size:int) -> None:
+  calls.append((op, key, seconds, size))
+
+def _timed(op:str, key:str, call, *args, **kw) -> Any:
+  began = time.perf_counter()
+  reply = call(*args, **kw)
+  record(op, key, time.perf_counter()-began, _size(reply))
+  return reply
+
+class Traced(object):
+  '''Forwards everything to a connection, recording each command it sends.'''
+  UNSENT = ('atomic', 'pipeline', 'close', 'register_script')
+
+  def __init__(self, conn:Any):
+    self._conn = conn
+
+  def __enter__(self) -> Traced:
+    self._conn.__enter__()
+    return self
+
+  def __exit__(self, *exc) -> Any:
+    return self._conn.__exit__(*exc)
+
+  def __getattr__(self, name:str) -> Any:
+    attr = getattr(self._conn, name)
+    if name.startswith('_') or name in Traced.UNSENT or not callable(attr):
+      return attr
+
+    def command(*args, **kw) -> Any:
+      return _timed(name.upper(), _key(args), attr, *args, **kw)
+    return command
+
+  def pipeline(self, *args, **kw) -> TracedPipeline:
+    return TracedPipeline(self._conn.pipeline(*args, **kw))
+
+class TracedPipeline(object):
+  '''Forwards everything to a pipeline. Only execute sends anything, so it is recorded as one round trip.'''
+  def __init__(self, pipe:Any):
+    self._pipe = pipe
+
+  def __getattr__(self, name:str) -> Any:
+    attr = getattr(self._pipe, name)
+    if not callable(attr):
+      return attr
+
+    def queue(*args, **kw) -> Any:
+      reply = attr(*args, **kw)
+      return self if reply is self._pipe else reply
+    return queue
+
+  def execute(self, *args, **kw) -> list:
+    queued = len(self._pipe.command_stack)
+    return _timed('EXEC', f'{queued} commands', self._pipe.execute, *args, **kw)
+
+def traced(conn:Any) -> Any:
+  return Traced(conn) if enabled else conn
+
+def as_one(op:str, key:str, conn:Any, call:Callable) -> Any:
+  '''call(conn), recorded as the one op it stands for when conn is traced. Scripts run their commands on the server,
+  so the ones a backend emulates in Python run on the untraced connection rather than count as round trips each.'''
+  if isinstance(conn, Traced):
+    return _timed(op, key, call, conn._conn)
+  return call(conn)
+
+def summary(slowest:int=5) -> str:
+  '''The round trips recorded so far, the time spent per operation and the slowest calls.'''
+  total = sum(seconds for _, _, seconds, _ in calls)
+  r = f'{len(calls)} round trips in {total*1000:.2f}ms\n'
+
+  ops = {}
+  for op, _, seconds, size in calls:
+    count, spent, sent = ops.get(op, (0, 0.0, 0))
+    ops[op] = (count+1, spent+seconds, sent+size)
+  for op, (count, spent, size) in sorted(ops.items(), key=lambda kv: -kv[1][1]):
+    r += f'  {op: <14} {count: >5} calls {spent*1000: >9.2f}ms {size: >9} bytes\n'
+
+  if len(calls) > 0:
+    r += 'slowest:\n'
+    for op, key, seconds, size in sorted(calls, key=lambda call: -call[2])[:slowest]:
+      r += f'  {seconds*1000: >9.2f}ms {op} {key} ({size} bytes)\n'
+  return r
+
+def report() -> None:
+  '''Print the summary to stderr, when tracing.'''
+  if enabled:
+    print(summary(), end='', file=sys.stderr)
+
+@contextmanager
+def budget(round_trips:int) -> Generator:
+  '''Trace the block and fail it when it makes more than round_trips round trips. Its calls are only kept when
+  tracing was already on.'''
+  global enabled, calls
+  _enabled, _calls = enabled, calls
+  enabled, calls = True, []
+  try:
+    yield calls
+    assert len(calls) <= round_trips, f'{len(calls)} round trips should be at most {round_trips}:\n{summary()}'
+  finally:
+    if _enabled:
+      _calls.extend(calls)
+    enabled, calls = _enabled, _calls
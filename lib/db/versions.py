@@ -0,0 +1,131 @@
+'''Retention of the versions of the logs.
+
+Every `worn edit` of a log's time keeps the logs as they were as a version (see lib.db.new_version), listed in the
+versions stream. A version is a catalog pointing at monthly partitions, most of them shared with logs and the other
+versions, so it costs little while it shares them and more the further logs moves away from it.
+
+`worn versions stats` reports what each version holds and what dropping it would free. `worn versions gc` drops the
+versions past a number to keep and/or older than a date, along with the partitions nothing points at any more.
+Versions written before partitions were shared hold a copy of every month of their own; gc points the months of the
+versions it keeps at identical partitions of the next newer version instead, where it finds them.'''
+from collections import Counter
+from .. import db
+from .backend import parse_id
+
+def _listed() -> list:
+  '''(id of its entry in versions, key) of every version, oldest first.'''
+  return [(sid, f"logs-{entry['version']}") for sid, entry in db.xiter('versions')]
+
+def _catalogs(conn:db.Connection, keys:list) -> dict:
+  '''The partition each month of every logs stream in keys is kept in, in one round trip.'''
+  pipe = conn.pipeline(transaction=False)
+  for key in keys:
+    pipe.hgetall(db.catalog(key))
+  return {key: db._resolved(key, fields) for key, fields in zip(keys, pipe.execute())}
+
+def _sizes(conn:db.Connection, _partitions:list) -> dict:
+  '''(entries, MEMORY USAGE of it and of its indexes) of every partition, in two round trips.'''
+  pipe = conn.pipeline(transaction=False)
+  for partition in _partitions:
+    pipe.memory_usage(partition)
+    pipe.hgetall(db.indexed(partition))
+  found = list(zip(_partitions, *[iter(pipe.execute())]*2))
+
+  for partition, size, projects in found:
+    if size is not None:
+      pipe.xinfo_stream(partition)
+    for project in projects:
+      pipe.memory_usage(db.index(partition, project))
+  more = iter(pipe.execute())
+
+  sizes = {}
+  for partition, size, projects in found:
+    length = 0 if size is None else next(more)['length']
+    sizes[partition] = (length, (size or 0) + sum(next(more) or 0 for _ in projects))
+  return sizes
+
+def stats() -> list[dict]:
+  '''The key, the id of its entry in versions, entries and partitions of logs and of each of its versions, newest
+  first, with how many of its partitions others point at too and the bytes of the ones only it points at, which is
+  what dropping it frees.'''
+  listed = [(None, 'logs'), *reversed(_listed())]
+  with db.reader() as conn:
+    catalogs = _catalogs(conn, [key for _, key in listed])
+    pointed = Counter(partition for catalogued in catalogs.values() for partition in set(catalogued.values()))
+    sizes = _sizes(conn, sorted(pointed))
+
+  return [dict(key=key, created=sid, entries=sum(sizes[_][0] for _ in catalogs[key].values()), partitions=len(catalogs[key]),
+               shared=sum(1 for _ in catalogs[key].values() if pointed[_] > 1),
+               bytes=sum(sizes[_][1] for _ in set(catalogs[key].values()) if pointed[_] == 1))
+          for sid, key in listed]
+
+def _same(conn:db.Connection, partition:str, other:str, batch_size:int) -> bool:
+  if db._summed(conn, [partition])['length'] != db._summed(conn, [other])['length']:
+    return False
+  return all(mine == theirs for mine, theirs in zip(db.xiter(partition, page_size=batch_size), db.xiter(other, page_size=batch_size)))
+
+def _compacted(conn:db.Connection, catalogs:dict, kept:list, batch_size:int) -> list:
+  '''(key, month, partition) of each month of the kept versions kept in a partition of its own that holds the same
+  entries as the partition of the next newer version, or of logs, so it can point at that one instead. catalogs is
+  updated to match. The newest month of logs is never pointed at, since logs goes on appending to it.'''
+  repointed, newest = [], max(catalogs['logs'], default=None)
+  for key, newer in zip(kept, [*kept[1:], 'logs']):
+    for _month, partition in sorted(catalogs[key].items()):
+      other = catalogs[newer].get(_month)
+      if partition != f'{key}:{_month}' or other in (None, partition) or (newer == 'logs' and _month == newest):
+        continue
+      if conn.exists(partition, other) == 2 and _same(conn, partition, other, batch_size):
+        repointed.append((key, _month, partition))
+        catalogs[key][_month] = other
+  return repointed
+
+def gc(keep:int=None, before:int=None, batch_size:int=db.PAGE_SIZE) -> tuple[int, int]:
+  '''Drop the versions but the newest keep ones, of those only the ones created before the before seconds when given,
+  and the partitions and indexes no catalog points at any more, batch_size versions per MULTI. Return how many
+  versions and how many partitions were dropped.'''
+  assert keep is not None or before is not None, f"{keep=} or {before=} should be given, but neither is."
+  if keep is not None:
+    assert isinstance(keep, int) and keep >= 0, f"{keep=} should be an instance of int, 0 or more, but isn't."
+  if before is not None:
+    assert isinstance(before, int) and before > 0, f"{before=} should be a positive instance of int, but isn't."
+  assert isinstance(batch_size, int) and batch_size > 0, f"{batch_size=} should be a positive instance of int, but isn't."
+
+  listed = _listed()
+  doomed = [(sid, key) for n, (sid, key) in enumerate(listed)
+            if (keep is None or n < len(listed)-keep) and (before is None or parse_id(sid)[0] < before*1000)]
+  kept = [key for sid, key in listed if (sid, key) not in doomed]
+
+  dropped = 0
+  with db.connection() as conn:
+    catalogs = _catalogs(conn, ['logs', *kept, *(key for _, key in doomed)])
+    repointed = _compacted(conn, catalogs, kept, batch_size)
+    referenced = set(partition for key in ['logs', *kept] for partition in catalogs[key].values())
+
+    for n, batch in enumerate([doomed[_:_+batch_size] for _ in range(0, len(doomed), batch_size)] or [[]]):
+      '''The first batch also repoints the compacted months, along with dropping the partitions they gave up.'''
+      moved = repointed if n == 0 else []
+      wanted = set(partition for _, key in batch for partition in catalogs[key].values()).union(given for _, _, given in moved)
+      _partitions = sorted(wanted.difference(referenced))
+      referenced.update(_partitions)
+
+      pipe = conn.pipeline(transaction=False)
+      for partition in _partitions:
+        pipe.hgetall(db.indexed(partition))
+      indexed = pipe.execute()
+
+      pipe = conn.pipeline(transaction=True)
+      for key, _month, _ in moved:
+        pipe.hset(db.catalog(key), _month, catalogs[key][_month])
+      for partition, projects in zip(_partitions, indexed):
+        if len(projects) > 0:
+          pipe.delete(*(db.index(partition, project) for project in projects))
+        pipe.delete(db.indexed(partition), partition)
+      for _, key in batch:
+        pipe.delete(db.catalog(key))
+      if len(batch) > 0:
+        pipe.xdel('versions', *(sid for sid, _ in batch))
+      pipe.execute()
+      dropped += len(_partitions)
+  db.invalidate()
+  db._written()
+  return len(doomed), dropped
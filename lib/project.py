@@ -1,7 +1,9 @@
 from . import *
+import asyncio
 from . import db
+from .db import aio
 from .colors import colors
-from typing import Any, Generator, Self, Union
+from typing import Any, AsyncGenerator, Generator, Self, Union
 from functools import partialmethod
 
 class Project(object):
@@ -68,49 +70,89 @@ class Project(object):
     return self == Project.last()
 
   def add(self) -> None:
-    db.add('begun', str(now().timestamp()).replace('.', ''), expire=3600, nx=True)
-    db.add('projects', {self.name.casefold().strip(): self.id, self.id: self.name.strip()}, nx=True)
+    with db.batch():
+      db.add('begun', str(now().timestamp()).replace('.', ''), expire=3600, nx=True)
+      db.add('projects', {self.id: self.name.strip()}, nx=True)
+      db.add('projects:names', {self.name.casefold().strip(): self.id}, nx=True)
+      db.add('schema', db.migrations.LATEST, nx=True)
 
   def rename(self, new:Self) -> None:
     if not isinstance(new, Project): raise InvalidTypeE(f'Rename argument new {new} is an invalid type {type(new)}.')
 
-    db.add('projects', {self.id: new.name})
-    db.rm('projects', self.name.casefold())
-    db.add('projects', {new.name.casefold(): self.id})
+    with db.batch():
+      db.add('projects', {self.id: new.name})
+      db.rm('projects:names', self.name.casefold())
+      db.add('projects:names', {new.name.casefold(): self.id})
 
   def log(self, state:str, at:datetime=now()) -> None:
     assert isinstance(state, str), f"{state=} should be a string but isn't."
     assert isinstance(at, datetime), f"{at=} should be a datetime but isn't."
     LogProject(self.id, self.name, state, at).add()
 
+  def _switch(self, state:str, at:datetime) -> None:
+    '''Log state for this project at at, stopping whatever was running first, in one atomic db.log call.'''
+    if at > now() + timedelta(seconds=10):
+      future_time = input(f'The time that you specified "{at:%F %T}" is in the future. Are you certain you want to {state.rstrip("ed")} the {self:name} project in the future (y|N)? ')
+      if not future_time.strip().casefold().startswith('y'):
+        return
+
+    name = self.name.strip() if state == 'started' else None
+    last_id, stopped, started = db.log(state, self.id, f'{at:%s}', name=name, begun=str(now().timestamp()).replace('.', ''))
+    if stopped is None and started is None and last_id != '0-0' and at < (oldest_log := parse_timestamp(last_id)):
+      raise InvalidTimeE(f'The start time that you specified "{at:%F %T}" is older than the last log entered. Please, choose a different time or adjust the previously entered log entry time "{oldest_log:%F %T}".')
+
   def stop(self, at:datetime=now()) -> None:
     assert isinstance(at, datetime), f"{at=} should be a datetime but isn't."
-    if self.is_running():
-      self.log('stopped', at)
+    '''Journaled, whether it's running is checked by the log script when it's replayed.'''
+    if self.is_running() or db.journal.wanted():
+      self._switch('stopped', at)
 
   def start(self, at:datetime=now()) -> None:
     assert isinstance(at, datetime), f"{at=} should be a datetime but isn't."
-    if (last := Project.last()) and not isinstance(last, FauxProject):
-      last.stop(at)
-    self.add()
-    self.log('started', at)
+    self._switch('started', at)
 
   def remove(self) -> None:
-    for log_project in LogProject.all(matching=self):
-      log_project.remove()
+    with db.batch():
+      for log_project in LogProject.all(matching=self):
+        log_project.remove()
 
-    db.rm('projects', self.name.casefold().strip())
-    db.rm('projects', self.id)
+      db.rm('projects:names', self.name.casefold().strip())
+      db.rm('projects', self.id)
 
   @classmethod
   def last(kind) -> Self:
-    if not db.has('logs') or len(logs := db.xrange('logs', count=1, reverse=True)) == 0:
+    '''The project of the last log entry, or a FauxProject when there is none or it can't be read from the server.'''
+    try:
+      if not db.has('logs') or len(logs := db.xrange('logs', count=1, reverse=True)) == 0:
+        return FauxProject()
+    except db.backend().ConnectionError as e:
+      db.journal.unreachable(e)
       return FauxProject()
 
     tsid, last = logs[0]
     _id = UUID(last.get('project'))
     return kind(_id, db.get('projects', _id), last.get('state', 'stopped'), parse_timestamp(tsid))
 
+  @classmethod
+  async def alast(kind) -> Self:
+    if len(logs := await aio.xrange('logs', count=1, reverse=True)) == 0:
+      return FauxProject()
+
+    tsid, last = logs[0]
+    _id = UUID(last.get('project'))
+    return kind(_id, await aio.get('projects', _id), last.get('state', 'stopped'), parse_timestamp(tsid))
+
+  @classmethod
+  async def aload(kind, *ids:UUID) -> list[Self]:
+    '''The projects with these ids, looked up concurrently.'''
+    projects = []
+    for _id, name in zip(ids, await asyncio.gather(*(aio.get('projects', _id) for _id in ids))):
+      if name is None:
+        debug(msg := f'Unable to find a project with the id {_id}.')
+        raise InvalidTypeE(msg)
+      projects.append(Project(_id, name))
+    return projects
+
   @classmethod
   def make(kind, nameorid:Any, when:datetime=now()) -> Self:
     assert isinstance(when, datetime) or istimestamp_id(when), f"{when=} should be a datetime or timestamp id, but isn't."
@@ -129,8 +171,8 @@ class Project(object):
       case str(nameorid) if istimestamp_id(nameorid) and len(db.xrange('logs', start=nameorid, count=1)) == 1:
         record = db.xrange('logs', start=nameorid, count=1)[0]
         return LogProject.make(record[1], record[0])
-      case str(nameorid) as _name if db.has('projects', _name.casefold().strip()):
-        return Project.make(UUID(db.get('projects', _name.casefold().strip())))
+      case str(nameorid) as _name if db.has('projects:names', _name.casefold().strip()):
+        return Project.make(UUID(db.get('projects:names', _name.casefold().strip())))
       case str(nameorid) as _name:
         project = Project(uuid4(), _name)
         project.add()
@@ -150,7 +192,7 @@ class Project(object):
 
     matches = set([])
     counts = [0, 0]
-    if name == 'last' or db.has('projects', name) or db.has('projects', name.strip().casefold()):
+    if name == 'last' or db.has('projects', name) or db.has('projects:names', name.strip().casefold()):
       counts = [1, 1]
       debug(f'counts {counts!r}')
       if isinstance(name, str) and not isuuid(name):
@@ -158,7 +200,7 @@ class Project(object):
       else:
         return {Project.make(name)}
 
-    for label in db.keys('projects'):
+    for label in db.keys('projects:names'):
       counts[0] += 1
       if len(label) < len(name):
         continue
@@ -181,14 +223,32 @@ class Project(object):
     else:
       return matches
 
+  @classmethod
+  def ids_matching(kind, other:Any) -> set[str]:
+    '''The ids of every project that equiv would consider the same as other.'''
+    match other:
+      case Project():                  return {str(other.id)}
+      case UUID():                     return {str(other)}
+      case str() if isuuid(other):     return {str(UUID(other))}
+      case str():                      return {pid for pid, name in db.get('projects').items() if name == other or name.casefold() == other.casefold()}
+      case _:                          return set()
+
   @classmethod
   def all(kind) -> Generator:
     if len(_projects := db.get('projects')) > 0:
-      yield from (Project.make(UUID(pid)) for pid, p in sorted(_projects.items(), key=lambda kv: str(kv[1]).casefold()) if isuuid(pid))
+      yield from (Project.make(UUID(pid)) for pid, p in sorted(_projects.items(), key=lambda kv: str(kv[1]).casefold()))
     else:
       print('No projects', file=sys.stderr)
       yield from []
 
+  @classmethod
+  async def aall(kind) -> AsyncGenerator:
+    if len(_projects := await aio.get('projects')) > 0:
+      for pid, name in sorted(_projects.items(), key=lambda kv: str(kv[1]).casefold()):
+        yield Project(UUID(pid), name)
+    else:
+      print('No projects', file=sys.stderr)
+
   @classmethod
   def cache(kind, ticket:str | int, project:Self) -> None:
     assert isinstance(ticket, str | int), f"{ticket=} should be one of str or int, but isn't."
@@ -209,6 +269,10 @@ class FauxProject(Project):
     raise Project.FauxProjectE(f'You attempted to start a fake project to the database. This is merely a placeholder class/instance and is not meant to be operated on.')
 
   def stop(self, at=now()):
+    if db.journal.wanted():
+      '''Stands in for a last project that couldn't be read, so the replay stops whichever one is running then.'''
+      db.log('stopped', None, f'{at:%s}')
+      return
     raise Project.FauxProjectE(f'You attempted to stop a fake project to the database. This is merely a placeholder class/instance and is not meant to be operated on.')
 
   def log(self, state='stopped', at=now()):
@@ -244,17 +308,16 @@ class LogProject(Project):
       case _:       return super().__format__(fmt_spec)
 
   def add(self) -> None:
-    if db.has('logs'):
-      oldest_log = parse_timestamp(db.xinfo('logs', 'last-generated-id', default=now()))
-      if self.when < oldest_log:
-        raise InvalidTimeE(f'The start time that you specified "{self.when:%F %T}" is older than the last log entered. Please, choose a different time or adjust the previously entered log entry time "{oldest_log:%F %T}".')
-
+    '''Append this entry, checked against the last one by the same call of db.append that writes it.'''
     if self.when > now() + timedelta(seconds=10):
       future_time = input(f'The time that you specified "{self.when:%F %T}" is in the future. Are you certain you want to {self.state.rstrip("ed")} the {self:name} project in the future (y|N)? ')
       if not future_time.strip().casefold().startswith('y'):
         return
 
-    db.add('logs', {'project': self.id, 'state': self.state, 'id': self.timestamp_id})
+    last_id, added = db.append({'project': self.id, 'state': self.state, 'id': self.timestamp_id})
+    if added is None and last_id != '0-0':
+      oldest_log = parse_timestamp(last_id)
+      raise InvalidTimeE(f'The start time that you specified "{self.when:%F %T}" is older than the last log entered. Please, choose a different time or adjust the previously entered log entry time "{oldest_log:%F %T}".')
     self._stored = True
 
   def remove(self) -> None:
@@ -264,11 +327,27 @@ class LogProject(Project):
     raise InvalidTypeE(f"Project {new=} is the wrong type {type(new)!r}.")
 
   @classmethod
-  def all(kind, *, matching=None, since=None, count:int=None, _version:str | UUID=None) -> Generator:
+  def all(kind, *, matching=None, since=None, until=None, count:int=None, _version:str | UUID=None) -> Generator:
+    '''The logs from since through until, reading only the monthly partitions of logs that overlap them.'''
     start = '-' if since is None else stream_id(parse_timestamp(since), seq='0')
+    end = None if until is None else f'{parse_timestamp(until):%s}'
     key = 'logs' if _version is None else f'logs-{str(_version)}'
 
-    yield from (_proj for (tid, project) in db.xrange(key, start=start, count=count) if (_proj := LogProject.make(project, when=tid)) and ( matching is None or _proj.equiv(matching) ))
+    where = None if matching is None else {'project': Project.ids_matching(matching)}
+    yield from (LogProject.make(project, when=tid) for (tid, project) in db.xiter(key, start, end, count=count, where=where))
+
+  @classmethod
+  async def aall(kind, *, matching=None, since=None, until=None, count:int=None, _version:str | UUID=None) -> AsyncGenerator:
+    '''Like all, but resolves the project names from one read of the projects hash instead of a lookup per entry.'''
+    start = '-' if since is None else stream_id(parse_timestamp(since), seq='0')
+    end = None if until is None else f'{parse_timestamp(until):%s}'
+    key = 'logs' if _version is None else f'logs-{str(_version)}'
+    names = await aio.get('projects')
+
+    async for (tid, project) in aio.xiter(key, start, end, count=count):
+      _proj = LogProject(project['project'], names.get(project['project']), project['state'], tid)
+      if matching is None or _proj.equiv(matching):
+        yield _proj
 
   @classmethod
   def edit_log_time(kind, starting:datetime, to:datetime, reason:str) -> None:
@@ -284,12 +363,10 @@ class LogProject(Project):
         debug(f"You have attempted to change the time of a project to a time that is recorded by another project:\n  {logs[1]!s}.\nConsider running 'worn show logs -s {to:%s}' to see what project is running at that time.\nFailing.")
         return
 
-    version_id = db.new_version(reason)
-    for log in LogProject.all(_version=version_id):
-      if log.when == starting:
-        _when = to
-      else:
-        _when = log.when
+    '''Only the entries around starting need checking, the rest keep their order.'''
+    if len(before := db.xrange('logs', start=f'({starting:%s}-0', reverse=True, count=1)) > 0 and to < (previous := parse_timestamp(before[0][0])):
+      raise InvalidTimeE(f'The time that you specified "{to:%F %T}" is older than the log entered before it "{previous:%F %T}". Please, choose a different time.')
+    if len(after := list(LogProject.all(since=int(f'{starting:%s}')+1, count=1))) > 0 and after[0].when < to:
+      raise InvalidTimeE(f'The time that you specified "{to:%F %T}" is newer than the log entered after it "{after[0].when:%F %T}". Please, choose a different time.')
 
-      _log = LogProject(log.id, log.name, log.state, _when)
-      _log.log(log.state, _when)
+    db.new_version(reason, {int(f'{starting:%s}'): int(f'{to:%s}')})
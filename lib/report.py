@@ -1,9 +1,13 @@
 from argparse import Namespace
 from . import *
+from . import db
 from .colors import colors
 from .project import Project, LogProject, FauxProject
 import smtplib
 
+class Summed(dict):
+  '''{Project: seconds} totals that were already summed, by lib.db.totals, and only need reporting.'''
+
 class Report(object):
   SCALES = {'w': WEEK, 'd': DAY, 'h': HOUR, 'm': MINUTE, 's': SECOND}
 
@@ -26,7 +30,20 @@ class Report(object):
       for project in Project.all():
         self._data.setdefault(project, 0)
 
+  @classmethod
+  def totals(kind, *, matching=None, since:datetime=None, until:datetime=None, **kw) -> Self:
+    '''A report from the totals the server sums up, instead of from every log entry sent over.'''
+    names = db.get('projects')
+    totals = db.totals('logs',
+      None if since is None else stream_id(parse_timestamp(since), seq='0'),
+      None if until is None else f'{parse_timestamp(until):%s}',
+      projects=None if matching is None else Project.ids_matching(matching))
+    return kind(Summed({Project(UUID(pid), names.get(pid)): seconds for pid, seconds in totals.items()}), since, **kw)
+
   def _collate(self, logs:Generator) -> dict[Project, float]:
+    if isinstance(logs, Summed):
+      return dict(logs)
+
     data = {}
     accum = 0
 
@@ -23,6 +23,11 @@ MY_DIR = os.path.dirname(ME)
 
 sys.path.append(os.path.join(MY_DIR, '..', 'lib'))
 
+'''Never journal into, or replay, the real journal while testing.'''
+os.environ.setdefault('WORN_JOURNAL', os.devnull)
+os.environ.setdefault('WORN_JOURNAL_MODE', 'off')
+os.environ.setdefault('WORN_ARCHIVE', os.devnull)
+
 def time_traveled(*, since=datetime.now(), op=sub, **kw):
   return op(since, timedelta(**kw))
 
@@ -33,5 +38,26 @@ class TestWornBase(unittest.TestCase):
 
   def tearDown(self): pass
 
+class TestDbBase(TestWornBase):
+  '''Runs every test against an empty memory backend, unless configure() picks another, and puts the configured
+  backend back afterwards.'''
+  def setUp(self):
+    super().setUp()
+    from lib import db
+    self._backend = db.BACKEND
+    self.configure()
+
+  def configure(self) -> None:
+    from lib import db
+    db.configure(backend='memory')
+    db.backend().flush()
+
+  def tearDown(self):
+    from lib import db
+    db.persist()
+    db.backend().close()
+    db.configure(backend=self._backend)
+    super().tearDown()
+
 if __name__ == '__main__':
   unittest.main(buffer=True)
@@ -0,0 +1,85 @@
+from test import *
+import asyncio
+import redis.asyncio
+from lib import db, InvalidTypeE
+from lib.db import aio
+from lib.project import Project, LogProject, FauxProject
+
+class TestAio(TestDbBase, unittest.IsolatedAsyncioTestCase):
+  async def test_redis_connection(self):
+    try:
+      db.configure(backend='redis')
+      conn = aio.connection()
+      self.assertIsInstance(conn, redis.asyncio.StrictRedis)
+      self.assertIs(conn.connection_pool, db.backend().apool)
+      self.assertIs(aio.connection().connection_pool, conn.connection_pool)
+    finally:
+      db.configure(backend='memory')
+
+  async def test_reads(self):
+    db.add('projects', {'worn': self.valid_uuid, self.valid_uuid: 'Worn'})
+    for ts in ('1711255800-0', '1711255800-1', '1711255900-0'):
+      db.add('logs', {'project': self.valid_uuid, 'state': 'started', 'id': ts})
+
+    self.assertTrue(await aio.has('projects', 'worn'))
+    self.assertFalse(await aio.has('projects', 'nope'))
+    self.assertEqual(await aio.get('projects', 'worn'), str(self.valid_uuid))
+    self.assertDictEqual(await aio.get('projects'), db.get('projects'))
+    self.assertCountEqual(await aio.keys('projects'), db.keys('projects'))
+    self.assertEqual(await aio.xrange('logs', reverse=True, count=2), db.xrange('logs', reverse=True, count=2))
+    self.assertEqual(await aio.xinfo('logs', 'length'), 3)
+    self.assertEqual([tid async for tid, _ in aio.xiter('logs', page_size=1)], [tid for tid, _ in db.xiter('logs')])
+    self.assertEqual([tid async for tid, _ in aio.xiter('logs', page_size=2, count=2)], ['1711255800-0', '1711255800-1'])
+
+  async def test_compact(self):
+    db.add('logs', {'project': self.valid_uuid, 'state': 'started', 'id': '1711255800-0'})
+    with patch.object(db, 'ENCODING', 'compact'):
+      db.add('logs', {'project': self.valid_uuid, 'state': 'stopped', 'id': '1711255900-0'})
+    self.assertEqual(await aio.xrange('logs'), db.xrange('logs'))
+    self.assertEqual((await aio.xrange('logs', reverse=True, count=1))[0][1], {'project': str(self.valid_uuid), 'state': 'stopped'})
+
+  async def test_partitions(self):
+    for sid in ('1709251140-0', '1709251200-0', '1711929600-0'):
+      db.add('logs', {'project': self.valid_uuid, 'state': 'started', 'id': sid})
+    self.assertEqual(await aio.xrange('logs'), db.xrange('logs'))
+    self.assertEqual(await aio.xrange('logs', reverse=True, count=2), db.xrange('logs', reverse=True, count=2))
+    self.assertEqual(await aio.xrange('logs', start='1709251200-0', end='1709251200'), db.xrange('logs', start='1709251200-0', end='1709251200'))
+    self.assertEqual(await aio.xinfo('logs', 'length'), 3)
+    self.assertTrue(await aio.has('logs'))
+
+    with patch.object(asyncio, 'gather', wraps=asyncio.gather) as gathered:
+      self.assertEqual(await aio.xrange('logs', reverse=True), db.xrange('logs', reverse=True))
+      self.assertEqual(await aio.xrange('logs', count=2), db.xrange('logs', count=2))
+    '''Only the partitions read whole are read at once; a count is filled in order.'''
+    self.assertEqual(gathered.call_count, 1)
+    self.assertEqual(len(gathered.call_args.args), 3)
+
+  async def test_projects(self):
+    self.assertIsInstance(await Project.alast(), FauxProject)
+
+    sequoia, redwood = Project.make('Sequoia'), Project.make('Redwood')
+    sequoia.start(time_traveled(minutes=30))
+    redwood.start(time_traveled(minutes=20))
+
+    self.assertEqual([p.name async for p in Project.aall()], [p.name for p in Project.all()])
+    self.assertEqual(await Project.alast(), Project.last())
+    self.assertEqual((await Project.alast()).state, 'started')
+    self.assertEqual([(p.name, p.state, p.when) async for p in LogProject.aall()], [(p.name, p.state, p.when) for p in LogProject.all()])
+    self.assertEqual([p.name async for p in LogProject.aall(matching='redwood')], ['Redwood'])
+
+    self.assertEqual([p.name for p in await Project.aload(redwood.id, sequoia.id)], ['Redwood', 'Sequoia'])
+    with self.assertRaises(InvalidTypeE):
+      await Project.aload(uuid4())
+
+  async def test_versions(self):
+    Project.make('Sequoia').start(time_traveled(minutes=30))
+    first = db.new_version('First')
+    Project.make('Sequoia').start(time_traveled(minutes=20))
+    second = db.new_version('Second')
+
+    async def logs(version):
+      return [p.when async for p in LogProject.aall(_version=version)]
+    self.assertEqual(await asyncio.gather(logs(first), logs(second)), [[p.when for p in LogProject.all(_version=version)] for version in (first, second)])
+
+if __name__ == '__main__':
+  unittest.main(buffer=True)
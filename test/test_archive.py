@@ -0,0 +1,99 @@
+from test import *
+import tempfile
+from lib import db
+from lib.db import archive
+from lib.project import Project, LogProject
+
+class TestArchive(TestDbBase):
+  def setUp(self):
+    super().setUp()
+    self.tmp = tempfile.TemporaryDirectory()
+    self.addCleanup(self.tmp.cleanup)
+    patcher = patch.object(db, 'ARCHIVE', self.tmp.name)
+    patcher.start()
+    self.addCleanup(patcher.stop)
+
+    self.sequoia, self.redwood = uuid4(), uuid4()
+    '''Feb 29th, Mar 1st and Apr 1st 2024 UTC, redwood still running at the last.'''
+    for at, project, state in ((1709251000, self.sequoia, 'started'), (1709251100, self.sequoia, 'stopped'), (1709251200, self.redwood, 'started'),
+                               (1709251300, self.redwood, 'stopped'), (1711929600, self.redwood, 'started')):
+      db.add('logs', {'project': project, 'state': state, 'id': f'{at}-0'})
+
+  def test_archive(self):
+    self.assertEqual(archive.archive(1709251400), 4)
+    self.assertEqual(sorted(os.listdir(archive.directory('logs'))), ['1709251000-0_1709251100-0.seg', '1709251200-0_1709251300-0.seg'])
+    self.assertEqual(db.months('logs'), ['2024-03', '2024-04'])
+    self.assertEqual([sid for sid, _ in db.xrange('logs')], ['1711929600-0'])
+    with db.connection() as conn:
+      self.assertEqual(conn.exists(db.index('logs:2024-02', self.sequoia)), 0)
+      self.assertEqual(conn.exists(db.index('logs:2024-03', self.redwood)), 1)
+      self.assertEqual(conn.xrange(db.index('logs:2024-03', self.redwood)), [])
+      self.assertEqual([sid for sid, _ in conn.xrange(db.index('logs:2024-04', self.redwood))], ['1711929600-0'])
+
+    '''Reads reach back into the archive.'''
+    self.assertEqual([(log.id, log.state) for log in LogProject.all()], [(self.sequoia, 'started'), (self.sequoia, 'stopped'), (self.redwood, 'started'), (self.redwood, 'stopped'), (self.redwood, 'started')])
+    self.assertEqual([log.id for log in LogProject.all(matching=self.sequoia)], [self.sequoia, self.sequoia])
+    self.assertEqual(len(list(LogProject.all(count=3))), 3)
+    self.assertDictEqual(db.totals(), {str(self.sequoia): 100, str(self.redwood): 100})
+    self.assertDictEqual(db.totals(start='1709251200-0'), {str(self.redwood): 100})
+    self.assertDictEqual(db.totals(projects={self.redwood}), {str(self.redwood): 100})
+    self.assertTrue(Project.last().equiv(self.redwood))
+
+    with patch.object(archive, '_read', side_effect=archive._read) as read:
+      self.assertEqual(len(list(LogProject.all(since=datetime.fromtimestamp(1709251200)))), 3)
+      self.assertEqual(read.call_count, 1)
+      self.assertEqual(len(list(LogProject.all(since=datetime.fromtimestamp(1711929600)))), 1)
+      self.assertEqual(read.call_count, 1)
+
+  def test_open_period(self):
+    '''Redwood was running at the cut-off, so its start stays on the server.'''
+    self.assertEqual(archive.archive(1709251250), 2)
+    self.assertEqual([sid for sid, _ in db.xrange('logs')], ['1709251200-0', '1709251300-0', '1711929600-0'])
+    self.assertDictEqual(db.totals(), {str(self.sequoia): 100, str(self.redwood): 100})
+
+  def test_newest(self):
+    '''The newest partition is only trimmed, so it keeps the last id.'''
+    self.assertEqual(archive.archive(1714521600), 4)
+    self.assertEqual(db.months('logs'), ['2024-04'])
+    self.assertEqual(db.xinfo('logs', 'last-generated-id'), '1711929600-0')
+
+  def test_resume(self):
+    '''Interrupted after the segments were written, but before the server was trimmed.'''
+    with patch.object(db, '_touch', side_effect=KeyboardInterrupt()), self.assertRaises(KeyboardInterrupt):
+      archive.archive(1709251400)
+    self.assertEqual(len(os.listdir(archive.directory('logs'))), 1)
+
+    self.assertEqual(archive.archive(1709251400), 2)
+    self.assertEqual(archive.archive(1709251400), 0)
+    self.assertEqual(len(os.listdir(archive.directory('logs'))), 2)
+    self.assertEqual(len(list(LogProject.all())), 5)
+
+  def test_versions(self):
+    '''The partitions a version shares are left to it, and logs goes on in copies.'''
+    version = db.new_version('Testing')
+    self.assertEqual(archive.archive(1709251400), 4)
+    self.assertEqual([sid for sid, _ in db.xrange('logs')], ['1711929600-0'])
+    self.assertEqual(db.partitions(f'logs-{version}'), ['logs:2024-02', 'logs:2024-03', 'logs:2024-04'])
+    self.assertEqual(len(db.xrange(f'logs-{version}')), 5)
+    self.assertNotIn('logs:2024-03', db.partitions('logs'))
+
+  def test_streamed(self):
+    '''Segments are inflated a chunk at a time, and entries are read only as far as they are asked for.'''
+    archived = db.xrange('logs', end='1711929599')
+    with patch.object(archive, 'CHUNK', 16):
+      archive.archive(1714521600)
+      entries = archive.xrange('logs')
+      self.assertEqual(next(entries), archived[0])
+      entries.close()
+
+      self.assertEqual(list(archive.xrange('logs')), archived)
+      self.assertEqual(list(archive.xrange('logs', start=archived[1][0], end=archived[2][0])), archived[1:3])
+
+  def test_compact(self):
+    with patch.object(db, 'ENCODING', 'compact'):
+      db.log('stopped', self.redwood, 1711929700)
+    archive.archive(1714521600)
+    self.assertEqual(next(archive.xrange('logs', start='1711929700'))[1], {'project': str(self.redwood), 'state': 'stopped'})
+
+if __name__ == '__main__':
+  unittest.main(buffer=True)
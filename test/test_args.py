@@ -34,12 +34,12 @@ class TestLib(TestWornBase):
     from argparse import Namespace
     with patch('builtins.print') as mock_debug:
       r = parse_args(['show', 'last'])
-      self.assertEqual(len(r), 5)
+      self.assertEqual(len(r), 6)
       self.assertIsInstance(r[-1], Namespace)
       self.assertEqual(mock_debug.call_count, 1)
       
       r = parse_args(['start', 'last'])
-      self.assertEqual(len(r), 5)
+      self.assertEqual(len(r), 6)
       self.assertIsInstance(r[-1], Namespace)
       self.assertEqual(mock_debug.call_count, 2)
 
@@ -60,6 +60,10 @@ class TestLib(TestWornBase):
       r = parse_args(['report', '--comment', 'that', 'and', 'this'])
       self.assertEqual(mock_debug.call_count, 1)
       self.assertEqual(r[-1].comment, 'that and this')
+      self.assertFalse(r[-1].totals)
+
+    with patch('builtins.print') as mock_debug:
+      self.assertTrue(parse_args(['report', '--totals'])[-1].totals)
 
 if __name__ == '__main__':
   unittest.main(buffer=True)
@@ -0,0 +1,77 @@
+from test import *
+from lib import db, InvalidTimeE, InvalidTypeE
+from lib.db import bulk
+
+class TestBulk(TestDbBase):
+  def test_sniff(self):
+    self.assertEqual(bulk.sniff('{"at": 1709251000, "project": "Sequoia", "state": "started"}\n'), 'ndjson')
+    self.assertEqual(bulk.sniff('at,project,state\n'), 'csv')
+    self.assertEqual(bulk.sniff('cat <<-EOQ\n'), 'raw')
+    self.assertEqual(bulk.sniff(f'1709251000-0 project {self.valid_uuid} state started\n'), 'raw')
+    self.assertEqual(bulk.sniff(f'redis-cli XADD logs 1709251000-* project {self.valid_uuid} state started\n'), 'raw')
+
+  def test_read(self):
+    self.assertEqual(list(bulk.read(['at,project,state,name\n', '1709251000,Sequoia,started,\n', '2024-02-29 23:58:20,Sequoia,stopped,\n'])),
+                     [(1709251000, 'Sequoia', 'started', ''), (int(datetime(2024, 2, 29, 23, 58, 20).timestamp()), 'Sequoia', 'stopped', '')])
+    self.assertEqual(list(bulk.read([f'{{"when": "1709251000-0", "project": "{self.valid_uuid}", "state": "started", "name": "Sequoia"}}\n', '\n'])),
+                     [(1709251000, str(self.valid_uuid), 'started', 'Sequoia')])
+    self.assertEqual(list(bulk.read(['cat <<-EOQ\n', f'1709251000-0 project {self.valid_uuid} state started\n', 'EOQ\n'])),
+                     [(1709251000, str(self.valid_uuid), 'started', None)])
+    self.assertEqual(list(bulk.read([])), [])
+
+    with self.assertRaises(InvalidTypeE):
+      list(bulk.read(['at,project,state\n', '1709251000,Sequoia,paused\n']))
+    with self.assertRaises(InvalidTypeE):
+      list(bulk.read(['at,project\n', '1709251000,Sequoia\n']))
+    with self.assertRaises(InvalidTimeE):
+      list(bulk.read(['at,project,state\n', 'whenever,Sequoia,started\n'], 'csv'))
+    with self.assertRaises(AssertionError):
+      list(bulk.read([], 'xml'))
+
+  def test_load(self):
+    records = [(1709251100, 'Sequoia', 'stopped', None), (1709251000, 'Sequoia', 'started', None),
+               (1709251200, 'sequoia', 'started', None), (1711929600, str(self.valid_uuid), 'stopped', 'Spruce')]
+    self.assertEqual(bulk.load(records, batch_size=2), (4, 0))
+
+    names = db.get('projects:names')
+    self.assertEqual(set(names), {'sequoia', 'spruce'})
+    self.assertEqual(names['spruce'], str(self.valid_uuid))
+    self.assertEqual(db.get('schema'), str(db.migrations.LATEST))
+    self.assertEqual([(sid.split('-')[0], entry['project']) for sid, entry in db.xrange('logs')],
+                     [('1709251000', names['sequoia']), ('1709251100', names['sequoia']), ('1709251200', names['sequoia']), ('1711929600', names['spruce'])])
+    self.assertEqual(set(db.catalogued('logs')), {'2024-02', '2024-03', '2024-04'})
+
+    '''Only what is newer than the last entry of its month goes in.'''
+    self.assertEqual(bulk.load([(1709251050, 'Sequoia', 'stopped', None), (1709251300, 'Sequoia', 'stopped', None)]), (1, 1))
+    self.assertEqual(len(db.xrange('logs')), 5)
+
+  def test_load_streams(self):
+    def records():
+      yield from ((1709251400, 'Sequoia', 'stopped', None), (1709251200, 'Sequoia', 'started', None))
+      '''The first batch is in before the next one is read.'''
+      self.assertEqual(len(db.xrange('logs')), 2)
+      yield from ((1709251300, 'Sequoia', 'stopped', None), (1709251500, 'Sequoia', 'started', None))
+
+    self.assertEqual(bulk.load(records(), batch_size=2), (3, 1))
+    self.assertEqual([sid.split('-')[0] for sid, _ in db.xrange('logs')], ['1709251200', '1709251400', '1709251500'])
+    self.assertEqual(len(db.get('projects')), 1)
+
+  def test_load_unnamed(self):
+    '''Raw input only has ids, so the ones that aren't known yet get a name to rename them from.'''
+    other = uuid4()
+    db.add('projects', {other: 'Spruce'})
+    self.assertEqual(bulk.load([(1711929600, str(self.valid_uuid), 'started', None), (1711929700, str(other), 'stopped', None)]), (2, 0))
+    self.assertEqual(db.get('projects'), {str(self.valid_uuid): f'Imported {self.valid_uuid}', str(other): 'Spruce'})
+    self.assertEqual(db.get('projects:names', f'imported {self.valid_uuid}'), str(self.valid_uuid))
+
+  def test_load_unshares(self):
+    bulk.load([(1711929600, 'Sequoia', 'started', None)])
+    version = db.new_version('Testing')
+    self.assertEqual(bulk.load([(1711929700, 'Sequoia', 'stopped', None)]), (1, 0))
+
+    self.assertEqual(len(db.xrange('logs')), 2)
+    self.assertEqual(len(db.xrange(f'logs-{version}')), 1)
+    self.assertNotIn(db.catalogued('logs')['2024-04'], db.catalogued(f'logs-{version}').values())
+
+if __name__ == '__main__':
+  unittest.main(buffer=True)
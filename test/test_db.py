@@ -1,8 +1,88 @@
 from test import *
-#import redis
-from lib import db
+import redis, tempfile
+from lib import db, InvalidTypeE
 
 class TestLib(TestWornBase):
+  def test_connection_pool(self):
+    self.assertEqual(db.backend().name, 'redis')
+    self.assertIs(db.backend().pool, db.backend().pool)
+    self.assertIs(db.connection().connection_pool, db.backend().pool)
+    self.assertIs(db.connection().connection_pool, db.connection().connection_pool)
+
+  def test_configure(self):
+    _pool = db.backend().pool
+    _options = dict(db.backend().options)
+    try:
+      db.configure(max_connections=2, socket_timeout=0.5)
+      self.assertIsNot(db.backend().pool, _pool)
+      self.assertEqual(db.backend().pool.max_connections, 2)
+      self.assertEqual(db.backend().pool.connection_kwargs['socket_timeout'], 0.5)
+      self.assertTrue(db.backend().pool.connection_kwargs['socket_keepalive'])
+
+      with self.assertRaises(AssertionError):
+        db.configure(path='not a redis option')
+      with self.assertRaises(AssertionError):
+        db.configure(backend='not a backend')
+    finally:
+      db.configure(**_options)
+
+  def test_url(self):
+    _options = dict(db.backend().options)
+    try:
+      db.configure(url='unix:///run/redis/redis.sock?db=2')
+      self.assertIs(db.backend().pool.connection_class, redis.UnixDomainSocketConnection)
+      self.assertEqual(db.backend().pool.connection_kwargs['path'], '/run/redis/redis.sock')
+      self.assertEqual(db.backend().pool.connection_kwargs['db'], 2)
+      self.assertNotIn('socket_keepalive', db.backend().pool.connection_kwargs)
+      self.assertEqual(db.backend().raw_pool.connection_kwargs['path'], '/run/redis/redis.sock')
+
+      db.configure(url='redis://example.com:6380/3')
+      self.assertEqual(db.backend().pool.connection_kwargs['host'], 'example.com')
+      self.assertEqual(db.backend().pool.connection_kwargs['port'], 6380)
+      self.assertEqual(db.backend().pool.connection_kwargs['db'], 3)
+      self.assertTrue(db.backend().pool.connection_kwargs['socket_keepalive'])
+    finally:
+      db.configure(**_options)
+
+  def test_replica(self):
+    _options = dict(db.backend().options)
+    try:
+      with patch.object(db, '_wrote', False):
+        self.assertIs(db.reader().connection_pool, db.backend().pool)
+
+        db.configure(replica_url='redis://replica.example.com/0')
+        self.assertEqual(db.reader().connection_pool.connection_kwargs['host'], 'replica.example.com')
+        self.assertEqual(db.reader(raw=True).connection_pool.connection_kwargs['host'], 'replica.example.com')
+        self.assertFalse(db.reader(raw=True).connection_pool.connection_kwargs.get('decode_responses', False))
+        self.assertIsNot(db.connection().connection_pool.connection_kwargs.get('host'), 'replica.example.com')
+
+        with patch('redis.StrictRedis.xrange', autospec=True, return_value=[]) as kirk:
+          db.xrange('versions')
+          self.assertIs(kirk.call_args.args[0].connection_pool, db.backend().replica_pool())
+
+          with patch('redis.StrictRedis.rename'):
+            db.rename('versions', 'versions-1')
+          db.xrange('versions')
+          self.assertIs(kirk.call_args.args[0].connection_pool, db.backend().pool)
+    finally:
+      db.configure(**_options)
+
+  def test_settings(self):
+    with tempfile.NamedTemporaryFile('w', suffix='.conf') as config:
+      config.write('[worn]\nbackend = sqlite\n\n[redis]\nurl = unix:///tmp/redis.sock\ndb = 2\nsocket_keepalive = no\n')
+      config.flush()
+
+      with patch.object(db, 'CONFIG', config.name):
+        self.assertEqual(db.settings('worn'), {'backend': 'sqlite'})
+        self.assertEqual(db.settings('memory'), {})
+        self.assertEqual(db.backend().settings(db.settings('redis')), {'url': 'unix:///tmp/redis.sock', 'db': 2, 'socket_keepalive': False})
+
+        with patch.dict('os.environ', WORN_REDIS_URL='redis://localhost/4'):
+          self.assertEqual(db.backend().settings(db.settings('redis'))['url'], 'redis://localhost/4')
+
+      with self.assertRaises(AssertionError):
+        db.backend().settings({'path': 'not a redis option'})
+
   def test_xrange(self):
     with patch.multiple('redis.StrictRedis', xrevrange=DEFAULT, xrange=DEFAULT) as neone:
       db.xrange('skooter')
@@ -39,6 +119,67 @@ class TestLib(TestWornBase):
       self.assertEqual(kirk.call_args.args, ('what was that', '9', '3'))
       self.assertEqual(kirk.call_args.kwargs, dict(count=7))
 
+  def test_xiter(self):
+    pages = [
+      [('1-0', {'a': '1'}), ('1-1', {'a': '2'})],
+      [('2-0', {'a': '3'}), ('3-9', {'a': '4'})],
+      [('4-0', {'a': '5'})],
+    ]
+    with patch('redis.StrictRedis.xrange', side_effect=iter(pages)) as kirk, patch.object(db, 'catalogued', return_value={'1970-01': 'logs:1970-01'}):
+      walker = db.xiter('logs', page_size=2)
+      self.assertEqual(next(walker), ('1-0', {'a': '1'}))
+      self.assertEqual(kirk.call_count, 1)
+
+      self.assertEqual([_[0] for _ in walker], ['1-1', '2-0', '3-9', '4-0'])
+      self.assertEqual(kirk.call_count, 3)
+      self.assertEqual(kirk.mock_calls[0].args, ('logs:1970-01', '-', '+'))
+      self.assertEqual(kirk.mock_calls[0].kwargs, dict(count=2))
+      self.assertEqual(kirk.mock_calls[1].args, ('logs:1970-01', '1-2', '+'))
+      self.assertEqual(kirk.mock_calls[2].args, ('logs:1970-01', '3-10', '+'))
+
+    with patch('redis.StrictRedis.xrange', side_effect=iter([pages[0], pages[1][:1]])) as kirk, patch.object(db, 'catalogued', return_value={'1970-01': 'logs:1970-01'}):
+      self.assertEqual([_[0] for _ in db.xiter('logs', '1-0', '9-0', 2, count=3)], ['1-0', '1-1', '2-0'])
+      self.assertEqual(kirk.call_count, 2)
+      self.assertEqual(kirk.mock_calls[0].args, ('logs:1970-01', '1-0', '9-0'))
+      self.assertEqual(kirk.mock_calls[1].kwargs, dict(count=1))
+
+    with patch('redis.StrictRedis.xrange', side_effect=iter([pages[1], pages[2], [], []])) as kirk, patch.object(db, 'catalogued', return_value={'1970-01': 'logs:1970-01', '2024-03': 'logs:2024-03'}):
+      '''A count spans partitions, reading each only until it is filled.'''
+      self.assertEqual([_[0] for _ in db.xiter('logs', page_size=3)], ['2-0', '3-9', '4-0'])
+      self.assertEqual([call.args[0] for call in kirk.mock_calls[:2]], ['logs:1970-01', 'logs:2024-03'])
+      self.assertEqual(kirk.mock_calls[1].kwargs, dict(count=1))
+
+    with patch('redis.StrictRedis.xrange') as kirk, patch.object(db, 'catalogued', return_value={'1970-01': 'logs:1970-01', '2024-03': 'logs:2024-03'}):
+      db.xrange('logs', start='1711255800-0', count=1)
+      self.assertEqual([call.args[0] for call in kirk.call_args_list], ['logs:2024-03'])
+
+    with patch('redis.StrictRedis.xrange', side_effect=iter([pages[2]])) as kirk, patch.object(db, 'catalogued', return_value={'1970-01': 'logs:1970-01'}):
+      self.assertEqual(len(list(db.xiter('logs', page_size=2))), 1)
+      self.assertEqual(kirk.call_count, 1)
+
+    with self.assertRaises(AssertionError):
+      next(db.xiter('logs', page_size=0))
+
+  def test_xiter_where(self):
+    self.assertFalse(db.raw_connection().connection_pool.connection_kwargs.get('decode_responses', False))
+    self.assertIs(db.raw_connection().connection_pool, db.backend().raw_pool)
+
+    pages = [
+      [(b'1-0', {b'project': b'a', b'state': b'started'}), (b'1-1', {b'project': b'b', b'state': b'started'})],
+      [(b'2-0', {b'project': b'a', b'state': b'stopped'})],
+    ]
+    with patch('redis.StrictRedis.xrange', side_effect=iter(pages)) as kirk, patch.object(db, 'catalogued', return_value={'1970-01': 'logs:1970-01'}):
+      self.assertEqual(list(db.xiter('logs', page_size=2, where={'state': 'stopped'})), [('2-0', {'project': 'a', 'state': 'stopped'})])
+      self.assertEqual(kirk.mock_calls[1].args, ('logs:1970-01', '1-2', '+'))
+
+    with patch('redis.StrictRedis.xrange', return_value=[('1-0', {'project': 'a', 'state': 'started'}), ('1-1', {'project': 'b', 'state': 'stopped'})]), patch.object(db, 'catalogued', return_value={'1970-01': 'logs:1970-01'}):
+      self.assertEqual([_[0] for _ in db.xiter('logs', where={'project': 'b', 'state': {'stopped', 'paused'}})], ['1-1'])
+
+    with patch.object(db, '_indexed', return_value=iter([('1-1', {'project': 'b', 'state': 'stopped'})])) as index:
+      self.assertEqual([_[0] for _ in db.xiter('logs', where={'project': {'b', 'c'}})], ['1-1'])
+      self.assertEqual(index.call_args.args[0], 'logs')
+      self.assertEqual(index.call_args.args[5][0], ('project', {'b', 'c'}))
+
   def test_xinfo(self):
     with patch('redis.StrictRedis.xinfo_stream', return_value={'a': 'b'}) as babbling_brook:
       '''A brook is a pall in comparison to a stream'''
@@ -136,7 +277,7 @@ class TestLib(TestWornBase):
       self.assertEqual(neone['rename'].call_count, 1)
       self.assertEqual(neone['rename'].call_args.args, ('this', 'that'))
 
-      self.assertEqual(neone['save'].call_count, 1)
+      self.assertEqual(neone['save'].call_count, 0)
 
   def test_rm(self):
     with patch.multiple('redis.StrictRedis', delete=DEFAULT, save=DEFAULT) as archive:
@@ -145,7 +286,7 @@ class TestLib(TestWornBase):
       self.assertEqual(archive['delete'].call_count, 1)
       self.assertEqual(archive['delete'].call_args.args, ('iron',))
 
-      self.assertEqual(archive['save'].call_count, 1)
+      self.assertEqual(archive['save'].call_count, 0)
 
     with patch.multiple('redis.StrictRedis', hdel=DEFAULT, save=DEFAULT) as archive:
       '''We don't remove things, we archive them FOREVER.'''
@@ -158,7 +299,7 @@ class TestLib(TestWornBase):
         self.assertEqual(archive['hdel'].call_count, 1)
         self.assertEqual(archive['hdel'].call_args.args, ('body', 'brain'))
 
-        self.assertEqual(archive['save'].call_count, 1)
+        self.assertEqual(archive['save'].call_count, 0)
 
     with patch.multiple('redis.StrictRedis', xdel=DEFAULT, save=DEFAULT) as archive:
       with patch('redis.StrictRedis.type', return_value='stream') as brook:
@@ -170,7 +311,7 @@ class TestLib(TestWornBase):
         self.assertEqual(archive['xdel'].call_count, 1)
         self.assertEqual(archive['xdel'].call_args.args, ('forest', 'tree'))
 
-        self.assertEqual(archive['save'].call_count, 1)
+        self.assertEqual(archive['save'].call_count, 0)
 
       with patch('redis.StrictRedis.type', return_value='set') as toy:
         '''A toy is a made up version of things in real life'''
@@ -189,7 +330,7 @@ class TestLib(TestWornBase):
         self.assertEqual(mockarena['hsetnx'].call_count, 3)
 #        self.assertEqual(mockarena['hsetnx'].call_args.args, [('dance_floor','disco', 'ball'), ('dance_floor', 'strobe', 'lights'), ('dance_floor', 'party', '1')])
 
-        self.assertEqual(mockarena['save'].call_count, 1)
+        self.assertEqual(mockarena['save'].call_count, 0)
 
     with patch.multiple('redis.StrictRedis', hset=DEFAULT, save=DEFAULT) as mockarena:
       '''Do a little dance, make a little love, get down tonight'''
@@ -203,7 +344,7 @@ class TestLib(TestWornBase):
         self.assertEqual(mockarena['hset'].call_args.args, ('dance_floor',))
         self.assertEqual(mockarena['hset'].call_args.kwargs, dict(mapping={'disco': 'ball', 'strobe': 'lights', 'party': '1'}))
 
-      self.assertEqual(mockarena['save'].call_count, 1)
+      self.assertEqual(mockarena['save'].call_count, 0)
 
     with patch.multiple('redis.StrictRedis', xadd=DEFAULT, save=DEFAULT) as mockarena:
       '''Do a little dance, make a little love, get down tonight'''
@@ -217,7 +358,7 @@ class TestLib(TestWornBase):
         self.assertEqual(mockarena['xadd'].call_args.args, ('pebbles',{'flat': 'skippable'}))
         self.assertEqual(mockarena['xadd'].call_args.kwargs, dict(id='123'))
 
-        self.assertEqual(mockarena['save'].call_count, 1)
+        self.assertEqual(mockarena['save'].call_count, 0)
 
         db.add('pebbles', {'flat': 'skippable', 'round': 'grey'})
         self.assertEqual(brook.call_args.args, ('pebbles',))
@@ -227,7 +368,7 @@ class TestLib(TestWornBase):
         self.assertEqual(mockarena['xadd'].call_args.args, ('pebbles',{'flat': 'skippable', 'round': 'grey'}))
         self.assertEqual(mockarena['xadd'].call_args.kwargs, dict(id='*'))
 
-      self.assertEqual(mockarena['save'].call_count, 2)
+      self.assertEqual(mockarena['save'].call_count, 0)
 
     with patch.multiple('redis.StrictRedis', set=DEFAULT, save=DEFAULT) as mockachino:
       '''CAFFEINATE, CAFFEINATE, CAFFEINATE!!!'''
@@ -241,7 +382,7 @@ class TestLib(TestWornBase):
         self.assertEqual(mockachino['set'].call_args.args, ('re-useable cup', 'bean water'))
         self.assertEqual(mockachino['set'].call_args.kwargs, dict(nx=False, ex=None))
 
-        self.assertEqual(mockachino['save'].call_count, 1)
+        self.assertEqual(mockachino['save'].call_count, 0)
 
         db.add('tiny', 'bubbles', nx=True)
         self.assertEqual(atom.call_count, 2)
@@ -251,7 +392,7 @@ class TestLib(TestWornBase):
         self.assertEqual(mockachino['set'].call_args.args, ('tiny', 'bubbles'))
         self.assertEqual(mockachino['set'].call_args.kwargs, dict(nx=True, ex=None))
 
-        self.assertEqual(mockachino['save'].call_count, 2)
+        self.assertEqual(mockachino['save'].call_count, 0)
 
         db.add('frothy', 'foam', nx=True, expire=1)
         self.assertEqual(atom.call_count, 3)
@@ -261,7 +402,7 @@ class TestLib(TestWornBase):
         self.assertEqual(mockachino['set'].call_args.args, ('frothy', 'foam'))
         self.assertEqual(mockachino['set'].call_args.kwargs, dict(nx=True, ex=1))
 
-      self.assertEqual(mockachino['save'].call_count, 3)
+      self.assertEqual(mockachino['save'].call_count, 0)
 
     with patch.multiple('redis.StrictRedis', hsetnx=DEFAULT, save=DEFAULT) as advert:
       '''Sell me something'''
@@ -269,7 +410,7 @@ class TestLib(TestWornBase):
         db.add('action_figure', {'pants': 'red'}, nx=True)
         self.assertEqual(advert['hsetnx'].call_count, 1)
         self.assertEqual(advert['hsetnx'].call_args.args, ('action_figure','pants', 'red'))
-        self.assertEqual(advert['save'].call_count, 1)
+        self.assertEqual(advert['save'].call_count, 0)
 
     with patch.multiple('redis.StrictRedis', hset=DEFAULT, save=DEFAULT) as advert:
       '''Sell me something'''
@@ -278,7 +419,7 @@ class TestLib(TestWornBase):
         self.assertEqual(advert['hset'].call_count, 1)
         self.assertEqual(advert['hset'].call_args.args, ('doll',))
         self.assertEqual(advert['hset'].call_args.kwargs, dict(mapping=dict(pants='blue')))
-        self.assertEqual(advert['save'].call_count, 1)
+        self.assertEqual(advert['save'].call_count, 0)
 
     with patch.multiple('redis.StrictRedis', xadd=DEFAULT, save=DEFAULT) as advert:
       '''Sell me something'''
@@ -287,7 +428,7 @@ class TestLib(TestWornBase):
         self.assertEqual(advert['xadd'].call_count, 1)
         self.assertEqual(advert['xadd'].call_args.args, ('doll', dict(shirt='green')))
         self.assertEqual(advert['xadd'].call_args.kwargs, dict(id='123-0'))
-        self.assertEqual(advert['save'].call_count, 1)
+        self.assertEqual(advert['save'].call_count, 0)
 
     with patch.multiple('redis.StrictRedis', set=DEFAULT, save=DEFAULT) as advert:
       '''Sell me something'''
@@ -295,7 +436,7 @@ class TestLib(TestWornBase):
         db.add('doll', 'hair')
         self.assertEqual(advert['set'].call_count, 1)
         self.assertEqual(advert['set'].call_args.args, ('doll', 'hair'))
-        self.assertEqual(advert['save'].call_count, 1)
+        self.assertEqual(advert['save'].call_count, 0)
 
     with patch('redis.StrictRedis.type', return_value=None) as toy:
       '''A toy is a made up version of things in real life'''
@@ -314,5 +455,154 @@ class TestLib(TestWornBase):
       self.assertEqual(neone['save'].call_count, 0)
       self.assertEqual(neone['bgsave'].call_count, 1)
 
+  def test_declared(self):
+    self.assertEqual(db.declared('projects'), 'hash')
+    self.assertEqual(db.declared('logs'), 'stream')
+    self.assertEqual(db.declared(f'logs-{uuid4()}'), 'stream')
+    self.assertEqual(db.declared('logs:2024-03'), 'stream')
+    self.assertEqual(db.declared(f'logs-{uuid4()}:2024-03'), 'stream')
+    self.assertEqual(db.declared('logs:catalog'), 'hash')
+    self.assertEqual(db.declared(f'logs-{uuid4()}:catalog'), 'hash')
+    self.assertEqual(db.declared('versions'), 'stream')
+    self.assertEqual(db.declared('begun'), 'string')
+    self.assertEqual(db.declared('cache:tickets'), 'hash')
+    self.assertIsNone(db.declared('cabinet'))
+
+    try:
+      db.declare('drawer:*', 'hash')
+      self.assertEqual(db.declared('drawer:socks'), 'hash')
+      with self.assertRaises(AssertionError):
+        db.declare('drawer:*', 'set')
+    finally:
+      db.SCHEMA.pop('drawer:*')
+
+  def test_declared_keys_skip_type(self):
+    with patch.dict(db.CACHED, clear=True), patch.multiple('redis.StrictRedis', type=DEFAULT, hget=DEFAULT, hgetall=DEFAULT, hexists=DEFAULT, exists=DEFAULT, hdel=DEFAULT, xadd=DEFAULT, hsetnx=DEFAULT) as magician:
+      magician['hget'].return_value, magician['hgetall'].return_value = 'Worn', {}
+      self.assertEqual(db.get('projects', self.valid_uuid), 'Worn')
+      db.has('projects', self.valid_uuid)
+      db.rm('projects', 'worn')
+      db.add('logs', {'project': self.valid_uuid, 'state': 'started', 'id': '123-0'})
+
+      self.assertEqual(magician['type'].call_count, 0)
+      self.assertEqual(magician['exists'].call_count, 0)
+      self.assertEqual(magician['hexists'].call_args.args, ('projects', str(self.valid_uuid)))
+      self.assertEqual(magician['hdel'].call_args.args, ('projects', 'worn'))
+      self.assertEqual(magician['xadd'].call_args_list[0].args, ('logs:1970-01', {'project': str(self.valid_uuid), 'state': 'started'}))
+      self.assertEqual(magician['xadd'].call_args.args, (f'logs:1970-01:project:{self.valid_uuid}', {'project': str(self.valid_uuid), 'state': 'started'}))
+      self.assertEqual(magician['hsetnx'].call_args.args, ('logs:catalog', '1970-01', '1'))
+
+      magician['type'].return_value = 'hash'
+      db.get('cabinet', 'rabbit')
+      self.assertEqual(magician['type'].call_count, 1)
+      self.assertEqual(magician['type'].call_args.args, ('cabinet',))
+
+  def test_batch(self):
+    with patch('redis.StrictRedis.type', return_value='hash') as candy:
+      with patch('redis.client.Pipeline.execute', return_value=[]) as round_trip, patch.object(db, 'catalogued', return_value={'2024-03': 'logs:2024-03'}), patch('redis.StrictRedis.hkeys', return_value=['a']):
+        with db.batch() as pipe:
+          db.add('projects', {'a': 'b'})
+          with db.batch() as inner:
+            self.assertIs(inner, pipe)
+            db.rm('projects', 'c')
+          db.rename('logs', 'logs-1')
+          self.assertEqual([args[0] for args, options in pipe.command_stack], ['HSET', 'INCRBY', 'HDEL', 'INCRBY', 'RENAME', 'RENAME', 'RENAME', 'RENAME', 'INCRBY'])
+          self.assertEqual([args[1:] for args, options in pipe.command_stack if args[0] == 'RENAME'], [('logs:2024-03', 'logs-1:2024-03'), ('logs:2024-03:project:a', 'logs-1:2024-03:project:a'), ('logs:2024-03:projects', 'logs-1:2024-03:projects'), ('logs:catalog', 'logs-1:catalog')])
+          self.assertEqual(round_trip.call_count, 0)
+        self.assertEqual(round_trip.call_count, 1)
+
+        with self.assertRaises(InvalidTypeE):
+          with db.batch() as pipe:
+            db.add('projects', {'a': 'b'})
+            raise InvalidTypeE('Never mind')
+        self.assertEqual(round_trip.call_count, 1)
+
+        db.add('projects', {'a': 'b', 'c': 'd'}, nx=True)
+        self.assertEqual(round_trip.call_count, 2)
+
+  def test_log(self):
+    with patch('redis.commands.core.Script.__call__', return_value=['0-0', '', '1711255800-0']) as evalsha:
+      self.assertEqual(db.log('started', self.valid_uuid, 1711255800, name='Worn'), ('0-0', None, '1711255800-0'))
+      self.assertEqual(evalsha.call_count, 1)
+      self.assertEqual(evalsha.call_args.kwargs['keys'], ['logs', 'logs:catalog', 'logs:catalog:version', 'projects', 'projects:names', 'projects:version', 'begun', 'schema', 'handles', 'handles:ids', 'handles:next', 'handles:version'])
+      self.assertEqual(evalsha.call_args.kwargs['args'], ['started', str(self.valid_uuid), '1711255800', '2024-03', '', 'Worn', 'worn', db.migrations.LATEST, db.ENCODING, len(db.GROUPS), *db.GROUPS])
+      self.assertIn("redis.call('XADD', partition", db.backend()._scripts['log'].script)
+
+  def test_append(self):
+    with patch('redis.commands.core.Script.__call__', return_value=['1711255800-0', '1711255860-0']) as evalsha, patch.object(db, 'ENCODING', 'plain'):
+      self.assertEqual(db.append({'project': self.valid_uuid, 'state': 'stopped', 'id': '1711255860-*'}), ('1711255800-0', '1711255860-0'))
+      self.assertEqual(evalsha.call_count, 1)
+      self.assertEqual(evalsha.call_args.kwargs['keys'], ['logs', 'logs:catalog', 'logs:catalog:version'])
+      self.assertEqual(evalsha.call_args.kwargs['args'], ['1711255860-*', '2024-03', str(self.valid_uuid), len(db.GROUPS), *db.GROUPS, 'project', str(self.valid_uuid), 'state', 'stopped'])
+
+      evalsha.return_value = ['1711255860-0', '']
+      self.assertEqual(db.append({'project': self.valid_uuid, 'state': 'started', 'id': '1711255800-*'}), ('1711255860-0', None))
+
+  def test_totals(self):
+    with patch('redis.commands.core.Script.__call__', return_value=[str(self.valid_uuid), 90]) as evalsha, patch.object(db, 'catalogued', return_value={'2024-02': 'logs:2024-02', '2024-03': 'logs:2024-03', '2024-04': 'logs:2024-04'}):
+      self.assertDictEqual(db.totals('logs', '1711255800-0', projects={self.valid_uuid}), {str(self.valid_uuid): 90})
+      self.assertEqual(evalsha.call_count, 1)
+      self.assertEqual(evalsha.call_args.kwargs['keys'], ['handles', f'logs:2024-03:project:{self.valid_uuid}', f'logs:2024-04:project:{self.valid_uuid}'])
+      self.assertEqual(evalsha.call_args.kwargs['args'], ['1711255800-0', '+', db.PAGE_SIZE, '01'])
+
+      self.assertDictEqual(db.totals('logs', '1711255800-0'), {str(self.valid_uuid): 90})
+      self.assertEqual(evalsha.call_args.kwargs['keys'], ['handles', 'logs:2024-03', 'logs:2024-04'])
+      self.assertEqual(evalsha.call_args.kwargs['args'], ['1711255800-0', '+', db.PAGE_SIZE, '01'])
+
+      self.assertDictEqual(db.totals('logs', projects=set()), {})
+      self.assertEqual(evalsha.call_count, 2)
+
+  def test_persist(self):
+    _durability = db.DURABILITY
+    try:
+      with patch.multiple('redis.StrictRedis', save=DEFAULT, bgsave=DEFAULT, rename=DEFAULT, info=DEFAULT) as neone:
+        db.configure(durability='none')
+        db.persist()
+
+        db.configure(durability='once-per-command')
+        db.persist()
+        self.assertEqual(neone['save'].call_count, 0)
+
+        db.rename('this', 'that')
+        db.rename('that', 'this')
+        db.persist()
+        self.assertEqual(neone['save'].call_count, 1)
+        self.assertEqual(neone['bgsave'].call_count, 0)
+
+        db.persist()
+        self.assertEqual(neone['save'].call_count, 1)
+
+        db.configure(durability='bgsave')
+        db.rename('this', 'that')
+        db.persist()
+        self.assertEqual(neone['save'].call_count, 1)
+        self.assertEqual(neone['bgsave'].call_count, 1)
+
+        db.configure(durability='none')
+        db.rename('that', 'this')
+        db.persist()
+        self.assertEqual(neone['save'].call_count, 1)
+        self.assertEqual(neone['bgsave'].call_count, 1)
+
+        db.configure(durability='every-3-writes')
+        neone['info'].return_value = {'rdb_changes_since_last_save': 2}
+        db.rename('this', 'that')
+        db.persist()
+        self.assertEqual(neone['info'].call_args.args, ('persistence',))
+        self.assertEqual(neone['bgsave'].call_count, 1)
+
+        neone['info'].return_value = {'rdb_changes_since_last_save': 3}
+        db.rename('that', 'this')
+        db.persist()
+        self.assertEqual(neone['save'].call_count, 1)
+        self.assertEqual(neone['bgsave'].call_count, 2)
+
+      with self.assertRaises(AssertionError):
+        db.configure(durability='every-0-writes')
+      with self.assertRaises(AssertionError):
+        db.configure(durability='always')
+    finally:
+      db.configure(durability=_durability)
+
 if __name__ == '__main__':
   unittest.main(buffer=True)
@@ -0,0 +1,132 @@
+from test import *
+import json
+import tempfile
+from lib import db
+from lib.db import journal
+from lib.db.backend import Connection, Pipeline
+from lib.db.memory_backend import MemoryBackend
+from lib.project import Project, FauxProject
+
+def refused(*args, **kw):
+  raise ConnectionError('Connection refused')
+
+class Refused(Connection):
+  '''A connection to a server that is down: every command is refused, on its own or in a pipeline.'''
+  atomic = type = exists = get = set = incr = delete = rename = refused
+  hget = hgetall = hkeys = hexists = hset = hsetnx = hdel = refused
+  xadd = xdel = xtrim = xrange = xrevrange = xinfo_stream = xinfo_groups = xgroup_create = refused
+
+class TestJournal(TestDbBase):
+  def setUp(self):
+    super().setUp()
+    self.tmp = tempfile.TemporaryDirectory()
+    self.addCleanup(self.tmp.cleanup)
+    self.journal = os.path.join(self.tmp.name, 'journal.ndjson')
+    patcher = patch.multiple(db, JOURNAL=self.journal, JOURNAL_MODE='fallback')
+    patcher.start()
+    self.addCleanup(patcher.stop)
+    patcher = patch.multiple(journal, offline=False, _remembered=None)
+    patcher.start()
+    self.addCleanup(patcher.stop)
+
+  def unreachable(self):
+    return patch.object(Pipeline, 'execute', side_effect=ConnectionError('Connection refused'))
+
+  def test_always(self):
+    with patch.object(db, 'JOURNAL_MODE', 'always'):
+      db.add('projects', {'sequoia': self.valid_uuid})
+      self.assertEqual(db.log('started', self.valid_uuid, 1711255800), ('0-0', None, None))
+      self.assertFalse(db.has('projects'))
+      self.assertFalse(db.has('logs'))
+      self.assertEqual(journal.records(), [
+        [['add', ['projects', {'sequoia': str(self.valid_uuid)}], {'expire': None, 'nx': False}]],
+        [['log', ['started', str(self.valid_uuid), '1711255800'], {'name': None, 'begun': None}]],
+      ])
+
+      self.assertEqual(journal.replay(), 2)
+    self.assertFalse(journal.pending())
+    self.assertEqual(db.get('projects', 'sequoia'), str(self.valid_uuid))
+    self.assertEqual(db.xrange('logs')[0][0], '1711255800-0')
+
+  def test_fallback(self):
+    with self.unreachable():
+      db.add('logs', {'project': self.valid_uuid, 'state': 'started', 'id': '1711255800-0'})
+    self.assertTrue(journal.pending())
+    self.assertFalse(db.has('logs'))
+
+    '''The server is back, but later writes wait behind the journaled ones so they apply in order.'''
+    db.add('logs', {'project': self.valid_uuid, 'state': 'stopped', 'id': '1711255900-0'})
+    self.assertFalse(db.has('logs'))
+    self.assertEqual(len(journal.records()), 2)
+
+    self.assertEqual(journal.replay(), 2)
+    self.assertEqual([(tid, entry['state']) for tid, entry in db.xrange('logs')], [('1711255800-0', 'started'), ('1711255900-0', 'stopped')])
+    self.assertEqual(db.xinfo('logs', 'groups'), len(db.GROUPS))
+
+  def test_start_stop(self):
+    '''A journaled start or stop has no last id to check its time against, that waits for the replay.'''
+    with patch.object(db, 'JOURNAL_MODE', 'always'):
+      Project(self.valid_uuid, 'Sequoia').start(self.known_date)
+      Project(self.valid_uuid, 'Sequoia', 'started').stop(self.known_date+timedelta(minutes=10))
+    self.assertEqual([record[0][0] for record in journal.records()], ['log', 'log'])
+    self.assertFalse(db.has('logs'))
+
+    self.assertEqual(journal.replay(), 2)
+    self.assertEqual([entry['state'] for _, entry in db.xrange('logs')], ['started', 'stopped'])
+    self.assertEqual(db.get('projects', self.valid_uuid), 'Sequoia')
+
+  def test_server_down(self):
+    Project(self.valid_uuid, 'Sequoia').start(self.known_date)
+    self.assertTrue(db.has('projects:names', 'sequoia'))
+
+    '''A later command, while the server is down, goes by the projects as they were last read.'''
+    db.invalidate()
+    with patch.multiple(journal, _remembered=None), patch.object(MemoryBackend, 'connection', return_value=Refused()):
+      project, = Project.nearest_project_by_name('Sequoia')
+      self.assertEqual(project.id, self.valid_uuid)
+      project.start(self.known_date+timedelta(minutes=10))
+
+      last, = Project.nearest_project_by_name('last')
+      self.assertIsInstance(last, FauxProject)
+      last.stop(self.known_date+timedelta(minutes=20))
+    self.assertTrue(journal.offline)
+    self.assertEqual([record[0][1][:2] for record in journal.records()], [['started', str(self.valid_uuid)], ['stopped', '']])
+
+    self.assertEqual(journal.replay(), 2)
+    self.assertEqual([entry['state'] for _, entry in db.xrange('logs')], ['started', 'stopped', 'started', 'stopped'])
+    self.assertEqual(db.xrange('logs')[-1][0].split('-')[0], f'{self.known_date+timedelta(minutes=20):%s}')
+
+  def test_replay_keeps_what_it_cannot_send(self):
+    with patch.object(db, 'JOURNAL_MODE', 'always'):
+      db.add('projects', {'sequoia': self.valid_uuid})
+      db.add('projects', {'redwood': self.valid_uuid})
+
+    with self.unreachable():
+      self.assertEqual(journal.replay(), 0)
+    self.assertEqual(len(journal.records()), 2)
+    self.assertFalse(db.has('projects'))
+
+    self.assertEqual(journal.replay(), 2)
+    self.assertCountEqual(db.keys('projects'), ['sequoia', 'redwood'])
+
+  def test_replay_drops_what_the_server_refuses(self):
+    db.add('logs', {'project': self.valid_uuid, 'state': 'started', 'id': '1711255900-0'})
+    with patch.object(db, 'JOURNAL_MODE', 'always'):
+      db.add('logs', {'project': self.valid_uuid, 'state': 'stopped', 'id': '1711255800-0'})
+      db.add('projects', {'sequoia': self.valid_uuid})
+
+    with patch('sys.stderr', new_callable=StringIO) as err:
+      self.assertEqual(journal.replay(), 1)
+    self.assertIn('Dropping', err.getvalue())
+    self.assertFalse(journal.pending())
+    self.assertEqual(db.xinfo('logs', 'length'), 1)
+    self.assertTrue(db.has('projects', 'sequoia'))
+
+  def test_off(self):
+    with patch.object(db, 'JOURNAL_MODE', 'off'), self.unreachable():
+      with self.assertRaises(ConnectionError):
+        db.add('projects', {'sequoia': self.valid_uuid})
+    self.assertFalse(journal.pending())
+
+if __name__ == '__main__':
+  unittest.main(buffer=True)
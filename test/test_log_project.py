@@ -44,91 +44,72 @@ class TestLogProject(TestWornBase):
     _uuid = uuid4()
     _when = now()
     p = LogProject(_uuid, 'What are we doing?', when=time_traveled(since=_when, seconds=4))
-    with self.assertRaises(InvalidTimeE):
-      with patch('lib.db.has', return_value=True) as dbh:
-        with patch('lib.db.xinfo', return_value=f'{time_traveled(since=_when, seconds=3):%s}-0') as dbi:
-          with patch('lib.db.add') as mock_add:
-            p.add()
-            self.assertEqual(mock_add.call_count, 0)
+    with patch('lib.db.append', return_value=(f'{time_traveled(since=_when, seconds=3):%s}-0', None)) as mock_append:
+      with self.assertRaises(InvalidTimeE):
+        p.add()
+      self.assertEqual(mock_append.call_count, 1)
+      self.assertFalse(p._stored)
 
   def test_add_future_time_less_than_ten_seconds(self):
     '''Test that the code properly records entries when the date is less than 10 seconds into the future.'''
     _uuid = uuid4()
     when = now()
     p = LogProject(_uuid, '  What are we doing?  ', when=time_traveled(since=when, op=add, seconds=9))
-    with patch('lib.db.has', return_value=True) as dbh:
-      with patch('lib.db.xinfo', return_value=when) as dbi:
-        with patch('builtins.input') as mock_input:
-          with patch('lib.db.add') as mock_add:
-            p.add()
+    with patch('builtins.input') as mock_input:
+      with patch('lib.db.append', return_value=(f'{when:%s}-0', f'{p.when:%s}-0')) as mock_append:
+        p.add()
 
-            self.assertEqual(dbh.call_count, 1)
-            self.assertEqual(dbi.call_count, 1)
-            self.assertEqual(mock_input.call_count, 0)
+        self.assertEqual(mock_input.call_count, 0)
 
-            self.assertEqual(mock_add.call_count, 1)
-            self.assertEqual(mock_add.call_args.args, ('logs', dict(project=_uuid, state='stopped', id=f'{time_traveled(since=when, op=add, seconds=9):%s}-*')))
-            self.assertTrue(p._stored)
+        self.assertEqual(mock_append.call_count, 1)
+        self.assertEqual(mock_append.call_args.args, (dict(project=_uuid, state='stopped', id=f'{time_traveled(since=when, op=add, seconds=9):%s}-*'),))
+        self.assertTrue(p._stored)
 
   def test_add_future_time_but_user_declines(self):
     '''Test that the code properly records entries when the date is in the future but the user declines the prompt.'''
     _uuid = uuid4()
     when = now()
     p = LogProject(_uuid, '  What are we doing?  ', when=time_traveled(since=when, op=add, seconds=12))
-    with patch('lib.db.has', return_value=True) as dbh:
-      with patch('lib.db.xinfo', return_value=when) as dbi:
-        with patch('builtins.input', return_value='nope') as mock_input:
-          with patch('lib.db.add') as mock_add:
-            p.add()
+    with patch('builtins.input', return_value='nope') as mock_input:
+      with patch('lib.db.append') as mock_append:
+        p.add()
 
-            self.assertEqual(dbh.call_count, 1)
-            self.assertEqual(dbi.call_count, 1)
-            self.assertEqual(mock_input.call_count, 1)
+        self.assertEqual(mock_input.call_count, 1)
 
-            self.assertEqual(mock_add.call_count, 0)
-            self.assertFalse(p._stored)
+        self.assertEqual(mock_append.call_count, 0)
+        self.assertFalse(p._stored)
 
   def test_add_future_time_and_user_agrees(self):
     '''Test that the code properly records entries when the date is in the future and the user aggrees to the prompt.'''
     _uuid = uuid4()
     when = now()
     p = LogProject(_uuid, '  What are we doing?  ', state='started', when=time_traveled(since=when, op=add, seconds=13))
-    with patch('lib.db.has', return_value=True) as dbh:
-      with patch('lib.db.xinfo', return_value=when) as dbi:
-        with patch('builtins.input', return_value='YASUREYOUBECHA') as mock_input:
-          with patch('lib.db.add') as mock_add:
-            p.add()
+    with patch('builtins.input', return_value='YASUREYOUBECHA') as mock_input:
+      with patch('lib.db.append', return_value=(f'{when:%s}-0', f'{p.when:%s}-0')) as mock_append:
+        p.add()
 
-            self.assertEqual(dbh.call_count, 1)
-            self.assertEqual(dbi.call_count, 1)
-            self.assertEqual(mock_input.call_count, 1)
+        self.assertEqual(mock_input.call_count, 1)
 
-            self.assertEqual(mock_add.call_count, 1)
-            self.assertEqual(mock_add.call_args.args, ('logs', dict(project=_uuid, state='started', id=f'{time_traveled(since=when, op=add, seconds=13):%s}-*')))
-            self.assertTrue(p._stored)
+        self.assertEqual(mock_append.call_count, 1)
+        self.assertEqual(mock_append.call_args.args, (dict(project=_uuid, state='started', id=f'{time_traveled(since=when, op=add, seconds=13):%s}-*'),))
+        self.assertTrue(p._stored)
 
   def test_vanillaish_add(self):
     _uuid = uuid4()
     _when = now()
     p = LogProject(_uuid, 'Packed some things', 'stopped', time_traveled(since=_when, seconds=2))
-    with patch('lib.db.has', return_value=False) as dernt_hav:
-      with patch('lib.db.add') as mock_add:
-        p.add()
+    with patch('lib.db.append', return_value=('0-0', f'{p.when:%s}-0')) as mock_append:
+      p.add()
 
-        self.assertEqual(dernt_hav.call_count, 1)
-        self.assertEqual(mock_add.call_count, 1)
-        self.assertEqual(mock_add.call_args.args, ('logs', {'project': _uuid, 'state': 'stopped', 'id': f'{time_traveled(since=_when, seconds=2):%s}-*'}))
- 
-    p = LogProject(_uuid, 'Your phone is going off', 'started', time_traveled(since=_when, seconds=2))
-    with patch('lib.db.has', return_value=True) as dbh:
-      with patch('lib.db.xinfo', return_value=f'{time_traveled(since=_when, seconds=3):%s}-0') as dbi:
-        with patch('lib.db.add') as mock_add:
-          p.add()
+      self.assertEqual(mock_append.call_count, 1)
+      self.assertEqual(mock_append.call_args.args, ({'project': _uuid, 'state': 'stopped', 'id': f'{time_traveled(since=_when, seconds=2):%s}-*'},))
 
-          self.assertEqual(dbh.call_count, 1)
-          self.assertEqual(dbi.call_count, 1)
-          self.assertEqual(mock_add.call_count, 1)
-          self.assertEqual(mock_add.call_args.args, ('logs', {'project': _uuid, 'state': 'started', 'id': f'{time_traveled(since=_when, seconds=2):%s}-*'}))
+    '''Journaled, so nothing is known about the last entry.'''
+    p = LogProject(_uuid, 'Your phone is going off', 'started', time_traveled(since=_when, seconds=2))
+    with patch('lib.db.append', return_value=('0-0', None)) as mock_append:
+      p.add()
+      self.assertEqual(mock_append.call_count, 1)
+      self.assertTrue(p._stored)
 
   def test_remove(self):
     log = LogProject(uuid4(), 'A project', state='started', when=self.known_date)
@@ -159,7 +140,7 @@ class TestLogProject(TestWornBase):
 
         self.assertEqual(mock_range.call_count, 1)
         self.assertEqual(mock_range.call_args.args, ('logs',))
-        self.assertEqual(mock_range.call_args.kwargs, dict(start='-', count=None))
+        self.assertEqual(mock_range.call_args.kwargs, dict(start='-', end=None, count=500, raw=False))
 
         self.assertEqual(mock_project.call_count, 3)
         self.assertEqual(mock_project.mock_calls[0].args, (sample_log_entries[0][1], ))
@@ -178,7 +159,7 @@ class TestLogProject(TestWornBase):
         self.assertTrue(mock_range.called)
         self.assertEqual(mock_range.call_count, 1)
         self.assertEqual(mock_range.call_args.args, (f'logs-{_vuuid}',))
-        self.assertEqual(mock_range.call_args.kwargs, dict(start='-', count=9))
+        self.assertEqual(mock_range.call_args.kwargs, dict(start='-', end=None, count=9, raw=False))
         self.assertEqual(mock_project.call_count, 3)
  
   def test_all_matching_since(self):
@@ -195,14 +176,14 @@ class TestLogProject(TestWornBase):
       (p3.timestamp_id, {'project': str(p2.id), 'state': 'stopped'}),
       (p4.timestamp_id, {'project': str(p1.id), 'state': 'started'})
     ]
-    with patch('lib.db.xrange', return_value=sample_log_entries[1:]) as mock_range:
+    with patch('lib.db._indexed', return_value=iter(sample_log_entries[1:3])) as mock_indexed, patch('lib.db.get', return_value={str(p1.id): p1.name, str(p2.id): p2.name}):
       with patch.object(LogProject, 'make', side_effect=iter([p2, p3, p4])) as mock_project:
         r = list(LogProject.all(matching=p2.name, since=when))
 
-        self.assertEqual(mock_range.call_count, 1)
-        self.assertEqual(mock_range.call_args.args, ('logs',))
-        self.assertEqual(mock_range.call_args.kwargs, dict(start=f'{when:%s}-0', count=None))
-        self.assertEqual(mock_project.call_count, 3)
+        self.assertEqual(mock_indexed.call_count, 1)
+        self.assertEqual(mock_indexed.call_args.args[:5], ('logs', f'{when:%s}-0', None, 500, None))
+        self.assertEqual(mock_indexed.call_args.args[5][0], ('project', {str(p2.id)}))
+        self.assertEqual(mock_project.call_count, 2)
 
 #        self.assertListEqual(r, [p2, p3, p4])
         self.assertTrue(r[0].equiv(p2))
@@ -218,7 +199,7 @@ class TestLogProject(TestWornBase):
 #
 #        self.assertEqual(mock_range.call_count, 1)
 #        self.assertEqual(mock_range.call_args.args, (f'logs-{_vuuid}',))
-#        self.assertEqual(mock_range.call_args.kwargs, dict(start=f'{when:%s}-0', count=None))
+#        self.assertEqual(mock_range.call_args.kwargs, dict(start=f'{when:%s}-0', end=None, count=500))
 #        self.assertEqual(mock_project.call_count, 3)
 #
 #        self.assertListEqual(r, [p2, p3])
@@ -238,7 +219,7 @@ class TestLogProject(TestWornBase):
         self.assertTrue(mock_range.called)
         self.assertEqual(mock_range.call_count, 1)
         self.assertEqual(mock_range.call_args.args, ('logs',))
-        self.assertEqual(mock_range.call_args.kwargs, dict(start=f'{time_traveled(since=when, seconds=4):%s}-0', count=None))
+        self.assertEqual(mock_range.call_args.kwargs, dict(start=f'{time_traveled(since=when, seconds=4):%s}-0', end=None, count=500, raw=False))
 
         self.assertEqual(mock_project.call_count, 2)
 
@@ -252,7 +233,7 @@ class TestLogProject(TestWornBase):
         self.assertTrue(mock_range.called)
         self.assertEqual(mock_range.call_count, 1)
         self.assertEqual(mock_range.call_args.args, (f'logs-{_vuuid}',))
-        self.assertEqual(mock_range.call_args.kwargs, dict(start=f'{time_traveled(since=when, seconds=4):%s}-0', count=None))
+        self.assertEqual(mock_range.call_args.kwargs, dict(start=f'{time_traveled(since=when, seconds=4):%s}-0', end=None, count=500, raw=False))
 
   def test_all_matching(self):
     p1 = LogProject(uuid4(), 'This and that',            state='stopped', when=time_traveled(seconds=5))
@@ -263,28 +244,27 @@ class TestLogProject(TestWornBase):
       (p2.timestamp_id, {'project': str(p2.id), 'state': 'started'}),
       (p3.timestamp_id, {'project': str(p2.id), 'state': 'stopped'})
     ]
-    with patch('lib.db.xrange', return_value=sample_log_entries) as mock_range:
-      with patch('lib.project.LogProject.make', side_effect=iter([p1, p2, p3])) as mock_project:
+    with patch('lib.db._indexed', return_value=iter(sample_log_entries[1:])) as mock_indexed, patch('lib.db.get', return_value={str(p1.id): p1.name, str(p2.id): p2.name}):
+      with patch('lib.project.LogProject.make', side_effect=iter([p2, p3])) as mock_project:
         r = list(LogProject.all(matching=p2.name))
 
-        self.assertTrue(mock_range.called)
-        self.assertEqual(mock_range.call_count, 1)
-        self.assertEqual(mock_range.call_args.args, ('logs',))
-        self.assertEqual(mock_range.call_args.kwargs, dict(start='-', count=None))
+        self.assertTrue(mock_indexed.called)
+        self.assertEqual(mock_indexed.call_count, 1)
+        self.assertEqual(mock_indexed.call_args.args[:5], ('logs', '-', None, 500, None))
+        self.assertEqual(mock_indexed.call_args.args[5][0], ('project', {str(p2.id)}))
 
-        self.assertEqual(mock_project.call_count, 3)
+        self.assertEqual(mock_project.call_count, 2)
 
         self.assertListEqual(r, [p2, p3])
 
     _vuuid = uuid4()
-    with patch('lib.db.xrange', return_value=sample_log_entries) as mock_range:
-      with patch('lib.project.Project.make', side_effect=iter([p1, p2, p3])) as mock_project:
-        r = LogProject.all(matching=p2.name, _version=_vuuid)
+    with patch('lib.db._indexed', return_value=iter(sample_log_entries[1:])) as mock_indexed, patch('lib.db.get', return_value={str(p1.id): p1.name, str(p2.id): p2.name}):
+      with patch('lib.project.LogProject.make', side_effect=iter([p2, p3])) as mock_project:
+        r = list(LogProject.all(matching=p2.name, _version=_vuuid))
 
-        self.assertTrue(mock_range.called)
-        self.assertEqual(mock_range.call_count, 1)
-        self.assertEqual(mock_range.call_args.args, (f'logs-{_vuuid}',))
-        self.assertEqual(mock_range.call_args.kwargs, dict(start='-', count=None))
+        self.assertTrue(mock_indexed.called)
+        self.assertEqual(mock_indexed.call_count, 1)
+        self.assertEqual(mock_indexed.call_args.args[:5], (f'logs-{_vuuid}', '-', None, 500, None))
 
   def test_log_format_with_colors(self):
     from lib.colors import colors
@@ -301,7 +281,35 @@ class TestLogProject(TestWornBase):
     self.assertEqual(f'{project:log!t}', f"""17112558000-0 2024-03-23 21:50:00 state "stopped{colors.reset}" id {_uuid} project 'ohut tölkki'""")
     self.assertEqual(f'{project:log}',   f"""2024-03-23 21:50:00 state "stopped{colors.reset}" id {_uuid} project 'ohut tölkki'""")
 
-  def test_edit_log_time(self): pass
+  def test_edit_log_time(self):
+    _uuid = uuid4()
+    p1 = LogProject(_uuid, 'Rhubarb', 'started', f'{time_traveled(since=self.known_date, minutes=9):%s}-0')
+    p2 = LogProject(_uuid, 'Rhubarb', 'stopped', f'{time_traveled(since=self.known_date, minutes=5):%s}-0')
+    p3 = LogProject(_uuid, 'Rhubarb', 'started', f'{self.known_date:%s}-0')
+    _to = time_traveled(since=self.known_date, minutes=7)
+    with patch.object(LogProject, 'all', side_effect=iter([[p2, p3], [p3]])) as mock_all:
+      with patch('lib.db.xrange', return_value=[(f'{p1.when:%s}-0', {'project': str(_uuid), 'state': 'started'})]) as mock_xrange:
+        with patch('lib.db.new_version') as mock_version:
+          LogProject.edit_log_time(p2.when, _to, 'Forgot to stop')
+
+          self.assertEqual(mock_all.call_count, 2)
+          self.assertEqual(mock_xrange.call_args.kwargs, dict(start=f'({p2.when:%s}-0', reverse=True, count=1))
+          self.assertEqual(mock_version.call_args.args, ('Forgot to stop', {int(f'{p2.when:%s}'): int(f'{_to:%s}')}))
+
+    with patch.object(LogProject, 'all', side_effect=iter([[p2, p3], [p3]])) as mock_all:
+      with patch('lib.db.xrange', return_value=[(f'{p1.when:%s}-0', {'project': str(_uuid), 'state': 'started'})]) as mock_xrange:
+        with patch('lib.db.new_version') as mock_version:
+          with self.assertRaises(InvalidTimeE):
+            LogProject.edit_log_time(p2.when, time_traveled(since=self.known_date, minutes=10), 'Way too early')
+          self.assertEqual(mock_version.call_count, 0)
+
+    with patch.object(LogProject, 'all', side_effect=iter([[p2], [p3]])) as mock_all:
+      with patch('lib.db.xrange', return_value=[(f'{p1.when:%s}-0', {'project': str(_uuid), 'state': 'started'})]) as mock_xrange:
+        with patch('lib.db.new_version') as mock_version:
+          with self.assertRaisesRegex(InvalidTimeE, 'newer than the log entered after it'):
+            LogProject.edit_log_time(p2.when, time_traveled(since=self.known_date, minutes=1, op=add), 'Way too late')
+          self.assertEqual(mock_version.call_count, 0)
+
   def test_edit_last_log_name(self): pass
   def test_edit_last_log_state(self):
     _uuid = uuid4()
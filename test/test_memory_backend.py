@@ -0,0 +1,24 @@
+from test import *
+from test import test_sqlite_backend
+from lib import db, InvalidTypeE
+
+class TestMemoryBackend(test_sqlite_backend.TestSQLiteBackend):
+  '''The memory backend has to behave just like the sqlite one, apart from where it keeps the data.'''
+  def configure(self) -> None:
+    TestDbBase.configure(self)
+
+  def test_selected(self):
+    self.assertEqual(db.backend().name, 'memory')
+    db.add('projects', {'worn': self.valid_uuid})
+    db.backend().flush()
+    self.assertFalse(db.has('projects'))
+
+  def test_batch_is_atomic(self):
+    with self.assertRaises(InvalidTypeE):
+      with db.batch():
+        db.add('projects', {'worn': self.valid_uuid})
+        raise InvalidTypeE('Never mind')
+    self.assertFalse(db.has('projects'))
+
+if __name__ == '__main__':
+  unittest.main(buffer=True)
@@ -0,0 +1,114 @@
+from test import *
+from lib import db
+from lib.db import migrations
+from lib.project import Project, LogProject
+
+class TestMigrations(TestDbBase):
+  def setUp(self):
+    super().setUp()
+    self.redwood = uuid4()
+    '''The layout before version 1: names and ids both in projects.'''
+    db.add('projects', {'sequoia': self.valid_uuid, self.valid_uuid: 'Sequoia', 'redwood': self.redwood, self.redwood: 'Redwood'})
+    '''The layout before version 2: every entry in one stream.'''
+    self.version = uuid4()
+    db.add('versions', {'reason': 'Testing', 'version': self.version, 'id': '*'})
+    with db.connection() as conn:
+      for sid, state in (('1706745600-0', 'started'), ('1709251200-0', 'stopped'), ('1709251300-0', 'started')):
+        conn.xadd('logs', {'project': str(self.valid_uuid), 'state': state}, id=sid)
+      conn.xadd(f'logs-{self.version}', {'project': str(self.redwood), 'state': 'started'}, id='1706745600-0')
+
+  def test_version(self):
+    self.assertEqual(migrations.version(), 0)
+    self.assertEqual([m[0] for m in migrations.pending()], [1, 2, 3])
+
+    db.backend().flush()
+    db.invalidate()
+    self.assertEqual(migrations.version(), migrations.LATEST)
+    self.assertEqual(migrations.pending(), [])
+
+  def test_migrate(self):
+    echo = Mock()
+    self.assertEqual(migrations.migrate(1, echo=echo), 3)
+    self.assertEqual(echo.call_count, 3)
+    self.assertEqual(db.get('schema'), '3')
+    self.assertDictEqual(db.get('projects'), {str(self.valid_uuid): 'Sequoia', str(self.redwood): 'Redwood'})
+    self.assertDictEqual(db.get('projects:names'), {'sequoia': str(self.valid_uuid), 'redwood': str(self.redwood)})
+    self.assertEqual(migrations.migrate(1, echo=echo), 3)
+    self.assertEqual(echo.call_count, 3)
+
+    self.assertEqual(Project.make('Redwood').id, self.redwood)
+    self.assertEqual([p.name for p in Project.all()], ['Redwood', 'Sequoia'])
+
+  def test_resume(self):
+    batches = 0
+    def interrupted(*args, **kw):
+      nonlocal batches
+      if (batches := batches+1) > 1:
+        raise KeyboardInterrupt()
+      return rm(*args, **kw)
+
+    rm = db.rm
+    with patch.object(db, 'rm', side_effect=interrupted), self.assertRaises(KeyboardInterrupt):
+      migrations.migrate(1, echo=Mock())
+    self.assertEqual(migrations.version(), 0)
+    self.assertEqual(len(db.get('projects:names')), 1)
+    self.assertEqual(len(db.get('projects')), 3)
+
+    migrations.migrate(1, echo=Mock())
+    self.assertEqual(migrations.version(), 3)
+    self.assertEqual(len(db.get('projects:names')), 2)
+    self.assertEqual(len(db.get('projects')), 2)
+
+  def test_split_projects(self):
+    '''projects is read once, not once per batch.'''
+    with patch.object(db, 'get', wraps=db.get) as get:
+      migrations.split_projects(1)
+    self.assertEqual([call.args for call in get.call_args_list], [('projects',)])
+    self.assertDictEqual(db.get('projects:names'), {'sequoia': str(self.valid_uuid), 'redwood': str(self.redwood)})
+
+  def test_partition_logs(self):
+    batches = 0
+    def interrupted(*args, **kw):
+      nonlocal batches
+      if (batches := batches+1) > 1:
+        raise KeyboardInterrupt()
+      return touch(*args, **kw)
+
+    touch = db._touch
+    migrations.split_projects(1)
+    with patch.object(db, '_touch', side_effect=interrupted), self.assertRaises(KeyboardInterrupt):
+      migrations.partition_logs(1)
+    self.assertEqual(db.partitions('logs'), ['logs:2024-02'])
+    with db.connection() as conn:
+      self.assertEqual(conn.xinfo_stream('logs')['length'], 2)
+
+    migrations.migrate(1, echo=Mock())
+    with db.connection() as conn:
+      self.assertEqual(conn.exists('logs'), 0)
+      self.assertEqual(conn.exists(f'logs-{self.version}'), 0)
+      self.assertEqual(len(conn.xinfo_groups('logs:2024-03')), len(db.GROUPS))
+    self.assertEqual(db.partitions('logs'), ['logs:2024-02', 'logs:2024-03'])
+    self.assertEqual([sid for sid, _ in db.xrange('logs')], ['1706745600-0', '1709251200-0', '1709251300-0'])
+    self.assertEqual(db.xinfo('logs', 'length'), 3)
+    self.assertEqual([sid for sid, _ in db.xrange(f'logs-{self.version}')], ['1706745600-0'])
+    self.assertTrue(Project.last().is_running())
+
+  def test_index_partitions(self):
+    migrations.split_projects(1)
+    migrations.partition_logs(1)
+    with db.connection() as conn:
+      sid, fields = conn.xrange('logs:2024-03', '-', '+', count=1)[0]
+      conn.xadd(db.index('logs:2024-03', self.valid_uuid), fields, id=sid)
+
+    '''The entry the interrupted run already copied is skipped, and a second run copies nothing.'''
+    migrations.index_partitions(1)
+    migrations.index_partitions(1)
+    with db.connection() as conn:
+      self.assertEqual([sid for sid, _ in conn.xrange(db.index('logs:2024-03', self.valid_uuid))], ['1709251200-0', '1709251300-0'])
+      self.assertEqual([sid for sid, _ in conn.xrange(db.index(f'logs-{self.version}:2024-02', self.redwood))], ['1706745600-0'])
+    self.assertEqual(db.get(db.indexed('logs:2024-02')), {str(self.valid_uuid): '1'})
+    self.assertEqual([log.state for log in LogProject.all(matching=self.valid_uuid)], ['started', 'stopped', 'started'])
+    self.assertEqual(db.totals(projects={self.valid_uuid}), {str(self.valid_uuid): 2505600})
+
+if __name__ == '__main__':
+  unittest.main(buffer=True)
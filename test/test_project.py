@@ -1,6 +1,6 @@
 from test import *
 from lib.project import Project, FauxProject, LogProject
-from lib import now, InvalidTypeE, InvalidTimeE
+from lib import db, now, InvalidTypeE, InvalidTimeE
 
 class TestProject(TestWornBase):
   def setUp(self):
@@ -105,8 +105,10 @@ class TestProject(TestWornBase):
     with patch('lib.db.add') as mock_add:
       p.add()
 
-      self.assertEqual(mock_add.call_count, 2)
-      self.assertEqual(mock_add.call_args.args, ('projects', {'what are we doing?': _uuid, _uuid: 'What are we doing?'}))
+      self.assertEqual(mock_add.call_count, 4)
+      self.assertEqual(mock_add.mock_calls[1].args, ('projects', {_uuid: 'What are we doing?'}))
+      self.assertEqual(mock_add.mock_calls[2].args, ('projects:names', {'what are we doing?': _uuid}))
+      self.assertEqual(mock_add.mock_calls[3].args, ('schema', db.migrations.LATEST))
       self.assertEqual(mock_add.call_args.kwargs, dict(nx=True))
 
   def test_log(self):
@@ -123,7 +125,7 @@ class TestProject(TestWornBase):
 
   def test_stop_project(self):
     proj = LogProject(uuid4(), 'Mud Larker', 'stopped', f'{self.known_date:%s}-0')
-    with patch.object(proj, 'log') as mock_log:
+    with patch('lib.db.log', return_value=(f'{self.known_date:%s}-0', f'{self.known_date:%s}-1', None)) as mock_log:
       proj.stop(self.known_date)
       self.assertFalse(proj.is_running())
       self.assertFalse(mock_log.called)
@@ -131,36 +133,32 @@ class TestProject(TestWornBase):
 
       proj.state = 'started'
       proj.stop(self.known_date)
-      self.assertTrue(proj.is_running())
       self.assertTrue(mock_log.called)
       self.assertEqual(mock_log.call_count, 1)
-      self.assertEqual(mock_log.call_args.args, ('stopped', self.known_date))
+      self.assertEqual(mock_log.call_args.args, ('stopped', proj.id, f'{self.known_date:%s}'))
+      self.assertIsNone(mock_log.call_args.kwargs['name'])
 
   def test_project_without_last(self):
     '''Start a new project without a previous project'''
-    p = Project(uuid4(), 'Testing')
-    p.stop = MagicMock()
-    p.add = MagicMock()
-    p.log = MagicMock()
-    with patch.object(Project, 'last', return_value=FauxProject()) as l:
-      p.start(now())
-      self.assertEqual(p.stop.call_count, 0)
-      self.assertEqual(p.add.call_count, 1)
-      self.assertEqual(p.log.call_count, 1)
+    when = now()
+    p = Project(uuid4(), ' Testing ')
+    with patch('lib.db.log', return_value=('0-0', None, f'{when:%s}-0')) as mock_log:
+      p.start(when)
+      self.assertEqual(mock_log.call_count, 1)
+      self.assertEqual(mock_log.call_args.args, ('started', p.id, f'{when:%s}'))
+      self.assertEqual(mock_log.call_args.kwargs['name'], 'Testing')
 
   def test_start_project_with_last(self):
-    '''Start a new project with a previous project'''
+    '''Start a new project with a previous project, or fail to when the last one was logged later'''
     when = now()
-    with patch.object(Project, 'last', return_value=Project(uuid4(), 'the last thing I did, duh', 'stopped', f'{when:%s}-0')) as last:
-      with patch.multiple(Project, add=DEFAULT, log=DEFAULT, stop=DEFAULT) as mockp:
-        p = Project(uuid4(), 'Testing')
-        p.start(when)
-        self.assertEqual(last.call_count, 1)
-        self.assertEqual(mockp['stop'].call_count, 1)
-        self.assertEqual(mockp['stop'].call_args.args, (when,))
-        self.assertEqual(mockp['add'].call_count, 1)
-        self.assertEqual(mockp['log'].call_count, 1)
-        self.assertEqual(mockp['log'].call_args.args, ('started', when))
+    p = Project(uuid4(), 'Testing')
+    with patch('lib.db.log', return_value=(f'{when:%s}-0', f'{when:%s}-1', f'{when:%s}-2')) as mock_log:
+      p.start(when)
+      self.assertEqual(mock_log.call_count, 1)
+
+    with patch('lib.db.log', return_value=(f'{when:%s}-0', None, None)) as mock_log:
+      with self.assertRaises(InvalidTimeE):
+        p.start(time_traveled(since=when, minutes=1))
 
   def test_rename(self):
     with self.assertRaises(InvalidTypeE):
@@ -175,34 +173,34 @@ class TestProject(TestWornBase):
         self.assertTrue(mock_add.called)
         self.assertEqual(mock_add.call_count, 2)
         self.assertEqual(mock_add.mock_calls[0].args, ('projects', {_uuid: 'Pizza'}))
-        self.assertEqual(mock_add.mock_calls[1].args, ('projects', {'pizza': _uuid}))
+        self.assertEqual(mock_add.mock_calls[1].args, ('projects:names', {'pizza': _uuid}))
 
         self.assertTrue(mock_rm.called)
         self.assertEqual(mock_rm.call_count, 1)
-        self.assertEqual(mock_rm.call_args.args, ('projects', 'chicken nuggets'))
+        self.assertEqual(mock_rm.call_args.args, ('projects:names', 'chicken nuggets'))
 
   def test_remove(self):
     _uuid = uuid4()
     _ts   = f'{self.known_date:%s}-9'
     proj  = Project(_uuid, 'Peanut Butter')
-    with patch('lib.db.xrange', return_value=iter([(_ts, {'project': _uuid, 'state': 'started'})])) as mock_range:
+    with patch('lib.db._indexed', return_value=iter([(_ts, {'project': str(_uuid), 'state': 'started'})])) as mock_indexed:
       with patch('lib.db.get') as mock_get:
         with patch('lib.db.rm') as mock_rm:
           proj.remove()
 
-          self.assertTrue(mock_range.called)
-          self.assertEqual(mock_range.call_count, 1)
-          self.assertEqual(mock_range.call_args.args, ('logs', ))
-          self.assertEqual(mock_range.call_args.kwargs, dict(start='-', count=None))
+          self.assertTrue(mock_indexed.called)
+          self.assertEqual(mock_indexed.call_count, 1)
+          self.assertEqual(mock_indexed.call_args.args[:5], ('logs', '-', None, 500, None))
+          self.assertEqual(mock_indexed.call_args.args[5][0], ('project', {str(_uuid)}))
 
           self.assertTrue(mock_get.called)
           self.assertEqual(mock_get.call_count, 1)
-          self.assertEqual(mock_get.call_args.args, ('projects', _uuid))
+          self.assertEqual(mock_get.call_args.args, ('projects', str(_uuid)))
 
           self.assertTrue(mock_rm.called)
           self.assertEqual(mock_rm.call_count, 3)
           self.assertEqual(mock_rm.mock_calls[0].args, ('logs', _ts))
-          self.assertEqual(mock_rm.mock_calls[1].args, ('projects', 'peanut butter'))
+          self.assertEqual(mock_rm.mock_calls[1].args, ('projects:names', 'peanut butter'))
           self.assertEqual(mock_rm.mock_calls[2].args, ('projects', _uuid))
 
   def test_make_from_dictionary(self):
@@ -312,7 +310,7 @@ class TestProject(TestWornBase):
         self.assertEqual(proj.serial, 5)
 
   def test_make_from_using_project_name(self):
-    '''case str(nameorid) if db.has('projects', nameorid.casefold().strip()):'''
+    '''case str(nameorid) if db.has('projects:names', nameorid.casefold().strip()):'''
     _name = "  I am doing something that I don't want anyone to know about, including myself, so I am making a very obscure description here instead."
     _clean_name = "i am doing something that i don't want anyone to know about, including myself, so i am making a very obscure description here instead."
     _uuid = uuid4()
@@ -321,12 +319,12 @@ class TestProject(TestWornBase):
         proj = Project.make(_name)
         self.assertTrue(mock_has.called)
         self.assertEqual(mock_has.call_count, 2)
-        self.assertEqual(mock_has.mock_calls[0].args, ('projects', _clean_name))
+        self.assertEqual(mock_has.mock_calls[0].args, ('projects:names', _clean_name))
         self.assertEqual(mock_has.mock_calls[1].args, ('projects', _uuid))
 
         self.assertTrue(mock_get.called)
         self.assertEqual(mock_get.call_count, 2)
-        self.assertEqual(mock_get.mock_calls[0].args, ('projects', _clean_name))
+        self.assertEqual(mock_get.mock_calls[0].args, ('projects:names', _clean_name))
         self.assertEqual(mock_get.mock_calls[1].args, ('projects', _uuid))
 
         self.assertIsInstance(proj, Project)
@@ -344,13 +342,14 @@ class TestProject(TestWornBase):
         proj = Project.make(_name)
         self.assertTrue(mock_has.called)
         self.assertEqual(mock_has.call_count, 1)
-        self.assertEqual(mock_has.mock_calls[0].args, ('projects', _clean_name))
+        self.assertEqual(mock_has.mock_calls[0].args, ('projects:names', _clean_name))
 
         self.assertTrue(mock_add.called)
-        self.assertEqual(mock_add.call_count, 2)
-        self.assertEqual(mock_add.call_args.args[0], 'projects')
-        self.assertIn(_clean_name,   list(mock_add.call_args.args[1].keys()))
-        self.assertIn(_name.strip(), list(mock_add.call_args.args[1].values()))
+        self.assertEqual(mock_add.call_count, 4)
+        self.assertEqual(mock_add.mock_calls[1].args[0], 'projects')
+        self.assertIn(_name.strip(), list(mock_add.mock_calls[1].args[1].values()))
+        self.assertEqual(mock_add.mock_calls[2].args[0], 'projects:names')
+        self.assertIn(_clean_name,   list(mock_add.mock_calls[2].args[1].keys()))
         self.assertEqual(mock_add.call_args.kwargs, dict(nx=True))
 
         self.assertIsInstance(proj, Project)
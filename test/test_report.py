@@ -60,6 +60,18 @@ class TestReport(TestWornBase):
         self.assertEqual(last.call_count, 1)
         self.assertEqual(69.0, r._data[p1])
 
+    def test_totals(self):
+      _uuid = uuid4()
+      with patch.object(Project, 'last', return_value=LogProject(_uuid, 'Bye', 'stopped', now())), \
+           patch('lib.db.get', return_value={str(_uuid): 'Bye'}), \
+           patch('lib.db.totals', return_value={str(_uuid): 3600}) as totals:
+        r = Report.totals(since=self.known_date, scale='s')
+        self.assertEqual(totals.call_args.args, ('logs', f'{self.known_date:%s}-0', None))
+        self.assertIsNone(totals.call_args.kwargs['projects'])
+        self.assertDictEqual(r._data, {Project(_uuid, 'Bye'): 3600})
+        self.assertEqual(r.at, self.known_date)
+        self.assertEqual(r.scale, 's')
+
     def test_mail(self):
       _uuid = uuid4()
       with patch.object(Project, 'last', return_value=LogProject(17, 'Bye', 'started', now())) as last:
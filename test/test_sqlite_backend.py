@@ -0,0 +1,313 @@
+from test import *
+import tempfile
+from lib import db, now, InvalidTimeE
+from lib.project import Project, LogProject
+
+class TestSQLiteBackend(TestDbBase):
+  def configure(self) -> None:
+    self.tmp = tempfile.TemporaryDirectory()
+    self.addCleanup(self.tmp.cleanup)
+    db.configure(backend='sqlite', path=os.path.join(self.tmp.name, 'worn.sqlite3'))
+
+  def test_selected(self):
+    self.assertEqual(db.backend().name, 'sqlite')
+    with db.connection() as conn:
+      self.assertEqual(conn.db.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+
+  def test_hash(self):
+    db.add('projects', {'worn': self.valid_uuid, self.valid_uuid: 'Worn'}, nx=True)
+    db.add('projects', {'worn': 'ignored'}, nx=True)
+    self.assertTrue(db.has('projects'))
+    self.assertTrue(db.has('projects', 'worn'))
+    self.assertFalse(db.has('projects', 'nope'))
+    self.assertEqual(db.get('projects', 'worn'), str(self.valid_uuid))
+    self.assertDictEqual(db.get('projects'), {'worn': str(self.valid_uuid), str(self.valid_uuid): 'Worn'})
+    self.assertCountEqual(db.keys('projects'), ['worn', str(self.valid_uuid)])
+
+    db.add('projects', {'worn': 'replaced'})
+    self.assertEqual(db.get('projects', 'worn'), 'replaced')
+
+    db.rm('projects', 'worn')
+    self.assertFalse(db.has('projects', 'worn'))
+    db.rm('projects', self.valid_uuid)
+    self.assertFalse(db.has('projects'))
+    self.assertDictEqual(db.get('projects'), {})
+
+  def test_string(self):
+    db.add('begun', '123', nx=True)
+    db.add('begun', '456', nx=True)
+    self.assertEqual(db.get('begun'), '123')
+
+    db.add('begun', '789', expire=1)
+    self.assertEqual(db.get('begun'), '789')
+    with patch('time.time', return_value=time_traveled(since=datetime.now(), op=add, seconds=2).timestamp()):
+      self.assertFalse(db.has('begun'))
+      self.assertIsNone(db.get('begun'))
+
+  def test_stream(self):
+    for ts in ('1711255800-*', '1711255800-*', '1711255900-0', '1711256000-*'):
+      db.add('logs', {'project': self.valid_uuid, 'state': 'started', 'id': ts})
+
+    self.assertEqual([tid for tid, _ in db.xrange('logs')], ['1711255800-0', '1711255800-1', '1711255900-0', '1711256000-0'])
+    self.assertEqual([tid for tid, _ in db.xrange('logs', reverse=True, count=2)], ['1711256000-0', '1711255900-0'])
+    self.assertEqual([tid for tid, _ in db.xrange('logs', start='1711255800-1', end='1711255900')], ['1711255800-1', '1711255900-0'])
+    self.assertEqual([tid for tid, _ in db.xiter('logs', page_size=1)], ['1711255800-0', '1711255800-1', '1711255900-0', '1711256000-0'])
+    self.assertDictEqual(db.xrange('logs', count=1)[0][1], {'project': str(self.valid_uuid), 'state': 'started'})
+
+    self.assertEqual(db.xinfo('logs', 'length'), 4)
+    self.assertEqual(db.xinfo('logs', 'last-generated-id'), '1711256000-0')
+    self.assertEqual(db.xinfo('logs', 'groups'), len(db.GROUPS))
+
+    with self.assertRaises(db.backend().ResponseError):
+      db.add('logs', {'project': self.valid_uuid, 'state': 'stopped', 'id': '1711255700-0'})
+
+    db.rm('logs', '1711256000-0')
+    self.assertEqual(db.xinfo('logs', 'length'), 3)
+    self.assertEqual(db.xinfo('logs', 'last-generated-id'), '1711256000-0')
+
+  def test_batch_is_atomic(self):
+    with self.assertRaises(InvalidTimeE):
+      with db.batch():
+        db.add('projects', {'worn': self.valid_uuid})
+        raise InvalidTimeE('Never mind')
+    self.assertFalse(db.has('projects'))
+
+    db.add('logs', {'project': self.valid_uuid, 'state': 'started', 'id': '1711255800-0'})
+    with self.assertRaises(db.backend().ResponseError):
+      with db.batch():
+        db.add('projects', {'worn': self.valid_uuid})
+        db.add('logs', {'project': self.valid_uuid, 'state': 'stopped', 'id': '1711255700-0'})
+    self.assertFalse(db.has('projects'))
+
+  def test_cache(self):
+    db.add('projects', {'worn': self.valid_uuid})
+    with patch.object(db.connection().__class__, 'hgetall', autospec=True, side_effect=type(db.connection()).hgetall) as hgetall:
+      self.assertEqual(db.get('projects', 'worn'), str(self.valid_uuid))
+      self.assertTrue(db.has('projects', 'worn'))
+      self.assertEqual(db.keys('projects'), ['worn'])
+      self.assertEqual(db.get('projects:names'), {})
+      self.assertEqual(hgetall.call_count, 2)
+
+      db.add('projects', {'sequoia': 'mine'})
+      self.assertEqual(db.get('projects', 'sequoia'), 'mine')
+      self.assertEqual(hgetall.call_count, 4)
+
+    with db.connection() as conn:
+      '''Another process renames a project.'''
+      conn.hset('projects', 'sequoia', 'theirs')
+      conn.incr('projects:version')
+
+    self.assertEqual(db.get('projects', 'sequoia'), 'mine')
+    with patch.object(db, 'CACHE_TTL', 0):
+      self.assertEqual(db.get('projects', 'sequoia'), 'theirs')
+
+  def test_log(self):
+    sequoia, redwood = uuid4(), uuid4()
+    self.assertEqual(db.log('stopped', sequoia, 1711255800), ('0-0', None, None))
+    self.assertEqual(db.log('started', sequoia, 1711255800, name='Sequoia'), ('0-0', None, '1711255800-0'))
+    self.assertEqual(db.get('projects:names', 'sequoia'), str(sequoia))
+    self.assertEqual(db.get('projects', sequoia), 'Sequoia')
+    self.assertEqual(db.get('schema'), str(db.migrations.LATEST))
+    self.assertEqual(db.log('stopped', redwood, 1711255900), ('1711255800-0', None, None))
+    self.assertEqual(db.log('started', redwood, 1711255900), ('1711255800-0', '1711255900-0', '1711255900-1'))
+    self.assertEqual(db.log('started', sequoia, 1711255850), ('1711255900-1', None, None))
+    self.assertEqual(db.xinfo('logs', 'groups'), len(db.GROUPS))
+    self.assertEqual([(entry['project'], entry['state']) for _, entry in db.xrange('logs')], [(str(sequoia), 'started'), (str(sequoia), 'stopped'), (str(redwood), 'started')])
+
+  def test_totals(self):
+    sequoia, redwood = uuid4(), uuid4()
+    for at, project, state in ((1711255800, sequoia, 'started'), (1711255860, sequoia, 'stopped'), (1711255900, redwood, 'started'), (1711256000, redwood, 'stopped'), (1711256100, sequoia, 'started'), (1711256130, redwood, 'started'), (1711256200, redwood, 'stopped')):
+      db.add('logs', {'project': project, 'state': state, 'id': f'{at}-*'})
+
+    with patch.object(db, 'PAGE_SIZE', 2):
+      self.assertDictEqual(db.totals(), {str(sequoia): 60, str(redwood): 170})
+      self.assertDictEqual(db.totals(start='1711255900-0'), {str(redwood): 170, str(sequoia): 0})
+      self.assertDictEqual(db.totals(end='1711256000'), {str(sequoia): 60, str(redwood): 100})
+      self.assertDictEqual(db.totals(projects={sequoia}), {str(sequoia): 60})
+      self.assertDictEqual(db.totals(projects=set()), {})
+
+  def test_compact(self):
+    sequoia, redwood = uuid4(), uuid4()
+    db.add('logs', {'project': sequoia, 'state': 'started', 'id': '1711255800-0'})
+    with patch.object(db, 'ENCODING', 'compact'):
+      db.add('logs', {'project': sequoia, 'state': 'stopped', 'id': '1711255860-0'})
+      db.log('started', redwood, 1711255900, name='Redwood')
+      db.log('started', sequoia, 1711256000)
+
+    with db.connection() as conn:
+      self.assertEqual(conn.xrange('logs:2024-03', '1711255860', '1711255860')[0][1], {'p': '1', 's': '0'})
+      self.assertEqual(conn.xrange('logs:2024-03', '1711256000', '1711256000'), [('1711256000-0', {'p': '2', 's': '0'}), ('1711256000-1', {'p': '1', 's': '1'})])
+    self.assertEqual(db.get('handles'), {'1': str(sequoia), '2': str(redwood)})
+
+    entries = [(str(sequoia), 'started'), (str(sequoia), 'stopped'), (str(redwood), 'started'), (str(redwood), 'stopped'), (str(sequoia), 'started')]
+    self.assertEqual([(entry['project'], entry['state']) for _, entry in db.xrange('logs')], entries)
+    self.assertEqual([(entry['project'], entry['state']) for _, entry in db.xiter('logs', page_size=2, where={'project': sequoia})], [entries[0], entries[1], entries[4]])
+    self.assertDictEqual(db.totals(), {str(sequoia): 60, str(redwood): 100})
+    self.assertEqual([(log.id, log.state) for log in LogProject.all(matching=redwood)], [(redwood, 'started'), (redwood, 'stopped')])
+    self.assertTrue(Project.last().equiv(sequoia))
+
+    db.log('stopped', sequoia, 1711256100)
+    self.assertEqual(db.xrange('logs', reverse=True, count=1)[0][1], {'project': str(sequoia), 'state': 'stopped'})
+
+  def test_partitions(self):
+    sequoia, redwood = uuid4(), uuid4()
+    for at, project, state in ((1709251140, sequoia, 'started'), (1709251200, sequoia, 'stopped'), (1711929600, redwood, 'started')):
+      db.add('logs', {'project': project, 'state': state, 'id': f'{at}-0'})
+
+    self.assertEqual(db.months('logs'), ['2024-02', '2024-03', '2024-04'])
+    self.assertEqual(db.partitions('logs', '1709251200-0', '1709251200'), ['logs:2024-03'])
+    self.assertEqual(db.partitions('logs', start='1709251200-0'), ['logs:2024-03', 'logs:2024-04'])
+    self.assertEqual(db.partitions('logs', end='1709251200'), ['logs:2024-02', 'logs:2024-03'])
+    self.assertEqual([tid for tid, _ in db.xrange('logs')], ['1709251140-0', '1709251200-0', '1711929600-0'])
+    self.assertEqual([tid for tid, _ in db.xrange('logs', reverse=True, count=2)], ['1711929600-0', '1709251200-0'])
+    self.assertEqual([tid for tid, _ in db.xiter('logs', page_size=1)], ['1709251140-0', '1709251200-0', '1711929600-0'])
+    self.assertEqual(db.xinfo('logs', 'length'), 3)
+    self.assertEqual(db.xinfo('logs', 'last-generated-id'), '1711929600-0')
+    self.assertEqual(db.totals(), {str(sequoia): 60, str(redwood): 0})
+
+    until = datetime.fromtimestamp(1709251200)
+    self.assertEqual([(log.id, log.state) for log in LogProject.all(until=until)], [(sequoia, 'started'), (sequoia, 'stopped')])
+    self.assertEqual([log.id for log in LogProject.all(since=until, until=until)], [sequoia])
+
+    '''Starting stops redwood in the partition of the start, not in redwood's.'''
+    self.assertEqual(db.log('started', sequoia, 1714521600), ('1711929600-0', '1714521600-0', '1714521600-1'))
+    self.assertEqual(db.months('logs'), ['2024-02', '2024-03', '2024-04', '2024-05'])
+    self.assertEqual(db.xinfo('logs', 'groups'), len(db.GROUPS))
+
+    db.rm('logs', '1709251200-0')
+    self.assertEqual(db.xinfo('logs', 'length'), 4)
+
+    version = db.new_version('Testing')
+    self.assertEqual(db.months(f'logs-{version}'), ['2024-02', '2024-03', '2024-04', '2024-05'])
+    self.assertEqual(len(db.xrange(f'logs-{version}')), 4)
+    self.assertEqual(db.shared('logs'), {'logs:2024-02', 'logs:2024-03', 'logs:2024-04'})
+
+    '''The partitions logs still points at outlive the version.'''
+    db.rm(f'logs-{version}')
+    self.assertFalse(db.has(f'logs-{version}'))
+    self.assertEqual(len(db.xrange('logs')), 4)
+    with db.connection() as conn:
+      self.assertEqual(conn.exists('logs:2024-02'), 1)
+      self.assertEqual(conn.exists('logs:2024-05'), 0)
+
+  def test_indexes(self):
+    sequoia, redwood = uuid4(), uuid4()
+    db.log('started', sequoia, 1709251140, name='Sequoia')
+    db.log('started', redwood, 1709251200, name='Redwood')
+    db.log('started', sequoia, 1711929600)
+    db.log('stopped', sequoia, 1711929660)
+
+    self.assertEqual(db.get(db.indexed('logs:2024-03')), {str(sequoia): '1', str(redwood): '1'})
+    with db.connection() as conn:
+      self.assertEqual([sid for partition in db.partitions('logs') for sid, _ in conn.xrange(db.index(partition, redwood))], ['1709251200-1', '1711929600-0'])
+    self.assertEqual([log.when for log in LogProject.all(matching='Redwood')], [datetime.fromtimestamp(1709251200), datetime.fromtimestamp(1711929600)])
+    self.assertEqual([log.state for log in LogProject.all(matching=sequoia, count=3)], ['started', 'stopped', 'started'])
+    self.assertEqual([log.state for log in LogProject.all(matching=sequoia, since=datetime.fromtimestamp(1711929600))], ['started', 'stopped'])
+    self.assertEqual(db.totals(projects={sequoia}), {str(sequoia): 120})
+    self.assertEqual(db.totals(projects={redwood}), {str(redwood): 2678400})
+
+    '''The stop of redwood and the start of sequoia share a second, and only the stop is removed from redwood's index.'''
+    db.rm('logs', '1711929600-0')
+    with db.connection() as conn:
+      self.assertEqual([sid for partition in db.partitions('logs') for sid, _ in conn.xrange(db.index(partition, redwood))], ['1709251200-1'])
+      self.assertEqual(len(conn.xrange(db.index('logs:2024-04', sequoia))), 2)
+    self.assertEqual([log.state for log in LogProject.all(matching=sequoia, since=datetime.fromtimestamp(1711929600))], ['started', 'stopped'])
+
+    '''Automatic sequence numbers differ between a partition and an index, and every removal of a batch is looked up at once.'''
+    for project, state in ((redwood, 'started'), (sequoia, 'started'), (sequoia, 'stopped')):
+      db.add('logs', {'project': project, 'state': state, 'id': '1711930000-*'})
+    with db.trace.budget(4), db.batch():
+      db.rm('logs', '1711930000-0')
+      db.rm('logs', '1711930000-2')
+    with db.connection() as conn:
+      self.assertEqual(conn.xrange(db.index('logs:2024-04', redwood), '1711930000', '1711930000'), [])
+      self.assertEqual([(sid, fields['state']) for sid, fields in conn.xrange(db.index('logs:2024-04', sequoia), '1711930000', '1711930000')], [('1711930000-0', 'started')])
+    self.assertEqual([sid for sid, _ in db.xrange('logs', start='1711930000')], ['1711930000-1'])
+    db.rm('logs', '1711930000-1')
+
+    version = db.new_version('Testing')
+    self.assertEqual(db.catalogued(f'logs-{version}')['2024-03'], 'logs:2024-03')
+    self.assertEqual(len(list(LogProject.all(matching=sequoia, _version=version))), 4)
+
+    '''Only the version still points at the newest partition logs had, so it goes with the version.'''
+    db.rm(f'logs-{version}')
+    with db.connection() as conn:
+      self.assertEqual(conn.exists(db.index('logs:2024-04', sequoia)), 0)
+      self.assertEqual(conn.exists(db.indexed('logs:2024-04')), 0)
+      self.assertEqual(conn.exists(db.indexed('logs:2024-03')), 1)
+    self.assertEqual(len(list(LogProject.all(matching=sequoia))), 4)
+
+  def test_append(self):
+    self.assertEqual(db.append({'project': self.valid_uuid, 'state': 'started', 'id': '1711929600-*'}), ('0-0', '1711929600-0'))
+    self.assertEqual(db.append({'project': self.valid_uuid, 'state': 'stopped', 'id': '1711929600-*'}), ('1711929600-0', '1711929600-1'))
+    self.assertEqual(db.months('logs'), ['2024-04'])
+    self.assertEqual(db.xinfo('logs', 'groups'), len(db.GROUPS))
+    with db.connection() as conn:
+      self.assertEqual([sid for sid, _ in conn.xrange(db.index('logs:2024-04', self.valid_uuid))], ['1711929600-0', '1711929600-1'])
+
+    '''Older than the last entry, so nothing is written.'''
+    self.assertEqual(db.append({'project': self.valid_uuid, 'state': 'started', 'id': '1709251200-*'}), ('1711929600-1', None))
+    self.assertEqual(db.months('logs'), ['2024-04'])
+    with self.assertRaises(InvalidTimeE):
+      LogProject(self.valid_uuid, 'Worn', 'started', '1709251200-*').add()
+
+    LogProject(self.valid_uuid, 'Worn', 'started', '1714521600-*').add()
+    self.assertEqual(db.months('logs'), ['2024-04', '2024-05'])
+    self.assertEqual([log.state for log in LogProject.all(matching=self.valid_uuid)], ['started', 'stopped', 'started'])
+
+  def test_new_version(self):
+    for at, state in ((1709251140, 'started'), (1709251200, 'stopped'), (1711929600, 'started')):
+      db.add('logs', {'project': self.valid_uuid, 'state': state, 'id': f'{at}-0'})
+    version = db.new_version('Testing')
+    self.assertEqual(db.xrange('versions')[0][1], {'reason': 'Testing', 'version': str(version)})
+    self.assertEqual(db.xrange(f'logs-{version}'), db.xrange('logs'))
+
+    '''logs goes on in a copy of its newest partition, and the version keeps the rest with it.'''
+    self.assertEqual(db.catalogued('logs')['2024-03'], db.catalogued(f'logs-{version}')['2024-03'])
+    self.assertNotEqual(db.catalogued('logs')['2024-04'], db.catalogued(f'logs-{version}')['2024-04'])
+    db.add('logs', {'project': self.valid_uuid, 'state': 'stopped', 'id': '1711929660-0'})
+    self.assertEqual(len(db.xrange('logs')), 4)
+    self.assertEqual(len(db.xrange(f'logs-{version}')), 3)
+
+    '''Retiming rewrites only the months the entry moves between.'''
+    retimed = db.new_version('Retimed', {1709251200: 1709251180})
+    self.assertEqual(db.months('logs'), ['2024-02', '2024-04'])
+    self.assertEqual([sid for sid, _ in db.xrange('logs')], ['1709251140-0', '1709251180-0', '1711929600-0', '1711929660-0'])
+    self.assertEqual([sid for sid, _ in db.xrange(f'logs-{retimed}')], ['1709251140-0', '1709251200-0', '1711929600-0', '1711929660-0'])
+    self.assertEqual(len(db.xrange(f'logs-{version}')), 3)
+    self.assertEqual([log.when for log in LogProject.all(matching=self.valid_uuid)][1], datetime.fromtimestamp(1709251180))
+    self.assertEqual(db.totals(), {str(self.valid_uuid): 100})
+    self.assertEqual(db.totals(f'logs-{retimed}'), {str(self.valid_uuid): 120})
+
+    LogProject.edit_log_time(datetime.fromtimestamp(1711929660), datetime.fromtimestamp(1711929700), 'Late')
+    self.assertEqual(db.xrange('logs')[-1][0], '1711929700-0')
+    with self.assertRaises(InvalidTimeE):
+      LogProject.edit_log_time(datetime.fromtimestamp(1711929700), datetime.fromtimestamp(1711929500), 'Early')
+    self.assertEqual(len(db.xrange('versions')), 3)
+
+  def test_projects(self):
+    started = time_traveled(minutes=30)
+    project = Project.make('Sequoia')
+    project.start(started)
+    self.assertTrue(Project.last().is_running())
+    self.assertTrue(Project.last().equiv(project))
+
+    other = Project.make('Redwood')
+    other.start(time_traveled(minutes=20))
+    Project.last().stop(time_traveled(minutes=10))
+
+    logs = list(LogProject.all())
+    self.assertEqual([(log.name, log.state) for log in logs], [('Sequoia', 'started'), ('Sequoia', 'stopped'), ('Redwood', 'started'), ('Redwood', 'stopped')])
+    self.assertEqual([log.name for log in LogProject.all(matching='redwood')], ['Redwood', 'Redwood'])
+    self.assertEqual(len(list(LogProject.all(since=time_traveled(minutes=15)))), 1)
+    self.assertEqual([p.name for p in Project.all()], ['Redwood', 'Sequoia'])
+
+    with self.assertRaises(InvalidTimeE):
+      project.start(started)
+
+    other.remove()
+    self.assertEqual([log.name for log in LogProject.all()], ['Sequoia', 'Sequoia'])
+    self.assertEqual([p.name for p in Project.all()], ['Sequoia'])
+
+if __name__ == '__main__':
+  unittest.main(buffer=True)
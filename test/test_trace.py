@@ -0,0 +1,44 @@
+from test import *
+from lib import db
+from lib.db import trace
+
+class TestTrace(TestDbBase):
+  def test_untraced(self):
+    self.assertNotIsInstance(db.connection(), trace.Traced)
+    with trace.budget(10):
+      self.assertIsInstance(db.connection(), trace.Traced)
+    self.assertNotIsInstance(db.connection(), trace.Traced)
+
+  def test_calls(self):
+    with trace.budget(2) as calls:
+      db.add('projects', {'sequoia': self.valid_uuid, str(self.valid_uuid): 'Sequoia'})
+      self.assertEqual(db.get('projects', 'sequoia'), str(self.valid_uuid))
+
+    self.assertEqual([(op, key) for op, key, _, _ in calls], [('EXEC', '2 commands'), ('EXEC', '3 commands')])
+    self.assertEqual(calls[1][3], len(f'1sequoia{self.valid_uuid}{self.valid_uuid}Sequoia'))
+    self.assertEqual(trace.calls, [])
+
+  def test_budget(self):
+    with self.assertRaisesRegex(AssertionError, r'2 round trips should be at most 1:\n2 round trips in .*\n  XREVRANGE +2 calls'):
+      with trace.budget(1):
+        db.xrange('versions', reverse=True)
+        db.xrange('versions', reverse=True)
+
+  def test_script(self):
+    '''A script runs on the server, so one emulated in Python is still one round trip.'''
+    with trace.budget(1) as calls:
+      self.assertEqual(db.backend().script('handle')(db.connection(), ['handles', 'handles:ids', 'handles:next', db.CACHED['handles']], [self.valid_uuid]), '1')
+    self.assertEqual([op for op, _, _, _ in calls], ['EVALSHA'])
+
+  def test_summary(self):
+    with patch.object(trace, 'calls', [('GET', 'begun', 0.002, 10), ('HGETALL', 'projects', 0.001, 100), ('GET', 'begun', 0.003, 10)]):
+      self.assertEqual(trace.summary(slowest=2), '''3 round trips in 6.00ms
+  GET                2 calls      5.00ms        20 bytes
+  HGETALL            1 calls      1.00ms       100 bytes
+slowest:
+       3.00ms GET begun (10 bytes)
+       2.00ms GET begun (10 bytes)
+''')
+
+if __name__ == '__main__':
+  unittest.main(buffer=True)
@@ -0,0 +1,88 @@
+from test import *
+from lib import db
+from lib.db import versions
+from lib.project import Project, LogProject
+
+class TestVersions(TestDbBase):
+  def setUp(self):
+    super().setUp()
+    '''Feb 29th, Mar 1st and Apr 1st 2024 UTC.'''
+    for at, state in ((1709251000, 'started'), (1709251100, 'stopped'), (1709251200, 'started'), (1711929600, 'stopped')):
+      db.add('logs', {'project': self.valid_uuid, 'state': state, 'id': f'{at}-0'})
+
+  def partitions(self) -> set:
+    return set(key for key in db.backend().data if db.declared(key) == 'stream' and key.count(':') == 1 and key != 'versions')
+
+  def test_stats(self):
+    version = db.new_version('Testing')
+    stats = versions.stats()
+    self.assertEqual([stat['key'] for stat in stats], ['logs', f'logs-{version}'])
+    self.assertEqual([stat['entries'] for stat in stats], [4, 4])
+    self.assertEqual([stat['partitions'] for stat in stats], [3, 3])
+    self.assertEqual([stat['shared'] for stat in stats], [2, 2])
+    self.assertIsNone(stats[0]['created'])
+    self.assertEqual(stats[1]['created'], db.xrange('versions')[0][0])
+
+    '''Only the newest month of each is its own.'''
+    with db.connection() as conn:
+      self.assertEqual(stats[1]['bytes'], conn.memory_usage('logs:2024-04') + conn.memory_usage(db.index('logs:2024-04', self.valid_uuid)))
+    self.assertGreater(stats[0]['bytes'], 0)
+
+  def test_gc(self):
+    first = db.new_version('First', {1709251100: 1709251150})
+    second = db.new_version('Second')
+    third = db.new_version('Third')
+    before = self.partitions()
+
+    self.assertEqual(versions.gc(keep=1), (2, 3))
+    self.assertEqual([entry['version'] for _, entry in db.xrange('versions')], [str(third)])
+    self.assertFalse(db.has(f'logs-{first}'))
+    self.assertFalse(db.has(f'logs-{second}'))
+    with db.connection() as conn:
+      self.assertEqual(conn.exists(db.index('logs:2024-04', self.valid_uuid)), 0)
+      self.assertEqual(conn.exists(db.index(f'logs@{second}:2024-04', self.valid_uuid)), 1)
+    self.assertEqual(before - self.partitions(), {'logs:2024-02', 'logs:2024-04', f'logs@{first}:2024-04'})
+
+    '''What is left still reads the same.'''
+    self.assertEqual([sid for sid, _ in db.xrange(f'logs-{third}')], ['1709251000-0', '1709251150-0', '1709251200-0', '1711929600-0'])
+    self.assertEqual(len(list(LogProject.all(matching=self.valid_uuid))), 4)
+
+    self.assertEqual(versions.gc(before=1), (0, 0))
+    self.assertEqual(versions.gc(keep=0, batch_size=1), (1, 1))
+    self.assertEqual(versions.stats()[0]['shared'], 0)
+    with self.assertRaises(AssertionError):
+      versions.gc()
+
+  def test_rm_shared(self):
+    '''Removing a project reads which partitions are shared once, and copies each shared month once.'''
+    version = db.new_version('Testing')
+    with db.trace.budget(100) as calls:
+      Project(self.valid_uuid, 'Sequoia').remove()
+    self.assertEqual(len([call for call in calls if call[1] == 'versions']), 1)
+
+    self.assertEqual(db.xrange('logs'), [])
+    self.assertEqual(len(db.xrange(f'logs-{version}')), 4)
+    self.assertEqual(sorted(db.catalogued('logs')), ['2024-02', '2024-04'])
+    self.assertEqual(len(self.partitions()), 5)
+
+  def test_compact(self):
+    '''A version written before partitions were shared, with a copy of its own of every month.'''
+    legacy = uuid4()
+    db.add('versions', {'reason': 'Testing', 'version': legacy, 'id': '*'})
+    with db.connection() as conn:
+      for partition in db.partitions('logs'):
+        _month = partition.split(':')[1]
+        for sid, fields in conn.xrange(partition):
+          conn.xadd(f'logs-{legacy}:{_month}', fields, id=sid)
+        conn.hset(db.catalog(f'logs-{legacy}'), _month, '1')
+    db.rm('logs', '1709251200-0')
+
+    '''February is the same in both, March lost an entry, and April is the one logs appends to.'''
+    self.assertEqual(versions.gc(keep=1), (0, 1))
+    self.assertEqual(db.catalogued(f'logs-{legacy}'), {'2024-02': 'logs:2024-02', '2024-03': f'logs-{legacy}:2024-03', '2024-04': f'logs-{legacy}:2024-04'})
+    self.assertEqual(len(db.xrange(f'logs-{legacy}')), 4)
+    with db.connection() as conn:
+      self.assertEqual(conn.exists(f'logs-{legacy}:2024-02'), 0)
+
+if __name__ == '__main__':
+  unittest.main(buffer=True)
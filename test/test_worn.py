@@ -0,0 +1,154 @@
+from test import *
+import tempfile
+from lib import db
+from lib.db.memory_backend import MemoryBackend
+from test.test_journal import Refused
+import worn
+
+class TestWorn(TestDbBase):
+  '''Runs whole commands through worn.main against the in-memory backend.'''
+  def worn(self, *argv) -> str:
+    with patch('sys.stdout', new_callable=StringIO) as out, patch('sys.stderr', new_callable=StringIO):
+      with self.assertRaises(SystemExit) as exited:
+        worn.main(['-C', *argv])
+    self.assertEqual(exited.exception.code, worn.OK)
+    return out.getvalue()
+
+  def test_start_stop(self):
+    self.worn('start', '-a', f'{time_traveled(minutes=30):%F %T}', 'Sequoia')
+    self.assertIn('Sequoia', self.worn('show', 'last'))
+    self.assertIn('currently running', self.worn('show', 'projects'))
+
+    self.worn('stop', '-a', f'{time_traveled(minutes=10):%F %T}')
+    self.assertNotIn('currently running', self.worn('show', 'projects'))
+
+    logs = self.worn('show', 'logs').splitlines()
+    self.assertEqual(len(logs), 2)
+    self.assertIn('started', logs[0])
+    self.assertIn('stopped', logs[1])
+    self.assertIn('Sequoia', self.worn('report'))
+
+  def test_round_trips(self):
+    '''Every command reads the last log entry once or twice, not once per project or per entry.'''
+    with db.trace.budget(4):
+      self.worn('start', '-a', f'{time_traveled(minutes=30):%F %T}', 'Sequoia')
+    with db.trace.budget(4):
+      self.worn('start', '-a', f'{time_traveled(minutes=20):%F %T}', 'Redwood')
+    with db.trace.budget(5):
+      self.worn('stop', '-a', f'{time_traveled(minutes=10):%F %T}')
+    with db.trace.budget(4):
+      self.worn('show', 'projects')
+    with db.trace.budget(3):
+      self.worn('show', 'logs')
+    with db.trace.budget(5):
+      self.worn('report')
+
+  def test_trace(self):
+    with patch.object(db.trace, 'enabled', False), patch('sys.stderr', new_callable=StringIO) as err:
+      self.worn('--trace', 'show', 'projects')
+      db.trace.report()
+    self.assertRegex(err.getvalue(), r'^\d+ round trips in ')
+    db.trace.reset()
+
+  def test_archive(self):
+    self.worn('start', '-a', f'{time_traveled(minutes=30):%F %T}', 'Sequoia')
+    self.worn('stop', '-a', f'{time_traveled(minutes=20):%F %T}')
+    with tempfile.TemporaryDirectory() as archived, patch.object(db, 'ARCHIVE', archived):
+      self.assertIn('Archived 2 log entries', self.worn('archive', '-b', f'{time_traveled(minutes=10):%F %T}'))
+      self.assertEqual(len(self.worn('show', 'logs').splitlines()), 2)
+      self.assertIn('Sequoia', self.worn('report'))
+
+  def test_migrate(self):
+    db.add('projects', {'sequoia': self.valid_uuid, self.valid_uuid: 'Sequoia'})
+    with patch('sys.stderr', new_callable=StringIO) as err, self.assertRaises(SystemExit) as exited:
+      worn.main(['-C', 'show', 'projects'])
+    self.assertEqual(exited.exception.code, worn.ERR)
+    self.assertIn('worn migrate', err.getvalue())
+
+    self.assertIn(f'schema version {db.migrations.LATEST}', self.worn('migrate'))
+    self.assertEqual(self.worn('show', 'projects'), f'{self.valid_uuid}: Sequoia\n')
+
+  def test_rename(self):
+    self.worn('start', '-a', f'{time_traveled(minutes=30):%F %T}', 'Sequoia')
+    project_id = db.get('projects:names', 'sequoia')
+    self.worn('rename', 'Sequoia', '-t', 'Redwood')
+    self.assertIn(f'{project_id}: Redwood', self.worn('show', 'projects'))
+    self.assertNotIn('Sequoia', self.worn('show', 'projects'))
+
+  def test_rm(self):
+    self.worn('start', '-a', f'{time_traveled(minutes=30):%F %T}', 'Sequoia')
+    self.worn('rm', 'Sequoia')
+    self.assertEqual(self.worn('show', 'projects'), '')
+    self.assertEqual(self.worn('show', 'logs'), 'There are no logs to display.\n')
+
+  def test_show_id(self):
+    self.worn('start', '-a', f'{time_traveled(minutes=30):%F %T}', 'Sequoia')
+    self.worn('start', '-a', f'{time_traveled(minutes=20):%F %T}', 'Redwood')
+    ids = [db.get('projects:names', 'sequoia'), db.get('projects:names', 'redwood')]
+    self.assertEqual(self.worn('show', 'id', *ids), f'{ids[0]} Sequoia\n{ids[1]} Redwood\n')
+
+  def test_edit(self):
+    self.worn('start', '-a', f'{time_traveled(minutes=30):%F %T}', 'Sequoia')
+    self.worn('edit', 'last', '-t', f'{time_traveled(minutes=40):%F %T}', '-r', 'Started', 'earlier')
+    self.assertIn("reason='Started earlier'", self.worn('show', 'versions'))
+    self.assertIn(f'{time_traveled(minutes=40):%F %T}', self.worn('show', 'logs', '-t'))
+
+  def test_versions(self):
+    self.worn('start', '-a', f'{time_traveled(minutes=30):%F %T}', 'Sequoia')
+    self.worn('edit', 'last', '-t', f'{time_traveled(minutes=40):%F %T}', '-r', 'Started', 'earlier')
+    self.worn('edit', 'last', '-t', f'{time_traveled(minutes=50):%F %T}', '-r', 'Even', 'earlier')
+    stats = self.worn('versions', 'stats').splitlines()
+    self.assertEqual(len(stats), 3)
+    self.assertRegex(stats[0], r'^logs entries=1 partitions=1 shared=0 bytes=\d+$')
+
+    self.assertEqual(self.worn('versions', 'gc', '--keep', '1'), 'Dropped 1 log versions and 1 partitions.\n')
+    self.assertEqual(len(self.worn('show', 'versions').splitlines()), 1)
+    self.assertIn(f'{time_traveled(minutes=50):%F %T}', self.worn('show', 'logs', '-t'))
+
+    with patch('sys.stderr', new_callable=StringIO) as err, self.assertRaises(SystemExit) as exited:
+      worn.main(['-C', 'versions', 'gc'])
+    self.assertEqual(exited.exception.code, worn.ERR)
+    self.assertIn('--keep', err.getvalue())
+
+  def test_import(self):
+    with tempfile.NamedTemporaryFile('w', suffix='.csv') as f:
+      f.write(f'at,project,state\n{time_traveled(minutes=50):%F %T},Sequoia,started\n{time_traveled(minutes=40):%F %T},Sequoia,stopped\n')
+      f.flush()
+      self.assertEqual(self.worn('import', f.name), 'Imported 2 log entries.\n')
+      raw = self.worn('show', 'logs', '--raw')
+
+    self.assertIn('Sequoia', self.worn('show', 'projects'))
+    db.backend().flush()
+    db.invalidate()
+    with patch('sys.stdin', StringIO(raw)):
+      self.assertEqual(self.worn('import'), 'Imported 2 log entries.\n')
+    self.assertEqual(self.worn('show', 'logs', '--raw'), raw)
+    self.assertIn('Imported', self.worn('report'))
+
+  def test_exit_handlers(self):
+    '''Only running worn.py registers them, so calling main over and over doesn't pile them up.'''
+    with patch('atexit.register') as register:
+      self.worn('show', 'projects')
+    register.assert_not_called()
+
+  def test_server_down(self):
+    with tempfile.TemporaryDirectory() as tmp, patch.multiple(db, JOURNAL=os.path.join(tmp, 'journal.ndjson'), JOURNAL_MODE='fallback'), \
+         patch.multiple(db.journal, offline=False, _remembered=None):
+      self.worn('start', '-a', f'{time_traveled(minutes=30):%F %T}', 'Sequoia')
+      self.assertIn('Sequoia', self.worn('show', 'projects'))
+
+      db.invalidate()
+      with patch.object(MemoryBackend, 'connection', return_value=Refused()):
+        self.worn('stop', '-a', f'{time_traveled(minutes=20):%F %T}')
+        self.worn('start', '-a', f'{time_traveled(minutes=10):%F %T}', 'Sequoia')
+      self.assertEqual(len(db.journal.records()), 2)
+      self.assertEqual(db.journal.replay(), 2)
+
+    logs = self.worn('show', 'logs').splitlines()
+    self.assertEqual(len(logs), 3)
+    for log, state in zip(logs, ('started', 'stopped', 'started')):
+      self.assertIn(state, log)
+      self.assertIn('Sequoia', log)
+
+if __name__ == '__main__':
+  unittest.main(buffer=True)
@@ -1,6 +1,8 @@
 #!bin/python3
 
 import sys
+import atexit
+import asyncio
 from lib import debug, db, parse_timestamp
 from lib.project import Project, LogProject, FauxProject
 from lib.report import Report
@@ -18,8 +20,18 @@ class Prompt:
 ''',
   CONFIRM = '''No project found matching the name or id: {args.project!r} at {args.at:%a %F %T}. Are you sure you want to create a new projected named {args.project!r}? (y|N)'''
 
-def main() -> None:
-  parg, sharg, earg, rarg, p = parse_args()
+def main(argv:list=None) -> None:
+  parg, sharg, earg, rarg, varg, p = parse_args(sys.argv[1:] if argv is None else argv)
+  if p.trace:
+    db.trace.enable()
+
+  try:
+    if p.action not in ('migrate', 'help', 'gen') and len(db.migrations.pending()) > 0:
+      debug(f'The database is at schema version {db.migrations.version()}, but this version of worn needs {db.migrations.LATEST}. Please run "worn migrate" first.')
+      sys.exit(ERR)
+  except db.backend().ConnectionError as e:
+    '''The check waits for the server, like the writes journaled meanwhile do.'''
+    db.journal.unreachable(e)
 
   if p.no_color:
     from lib.nocolors import colors
@@ -80,6 +92,34 @@ def main() -> None:
 
         f = getattr(list(projects)[num-1], p.action)
       f(p.at)
+    case Namespace(action='migrate'):
+      print(f'The database is at schema version {db.migrations.migrate(p.batch_size)}.')
+    case Namespace(action='archive', before=before):
+      print(f'Archived {db.archive.archive(int(before.timestamp()))} log entries to {db.archive.directory("logs")}.')
+    case Namespace(action='import', file=files):
+      added, skipped = db.bulk.load((entry for f in files for entry in db.bulk.read(f, p.format)), p.batch_size)
+      print(f'Imported {added} log entries.')
+      if skipped > 0:
+        print(f'Skipped {skipped} log entries older than the last one logged in their month.')
+    case Namespace(action='versions', operation='gc') if p.keep is None and p.older_than is None:
+      debug('Keeping every version. Please retry with a -k|--keep and/or a -o|--older-than argument.')
+      sys.exit(ERR)
+    case Namespace(action='versions', operation='gc', keep=keep, older_than=older_than):
+      versions, partitions = db.versions.gc(keep, None if older_than is None else int(older_than.timestamp()), p.batch_size)
+      print(f'Dropped {versions} log versions and {partitions} partitions.')
+    case Namespace(action='versions', operation='stats'):
+      for stat in db.versions.stats():
+        created = '' if stat['created'] is None else f" created='{parse_timestamp(stat['created']):%a %F %T}'"
+        print(f"{stat['key']}{created} entries={stat['entries']} partitions={stat['partitions']} shared={stat['shared']} bytes={stat['bytes']}")
+    case Namespace(action='versions'):
+      varg.print_help()
+    case Namespace(action='journal', replay=True):
+      print(f'Replayed {db.journal.replay()} journaled writes.')
+      if db.journal.pending():
+        print(f'{len(db.journal.records())} journaled writes are still waiting for the server.')
+    case Namespace(action='journal'):
+      for record in db.journal.records():
+        print(' '.join(f'{op}{tuple(args)}' for op, args, _ in record))
     case Namespace(action='help', kind='dates'):
       from lib import explain_dates
       print(explain_dates())
@@ -95,8 +135,8 @@ def main() -> None:
       else:
         print(f'{Project.last():last}')
     case Namespace(action='show', display='id'):
-      for id in p.UUID:
-        print(f'{id} {Project.make(id).name}')
+      for project in asyncio.run(Project.aload(*p.UUID)):
+        print(f'{project.id} {project.name}')
     case Namespace(action='show', display='projects'):
       for project in Project.all():
         fmt = f'{project.id}: {project.name}'
@@ -113,7 +153,7 @@ def main() -> None:
         else:
           key = f'logs-{p.version}'
 
-      if not db.has(key) or len(logs := db.xrange(key, count=1, reverse=True)) == 0:
+      if (not db.has(key) or len(db.xrange(key, count=1, reverse=True)) == 0) and len(db.archive.segments(key)) == 0:
         print('There are no logs to display.')
       else:
         if p.raw:
@@ -131,7 +171,7 @@ def main() -> None:
       fmt = "created='{created:%a %F %T}' version={version} reason={reason!r}"
       if p.timestamp:
         fmt = '{timeid} ' + fmt
-      for (timeid, record) in db.xrange('versions'):
+      for (timeid, record) in db.xiter('versions'):
         print(fmt.format(timeid=timeid, created=parse_timestamp(timeid), **record))
     case Namespace(action='show'):
       sharg.print_help()
@@ -171,7 +211,10 @@ def main() -> None:
       sys.exit(res)
 
     case Namespace(action='report', project=project, since=since,   ticket=None,   mailto=None):
-      report = Report(LogProject.all(matching=project, since=since), since, p.largest_scale, include_all=p.include_all, show_header=(not p.no_header))
+      if p.totals:
+        report = Report.totals(matching=project, since=since, scale=p.largest_scale, include_all=p.include_all, show_header=(not p.no_header))
+      else:
+        report = Report(LogProject.all(matching=project, since=since), since, p.largest_scale, include_all=p.include_all, show_header=(not p.no_header))
       print(f'{report:{p.format}}')
 
     case Namespace(action='report'):
@@ -181,4 +224,7 @@ def main() -> None:
   sys.exit(OK)
 
 if __name__ == '__main__':
+  atexit.register(db.trace.report)
+  atexit.register(db.persist)
+  atexit.register(db.journal.drain)
   main()